@@ -102,6 +102,23 @@ class Action(object):
 		return self
 	
 	
+	def compile(self, event):
+		"""
+		Returns callable that takes same arguments and does same thing as
+		method named 'event' ('button_press', 'whole', 'trigger', ...),
+		but with everything that can't change while profile is used, like
+		speed, haptic feedback settings or emulated axis, resolved ahead
+		and with child actions compiled as well.
+		
+		Called after compress(). Returned callable is valid only until
+		action or any of its children is changed.
+		
+		By default, returns bound method, so action that depends on state
+		of mapper is still interpreted as usual.
+		"""
+		return getattr(self, event)
+	
+	
 	def set_haptic(self, hapticdata):
 		"""
 		Set haptic feedback settings for this action, if supported.
@@ -282,6 +299,26 @@ class AxisAction(Action):
 		p = int((p * (self.max - self.min)) + self.min)
 		mapper.gamepad.axisEvent(self.id, clamp_axis(self.id, p))
 		mapper.syn_list.add(mapper.gamepad)
+	
+	
+	def compile(self, event):
+		if event in ("axis", "pad", "trigger"):
+			# Same computation as in axis() and trigger(), with constants
+			# taken out and clamp_axis resolved for emulated axis
+			id, (lo, hi) = self.id, axis_range(self.id)
+			low, scale = self.min, self.max - self.min
+			if event == "trigger":
+				start, size = TRIGGER_MIN, TRIGGER_MAX - TRIGGER_MIN
+			else:
+				start, size = STICK_PAD_MIN, STICK_PAD_MAX - STICK_PAD_MIN
+			
+			def axis(mapper, position, *a):
+				p = int((float(position - start) / size * scale) + low)
+				gamepad = mapper.gamepad
+				gamepad.axisEvent(id, int(max(lo, min(hi, p))))
+				mapper.syn_list.add(gamepad)
+			return axis
+		return Action.compile(self, event)
 
 
 class RAxisAction(AxisAction):
@@ -334,6 +371,13 @@ class HatRightAction(HatAction):
 
 class MouseAction(HapticEnabledAction):
 	COMMAND = "mouse"
+	# Indexes of mouse_dq and trackball mode used by pad() for each axis
+	PAD_AXES = {
+		Rels.REL_X		: (0, 0),
+		Rels.REL_Y		: (1, 0),
+		Rels.REL_HWHEEL	: (2, 1),
+		Rels.REL_WHEEL	: (3, 1),
+	}
 	
 	def __init__(self, axis, speed=None):
 		HapticEnabledAction.__init__(self, axis, *strip_none(speed))
@@ -364,13 +408,13 @@ class MouseAction(HapticEnabledAction):
 	def button_press(self, mapper):
 		# This is generaly bad idea...
 		if self.mouse_axis == Rels.REL_X:
-			mapper.mouse.moveEvent(1000 * self.speed[0], 0, False)
+			mapper.mouse.moveEvent(1000 * self.speed[0], 0, False, mapper.now)
 			mapper.syn_list.add(mapper.mouse)
 		elif self.mouse_axis == Rels.REL_Y:
-			mapper.mouse.moveEvent(0, 1000 * self.speed[1], False)
+			mapper.mouse.moveEvent(0, 1000 * self.speed[1], False, mapper.now)
 			mapper.syn_list.add(mapper.mouse)
 		elif self.mouse_axis == Rels.REL_WHEEL:
-			mapper.mouse.scrollEvent(0, 2000 * self.speed[0], False)
+			mapper.mouse.scrollEvent(0, 2000 * self.speed[0], False, mapper.now)
 			mapper.syn_list.add(mapper.mouse)
 	
 	
@@ -383,22 +427,22 @@ class MouseAction(HapticEnabledAction):
 		if self.mouse_axis == Rels.REL_X:
 			# This is generaly bad idea for stick...
 			p = position * self.speed[0] / 100
-			mapper.mouse.moveEvent(p, 0, False)
+			mapper.mouse.moveEvent(p, 0, False, mapper.now)
 			mapper.syn_list.add(mapper.mouse)
 		elif self.mouse_axis == Rels.REL_Y:
 			# ... this as well...
 			p = position * self.speed[1] / 100
-			mapper.mouse.moveEvent(0, -p, False)
+			mapper.mouse.moveEvent(0, -p, False, mapper.now)
 			mapper.syn_list.add(mapper.mouse)
 		elif self.mouse_axis == Rels.REL_WHEEL:
 			# ... but this should kinda work
 			p = position * self.speed[0] / 100
-			mapper.mouse.scrollEvent(0, p * self.speed * 2.0, False)
+			mapper.mouse.scrollEvent(0, p * self.speed * 2.0, False, mapper.now)
 			mapper.syn_list.add(mapper.mouse)
 		elif self.mouse_axis == Rels.REL_HWHEEL:
 			# and this as well
 			p = position * self.speed[1] / 100
-			mapper.mouse.scrollEvent(p * self.speed * 2.0, 0, False)
+			mapper.mouse.scrollEvent(p * self.speed * 2.0, 0, False, mapper.now)
 			mapper.syn_list.add(mapper.mouse)
 		mapper.force_event.add(FE_STICK)
 	
@@ -438,7 +482,7 @@ class MouseAction(HapticEnabledAction):
 	
 	
 	def whole(self, mapper, x, y, what):
-		mapper.mouse.moveEvent(x * self.speed[0] * 0.01, y * self.speed[1] * -0.01, False)
+		mapper.mouse.moveEvent(x * self.speed[0] * 0.01, y * self.speed[1] * -0.01, False, mapper.now)
 		mapper.syn_list.add(mapper.mouse)
 		if what == STICK:
 			mapper.force_event.add(FE_STICK)
@@ -446,10 +490,49 @@ class MouseAction(HapticEnabledAction):
 	
 	def gyro(self, mapper, pitch, yaw, roll, *a):
 		if self.mouse_axis == YAW:
-			mapper.mouse.moveEvent(yaw * -self.speed[0], pitch * -self.speed[1], False)
+			mapper.mouse.moveEvent(yaw * -self.speed[0], pitch * -self.speed[1], False, mapper.now)
 		else:
-			mapper.mouse.moveEvent(roll * -self.speed[0], pitch * -self.speed[1], False)
+			mapper.mouse.moveEvent(roll * -self.speed[0], pitch * -self.speed[1], False, mapper.now)
 		mapper.syn_list.add(mapper.mouse)
+	
+	
+	def compile(self, event):
+		sx, sy = self.speed
+		if event == "whole":
+			def whole(mapper, x, y, what):
+				mouse = mapper.mouse
+				mouse.moveEvent(x * sx * 0.01, y * sy * -0.01, False, mapper.now)
+				mapper.syn_list.add(mouse)
+				if what == STICK:
+					mapper.force_event.add(FE_STICK)
+			return whole
+		elif event == "pad" and self.mouse_axis in MouseAction.PAD_AXES:
+			axis, tb = MouseAction.PAD_AXES[self.mouse_axis]
+			speed = -sx if axis in (0, 2) else -sy
+			haptic = self.haptic
+			
+			def pad(mapper, position, what):
+				if mapper.is_touched(what):
+					if not mapper.was_touched(what):
+						# Pad was just pressed
+						mapper.do_trackball(tb, True)
+					mapper.mouse_dq_add(axis, position, speed, haptic)
+					mapper.force_event.add(FE_PAD)
+				elif mapper.was_touched(what):
+					# Pad was just released
+					mapper.do_trackball(tb, False)
+					mapper.mouse_dq_clear(axis)
+			return pad
+		elif event == "gyro":
+			use_yaw = self.mouse_axis == YAW
+			sx, sy = -sx, -sy
+			
+			def gyro(mapper, pitch, yaw, roll, *a):
+				mouse = mapper.mouse
+				mouse.moveEvent((yaw if use_yaw else roll) * sx, pitch * sy, False, mapper.now)
+				mapper.syn_list.add(mouse)
+			return gyro
+		return HapticEnabledAction.compile(self, event)
 
 
 class GyroAction(Action):
@@ -698,6 +781,31 @@ class ButtonAction(HapticEnabledAction):
 		ButtonAction._button_release(mapper, self.button)
 	
 	
+	def compile(self, event):
+		if event in ("button_press", "button_release"):
+			# Device that emits button is decided only once
+			button, haptic = self.button, self.haptic
+			value = 1 if event == "button_press" else 0
+			if button in MOUSE_BUTTONS or button in GAMEPAD_BUTTONS:
+				device = "mouse" if button in MOUSE_BUTTONS else "gamepad"
+				
+				def handler(mapper):
+					dev = getattr(mapper, device)
+					dev.keyEvent(button, value)
+					mapper.syn_list.add(dev)
+					if value and haptic:
+						mapper.send_feedback(haptic)
+			else:
+				list_name = "keypress_list" if value else "keyrelease_list"
+				
+				def handler(mapper):
+					getattr(mapper, list_name).append(button)
+					if value and haptic:
+						mapper.send_feedback(haptic)
+			return handler
+		return HapticEnabledAction.compile(self, event)
+	
+	
 	def axis(self, mapper, position, what):
 		# Choses which key or button should be pressed or released based on
 		# current stick position.
@@ -847,6 +955,14 @@ class MultiAction(Action):
 		for a in self.actions: a.trigger(*p)
 	
 	
+	def compile(self, event):
+		handlers = tuple([ a.compile(event) for a in self.actions ])
+		
+		def handler(*p):
+			for h in handlers: h(*p)
+		return handler
+	
+	
 	def to_string(self, multiline=False, pad=0):
 		return (" " * pad) + " and ".join([ x.to_string() for x in self.actions ])
 	
@@ -1034,6 +1150,43 @@ class XYAction(HapticEnabledAction):
 		self.y.pad(mapper, sci.lpad_y, what)
 	
 	
+	def compile(self, event):
+		if event != "whole":
+			return HapticEnabledAction.compile(self, event)
+		xaxis, yaxis = self.x.compile("axis"), self.y.compile("axis")
+		xpad, ypad = self.x.compile("pad"), self.y.compile("pad")
+		if not self.haptic:
+			def whole(mapper, x, y, what):
+				if what in (LEFT, RIGHT):
+					xpad(mapper, x, what)
+					ypad(mapper, y, what)
+				else:
+					xaxis(mapper, x, what)
+					yaxis(mapper, y, what)
+			return whole
+		
+		haptic, big_click = self.haptic, self.big_click
+		frequency, close = haptic.frequency, STICK_PAD_MAX * 2 / 3
+		
+		def whole(mapper, x, y, what):
+			# Same as feedback in whole() above
+			distance = sqrt(x*x + y*y)
+			self._travelled += abs(self._old_distance - distance)
+			if (distance > close) != (self._old_distance > close):
+				mapper.send_feedback(big_click)
+			elif self._travelled > frequency:
+				self._travelled = 0
+				mapper.send_feedback(haptic)
+			self._old_distance = distance
+			if what in (LEFT, RIGHT):
+				xpad(mapper, x, what)
+				ypad(mapper, y, what)
+			else:
+				xaxis(mapper, x, what)
+				yaxis(mapper, y, what)
+		return whole
+	
+	
 	def describe(self, context):
 		if self.name: return self.name
 		rv = []
@@ -1125,16 +1278,22 @@ class NoAction(Action):
 	__repr__ = __str__
 
 
-def clamp_axis(id, value):
-	""" Returns value clamped between min/max allowed for axis """
+def axis_range(id):
+	""" Returns (min, max) tuple of values allowed for axis """
 	if id in (Axes.ABS_Z, Axes.ABS_RZ):
 		# Triggers
-		return int(max(TRIGGER_MIN, min(TRIGGER_MAX, value)))
+		return TRIGGER_MIN, TRIGGER_MAX
 	if id in (Axes.ABS_HAT0X, Axes.ABS_HAT0Y):
 		# DPAD
-		return int(max(-1, min(1, value)))
+		return -1, 1
 	# Everything else
-	return int(max(STICK_PAD_MIN, min(STICK_PAD_MAX, value)))
+	return STICK_PAD_MIN, STICK_PAD_MAX
+
+
+def clamp_axis(id, value):
+	""" Returns value clamped between min/max allowed for axis """
+	lo, hi = axis_range(id)
+	return int(max(lo, min(hi, value)))
 
 
 # Generate dict of { 'actionname' : ActionClass } for later use
@@ -25,6 +25,7 @@
 
 import ast
 import os
+import json
 import shlex
 from collections import OrderedDict
 import operator as op
@@ -74,11 +75,20 @@ def eval_expr(expr):
 	return _eval(ast.parse(expr, mode='eval').body)
 
 
-def defines(base, include):
+# Increase when format of cache file or output of defines() changes
+CACHE_VERSION = 1
 
-	""" Extract #define from base/include following #includes """
 
-	parsed = set()
+def defines(base, include, parsed=None):
+
+	""" Extract #define from base/include following #includes
+
+	If 'parsed' set is provided, it's filled with names of all
+	files read while extracting.
+	"""
+
+	if parsed is None:
+		parsed = set()
 	fname = os.path.normpath(os.path.abspath(os.path.join(base, include)))
 	parsed.add(fname)
 
@@ -186,6 +196,58 @@ def defines(base, include):
 	return out
 
 
+def _file_stamp(fname):
+	""" Returns [ fname, mtime, size ] list used to validate cache """
+	st = os.stat(fname)
+	return [ fname, st.st_mtime, st.st_size ]
+
+
+def cached_defines(base, include, cache_file):
+
+	""" As defines(), but stores result in cache_file and reuses it
+
+	Cached table is used only if all files read while extracting it
+	still have same mtime and size. Any problem with reading or writing
+	cache file is silently ignored and defines() is used as fallback.
+	"""
+
+	key = os.path.normpath(os.path.abspath(os.path.join(base, include)))
+	cache = {}
+	try:
+		cache = json.loads(open(cache_file, "r").read())
+		if cache.get("version") != CACHE_VERSION:
+			cache = {}
+		entry = cache.get("headers", {}).get(key)
+		if entry and all(_file_stamp(x[0]) == x for x in entry["files"]):
+			return OrderedDict([ (str(k), v) for (k, v) in entry["defines"] ])
+	except Exception:
+		# Missing, outdated or broken cache file, or header was removed
+		pass
+
+	parsed = set()
+	out = defines(base, include, parsed)
+
+	try:
+		if cache.get("version") != CACHE_VERSION:
+			cache = { "version" : CACHE_VERSION, "headers" : {} }
+		cache["headers"][key] = {
+			"files" : [ _file_stamp(x) for x in sorted(parsed) ],
+			"defines" : list(out.items()),
+		}
+		if not os.path.exists(os.path.dirname(cache_file)):
+			os.makedirs(os.path.dirname(cache_file))
+		# Write into temporary file first, so concurrently starting process
+		# never reads half-written cache
+		tmp = "%s.%s.tmp" % (cache_file, os.getpid())
+		open(tmp, "w").write(json.dumps(cache))
+		os.rename(tmp, cache_file)
+	except Exception:
+		# Not being able to store cache is not fatal
+		pass
+
+	return out
+
+
 if __name__ == '__main__':
 	import sys
 	definesDict = defines(sys.argv[1], sys.argv[2])
@@ -22,7 +22,6 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
-from collections import namedtuple
 from scc.lib import IntEnum
 import struct
 
@@ -80,9 +79,76 @@ ROLL	= "ROLL"
 FORMATS, NAMES = zip(*CONTROLER_FORMAT)
 CI_NAMES = [ x for x in NAMES if not x.startswith('ukn_') ]
 
-ControllerInput = namedtuple('ControllerInput', ' '.join(CI_NAMES))
-
-SCI_NULL = ControllerInput._make(struct.unpack('<' + ''.join(FORMATS), b'\x00' * 64))
+# Precompiled decoder for input packets. Unpacked tuple contains values
+# in order of CI_NAMES
+CI_STRUCT = struct.Struct('<' + ''.join(FORMATS))
+
+
+class ControllerInput(object):
+	"""
+	State of controller inputs, as decoded from one input packet.
+	
+	Instance is mutable and SCController reuses single one for every
+	received packet, so decoding doesn't allocate new object each time.
+	Use copy() or copy_from() to keep values that have to survive
+	next packet.
+	"""
+	__slots__ = CI_NAMES
+	
+	def __init__(self, *values):
+		if values:
+			self.set(*values)
+		else:
+			for name in CI_NAMES:
+				setattr(self, name, 0)
+	
+	
+	def set(self, type, status, seq, buttons, ltrig, rtrig, lpad_x, lpad_y,
+				rpad_x, rpad_y, gpitch, groll, gyaw, q1, q2, q3, q4):
+		""" Sets all values at once. Arguments are in order of CI_NAMES """
+		self.type, self.status, self.seq, self.buttons = type, status, seq, buttons
+		self.ltrig, self.rtrig = ltrig, rtrig
+		self.lpad_x, self.lpad_y, self.rpad_x, self.rpad_y = lpad_x, lpad_y, rpad_x, rpad_y
+		self.gpitch, self.groll, self.gyaw = gpitch, groll, gyaw
+		self.q1, self.q2, self.q3, self.q4 = q1, q2, q3, q4
+	
+	
+	def copy_from(self, other):
+		""" Copies all values from another ControllerInput """
+		self.type = other.type
+		self.status = other.status
+		self.seq = other.seq
+		self.buttons = other.buttons
+		self.ltrig = other.ltrig
+		self.rtrig = other.rtrig
+		self.lpad_x = other.lpad_x
+		self.lpad_y = other.lpad_y
+		self.rpad_x = other.rpad_x
+		self.rpad_y = other.rpad_y
+		self.gpitch = other.gpitch
+		self.groll = other.groll
+		self.gyaw = other.gyaw
+		self.q1 = other.q1
+		self.q2 = other.q2
+		self.q3 = other.q3
+		self.q4 = other.q4
+	
+	
+	def copy(self):
+		""" Returns snapshot of current values """
+		c = ControllerInput.__new__(ControllerInput)
+		c.copy_from(self)
+		return c
+	
+	
+	def __repr__(self):
+		return "<ControllerInput %s>" % (", ".join([
+			"%s=%s" % (name, getattr(self, name)) for name in CI_NAMES ]),)
+
+# ControllerInput.set has to take arguments in same order as CI_STRUCT produces them
+assert ControllerInput.set.__code__.co_varnames[1:len(CI_NAMES) + 1] == tuple(CI_NAMES)
+
+SCI_NULL = ControllerInput(*CI_STRUCT.unpack(b'\x00' * 64))
 
 class SCStatus(IntEnum):
 	IDLE = 0x04
@@ -19,50 +19,93 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
-from threading import Timer
 import struct, time, logging
 
 from scc.lib import usb1
+from scc.eventloop import EventLoop
 from scc.constants import VENDOR_ID, PRODUCT_ID, HPERIOD, LPERIOD, DURATION
-from scc.constants import ENDPOINT, CONTROLIDX, FORMATS, ControllerInput
+from scc.constants import ENDPOINT, CONTROLIDX, CI_STRUCT, ControllerInput
 from scc.constants import SCStatus, SCButtons, HapticPos, SCPacketType
 
 log = logging.getLogger("SCController")
 
+
+def find_devices(ctx):
+	"""
+	Returns list of all usb1.USBDevice instances that are either wired
+	controllers or wireless dongles, sorted by bus and address, so same
+	device gets same position every time when nothing is plugged in or out.
+	"""
+	rv = []
+	for device in ctx.getDeviceList(skip_on_error=True):
+		if device.getVendorID() == VENDOR_ID and device.getProductID() in PRODUCT_ID:
+			rv.append(device)
+	rv.sort(key=lambda d : (d.getBusNumber(), d.getDeviceAddress()))
+	return rv
+
+
+def run_controllers(ctx, controllers, loop=None):
+	"""
+	Processes usb events for all controllers sharing same USBContext,
+	using 'loop' (scc.eventloop.EventLoop) or new loop if not set.
+	Returns when none of them is able to receive data anymore.
+	"""
+	loop = loop or EventLoop()
+	active = [ c for c in controllers if c._handle ]
+	loop.set_usb_context(ctx)
+	for c in active:
+		c._started(loop)
+	try:
+		while len(active):
+			# While there are control messages waiting, loop doesn't wait
+			# for next event before sending them
+			pending = any([ len(c._cmsg) for c in active ])
+			loop.run_once(0 if pending else None)
+			for c in active:
+				c._sendPending()
+			for c in [ c for c in active if not c.isRunning() ]:
+				active.remove(c)
+				c._stopped()
+	except usb1.USBErrorInterrupted, e:
+		log.error(e)
+	finally:
+		loop.set_usb_context(None)
+		for c in controllers:
+			c._stopTimer()
+			c.unclaim()
+
+
 class SCController(object):
 
-	def __init__(self, callback):
+	def __init__(self, callback, ctx=None, device=None):
 		"""
 		Constructor
 		
 		callback:
 			function called on usb message 
-			takes (SCController, current_time, ControllerInput) as arguments
+			takes (SCController, current_time, ControllerInput) as arguments.
+			ControllerInput instance is reused for following packets.
+		ctx:
+			usb1.USBContext, shared by multiple controllers. New one is
+			created if not set.
+		device:
+			usb1.USBDevice, as returned by find_devices. If not set,
+			first found controller is used.
 		"""
-		self._handle = None
-		self._cb = callback
-		self._cscallback = None		# Controller State Callback
-		self._cmsg = []
-		self._claimed = []
-		self._ctx = usb1.USBContext()
-		self._controller_connected = False
-		self._idle_timeout = 600
-		self._enable_gyros = False
+		self._init_state(callback)
+		self._ctx = ctx or usb1.USBContext()
 		
-		for i in range(len(PRODUCT_ID)):
-			pid = PRODUCT_ID[i]
-			endpoint = ENDPOINT[i]
-			ccidx = CONTROLIDX[i]
-
-			self._handle = self._ctx.openByVendorIDAndProductID(
-				VENDOR_ID, pid,
-				skip_on_error=True,
-			)
-			if self._handle is not None:
-				break
-
-		if self._handle is None:
-			raise ValueError('Controller Device not found')
+		if device is None:
+			devices = find_devices(self._ctx)
+			if len(devices) == 0:
+				raise ValueError('Controller Device not found')
+			device = devices[0]
+		
+		i = PRODUCT_ID.index(device.getProductID())
+		pid = PRODUCT_ID[i]
+		endpoint = ENDPOINT[i]
+		ccidx = CONTROLIDX[i]
+		self._handle = device.open()
 
 		self._ccidx = ccidx
 		dev = self._handle.getDevice()
@@ -89,14 +132,31 @@ class SCController(object):
 		transfer.submit()
 		self._transfer_list.append(transfer)
 
+		# Wireless dongle doesn't send anything while controller state
+		# doesn't change, so last input is periodically re-sent to mapper
+		self._refire = (pid == 0x1102)
+	
+	
+	def _init_state(self, callback):
+		"""
+		Sets everything that doesn't depend on USB device.
+		Used by constructor and by scc.replay.ReplayController.
+		"""
+		self._handle = None
+		self._cb = callback
+		self._cscallback = None		# Controller State Callback
+		self._recorder = None
+		self._latency = None
+		self._cmsg = []
+		self._claimed = []
+		self._controller_connected = False
+		self._idle_timeout = 600
+		self._enable_gyros = False
 		self._period = LPERIOD
-
-		if pid == 0x1102:
-			self._timer = Timer(LPERIOD, self._callbackTimer)
-			self._timer.start()
-		else:
-			self._timer = None
-
+		self._loop = None
+		self._timer = None
+		self._refire = False
+		self._input = ControllerInput()	# reused for every received packet
 		self._tup = None
 		self._lastusb = time.time()
 	
@@ -121,6 +181,22 @@ class SCController(object):
 		self._cscallback = callback
 	
 	
+	def setRecorder(self, recorder):
+		"""
+		Sets scc.recorder.InputRecorder instance that receives every packet
+		read from controller. Use None to stop recording.
+		"""
+		self._recorder = recorder
+	
+	
+	def setLatencyStats(self, latency):
+		"""
+		Sets scc.latency.LatencyStats instance used to measure how long it
+		takes to process received packet. Use None to stop measuring.
+		"""
+		self._latency = latency
+	
+	
 	def __del__(self):
 		if self._handle:
 			self._handle.close()
@@ -160,17 +236,25 @@ class SCController(object):
 			transfer.getActualLength() != 64):
 			return
 		
+		if self._latency:
+			self._latency.begin()
 		data = transfer.getBuffer()
-		tup = ControllerInput._make(struct.unpack('<' + ''.join(FORMATS), data))
-		if tup.status == SCStatus.HOTPLUG:
+		if self._recorder:
+			self._recorder.record(data)
+		values = CI_STRUCT.unpack(data)
+		status = values[1]
+		if status == SCStatus.HOTPLUG:
 			transfer.submit()
-			state, = struct.unpack('<xxxxB59x', data)
+			# Hotplug state is 5th byte of packet, which is where
+			# low byte of 'seq' is in input packet
+			state = values[2] & 0xFF
 			self._controller_connected = (state == 2)
 			if self._cscallback:
 				self._cscallback(self, self._controller_connected)
 				self.configure_controller()
-		elif tup.status == SCStatus.INPUT:
-			self._tup = tup
+		elif status == SCStatus.INPUT:
+			self._input.set(*values)
+			self._tup = self._input
 			self._callback()
 			transfer.submit()
 			if not self._controller_connected:
@@ -192,13 +276,11 @@ class SCController(object):
 	def _callbackTimer(self):
 		t = time.time()
 		d = t - self._lastusb
-		self._timer.cancel()
 		
 		if d > DURATION:
 			self._period = LPERIOD
 		
-		self._timer = Timer(self._period, self._callbackTimer)
-		self._timer.start()
+		self._timer = self._loop.schedule(self._period, self._callbackTimer)
 		
 		if self._tup is None:
 			return
@@ -287,29 +369,48 @@ class SCController(object):
 				SCPacketType.OFF, 0x04, 0x6f, 0x66, 0x66, 0x21))
 	
 	
+	def isRunning(self):
+		""" Returns True while controller is able to receive data """
+		return any(x.isSubmitted() for x in self._transfer_list)
+	
+	
+	def _sendPending(self):
+		""" Sends one of queued control messages, if there is any """
+		if len(self._cmsg) > 0:
+			cmsg = self._cmsg.pop()
+			self._sendControl(cmsg)
+	
+	
+	def _started(self, loop):
+		""" Called by run_controllers before loop starts """
+		self._loop = loop
+		if self._refire:
+			self._timer = loop.schedule(LPERIOD, self._callbackTimer)
+	
+	
+	def _stopTimer(self):
+		if self._timer:
+			self._timer.cancel()
+			self._timer = None
+	
+	
+	def _stopped(self):
+		""" Called by run_controllers when controller stops receiving data """
+		self._stopTimer()
+		try:
+			# Normally, code reaches here only when usb dongle gets stuck
+			# in some weird "yes, Im here but don't talk to me" state.
+			# Reseting fixes it.
+			self.reset()
+			log.info("Performed dongle reset")
+		except Exception:
+			# Unless code reaches here because dongle was removed.
+			pass
+	
+	
 	def run(self):
 		"""Fucntion to run in order to process usb events"""
-		if self._handle:
-			try:
-				while any(x.isSubmitted() for x in self._transfer_list):
-					self._ctx.handleEvents()
-					if len(self._cmsg) > 0:
-						cmsg = self._cmsg.pop()
-						self._sendControl(cmsg)
-				try:
-					# Normally, code reaches here only when usb dongle gets stuck
-					# in some weird "yes, Im here but don't talk to me" state.
-					# Reseting fixes it.
-					self.reset()
-					log.info("Performed dongle reset")
-				except Exception:
-					# Unless code reaches here because dongle was removed.
-					pass
-			except usb1.USBErrorInterrupted, e:
-				log.error(e)
-				pass
-			finally:
-				self.unclaim()
+		run_controllers(self._ctx, [ self ])
 
 
 	def handleEvents(self):
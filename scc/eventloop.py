@@ -0,0 +1,191 @@
+#!/usr/bin/env python2
+"""
+SC-Controller - Event Loop
+
+Single-threaded loop that waits for libusb file descriptors, any other
+registered file descriptors (such as control socket and its clients) and
+timers at once, using poll(2).
+
+Timers are kept in heap ordered by monotonic time, so they are not affected
+by changes of system clock and no thread has to be started to wait for them.
+"""
+from __future__ import unicode_literals
+
+import os, select, errno, heapq, ctypes, ctypes.util, logging
+log = logging.getLogger("EventLoop")
+
+try:
+	from time import monotonic
+except ImportError:
+	# Python 2 has no monotonic clock in standard library
+	class _timespec(ctypes.Structure):
+		_fields_ = [ ("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long) ]
+
+	CLOCK_MONOTONIC = 1
+	_librt = ctypes.CDLL(ctypes.util.find_library("rt") or "librt.so.1", use_errno=True)
+	_clock_gettime = _librt.clock_gettime
+	_ts = _timespec()
+	# Reference is created only once and argtypes are not set, as
+	# converting arguments takes longer than call itself
+	_ts_ref = ctypes.byref(_ts)
+
+	def monotonic():
+		""" Returns value of monotonic clock, in seconds """
+		if _clock_gettime(CLOCK_MONOTONIC, _ts_ref) != 0:
+			e = ctypes.get_errno()
+			raise OSError(e, os.strerror(e))
+		return _ts.tv_sec + _ts.tv_nsec * 1e-9
+
+
+class Timer(object):
+	""" Returned by EventLoop.schedule. Calling cancel() stops timer """
+	__slots__ = ("when", "callback", "args")
+
+	def __init__(self, when, callback, args):
+		self.when = when
+		self.callback = callback
+		self.args = args
+
+
+	def cancel(self):
+		self.callback = None
+		self.args = None
+
+
+class EventLoop(object):
+
+	def __init__(self):
+		self._poll = select.poll()
+		self._callbacks = {}	# fd -> callback
+		self._timers = []		# heap of (time, sequence, Timer)
+		self._seq = 0
+		self._ctx = None		# usb1.USBContext
+		self._usb_fds = set()
+		self._last_event = monotonic()
+
+
+	def add_fd(self, fd, callback, events=select.POLLIN):
+		"""
+		Starts watching file descriptor. Callback is called with (fd, events)
+		as arguments every time when one of 'events' occurs.
+		"""
+		self._callbacks[fd] = callback
+		self._poll.register(fd, events)
+
+
+	def modify_fd(self, fd, events):
+		""" Changes events that are watched on already added file descriptor """
+		self._poll.modify(fd, events)
+
+
+	def remove_fd(self, fd):
+		""" Stops watching file descriptor """
+		if fd in self._callbacks:
+			del self._callbacks[fd]
+			self._poll.unregister(fd)
+
+
+	def schedule(self, delay, callback, *args):
+		"""
+		Schedules callback to be called with 'args' after 'delay' seconds.
+		Returns Timer instance that can be used to cancel it.
+		"""
+		timer = Timer(monotonic() + delay, callback, args)
+		self._seq += 1
+		heapq.heappush(self._timers, (timer.when, self._seq, timer))
+		return timer
+
+
+	def get_idle_time(self):
+		"""
+		Returns number of seconds since any usb event or any event on
+		watched file descriptor happened. Timers are not counted.
+		"""
+		return monotonic() - self._last_event
+
+
+	def set_usb_context(self, ctx):
+		"""
+		Sets usb1.USBContext which file descriptors should be watched.
+		Use None to stop watching previously set context.
+		"""
+		if self._ctx:
+			self._ctx.setPollFDNotifiers(None, None)
+			for fd in list(self._usb_fds):
+				self._usb_fd_removed(fd, None)
+		self._ctx = ctx
+		if ctx:
+			ctx.setPollFDNotifiers(self._usb_fd_added, self._usb_fd_removed)
+			for fd, events in ctx.getPollFDList():
+				self._usb_fd_added(fd, events, None)
+
+
+	def _usb_fd_added(self, fd, events, user_data):
+		self._usb_fds.add(fd)
+		self._poll.register(fd, events)
+
+
+	def _usb_fd_removed(self, fd, user_data):
+		if fd in self._usb_fds:
+			self._usb_fds.remove(fd)
+			self._poll.unregister(fd)
+
+
+	def run_once(self, timeout=None):
+		"""
+		Waits until something happens or until 'timeout' (in seconds) passes
+		and dispatches everything that happened: usb events, callbacks of
+		watched file descriptors and timers that are due.
+		"""
+		timers = self._timers
+		if timers:
+			t = max(0.0, timers[0][0] - monotonic())
+			timeout = t if timeout is None else min(timeout, t)
+		if self._ctx:
+			t = self._ctx.getNextTimeout()
+			if t is not None:
+				timeout = t if timeout is None else min(timeout, t)
+
+		try:
+			events = self._poll.poll(None if timeout is None else int(timeout * 1000.0 + 0.999))
+		except select.error, e:
+			if e.args[0] != errno.EINTR:
+				raise
+			events = []
+
+		if events:
+			self._last_event = monotonic()
+		if self._ctx:
+			if not events or any([ fd in self._usb_fds for fd, trash in events ]):
+				# Handles usb events, or usb timeout that just expired
+				self._ctx.handleEventsTimeout()
+		for fd, ev in events:
+			cb = self._callbacks.get(fd)
+			if cb is not None:
+				try:
+					cb(fd, ev)
+				except Exception:
+					# Error in one callback should not stop everything else
+					log.exception("Error in callback for fd %s", fd)
+
+		if timers:
+			now = monotonic()
+			while timers and timers[0][0] <= now:
+				timer = heapq.heappop(timers)[2]
+				cb, args = timer.callback, timer.args
+				timer.cancel()
+				if cb is not None:
+					try:
+						cb(*args)
+					except Exception:
+						log.exception("Error in scheduled callback %s", cb)
+
+
+	def sleep(self, seconds):
+		""" Processes events for specified time """
+		deadline = monotonic() + seconds
+		while True:
+			remaining = deadline - monotonic()
+			if remaining <= 0:
+				break
+			self.run_once(remaining)
@@ -0,0 +1,86 @@
+#!/usr/bin/env python2
+"""
+SC-Controller - Binary framing
+
+Optional binary format of messages sent by daemon over control socket.
+Client opts in by sending 'Protocol: binary'. Every message that daemon
+sends after 'OK.' response to that request is sent as frame:
+ - uint8 type
+ - uint32 payload length (little endian)
+ - payload
+
+Events from locked buttons, pads and stick are sent as fixed-size records,
+everything else as text frame containing single message without newline.
+"""
+from __future__ import unicode_literals
+
+from scc.constants import SCButtons, STICK, LEFT, RIGHT
+import struct
+
+HEADER		= struct.Struct(b"<BI")
+BUTTON		= struct.Struct(b"<IB")		# SCButtons value, 1 if pressed
+POSITION	= struct.Struct(b"<Bhh")	# index in SOURCES, x, y
+
+FRAME_TEXT		= 0
+FRAME_BUTTON	= 1
+FRAME_POSITION	= 2
+
+SOURCES = ( STICK, LEFT, RIGHT )
+_SOURCE_INDEX = { s : i for (i, s) in enumerate(SOURCES) }
+
+
+def pack_text(data):
+	""" Converts str with one or more newline-terminated messages to frames """
+	return b"".join([
+		HEADER.pack(FRAME_TEXT, len(line)) + line
+		for line in data.split(b"\n") if len(line)
+	])
+
+
+def pack_button(button, pressed):
+	return HEADER.pack(FRAME_BUTTON, BUTTON.size) + BUTTON.pack(button, 1 if pressed else 0)
+
+
+def pack_position(source, x, y):
+	return HEADER.pack(FRAME_POSITION, POSITION.size) + POSITION.pack(_SOURCE_INDEX[source], x, y)
+
+
+class FrameReader(object):
+	"""
+	Splits data received from daemon into frames.
+
+	Use feed() to add received data and then frames() to get list of
+	all complete frames. Frames are returned as tuples:
+	 - (FRAME_TEXT, message)
+	 - (FRAME_BUTTON, button, pressed)
+	 - (FRAME_POSITION, source, x, y)
+	where button is SCButtons member, pressed is bool and source is one of
+	SOURCES. Unknown frame types are skipped.
+	"""
+
+	def __init__(self):
+		self.buffer = b""
+
+
+	def feed(self, data):
+		self.buffer += data
+
+
+	def frames(self):
+		rv, buffer, offset = [], self.buffer, 0
+		while len(buffer) - offset >= HEADER.size:
+			type, length = HEADER.unpack_from(buffer, offset)
+			start = offset + HEADER.size
+			if len(buffer) < start + length:
+				break
+			offset = start + length
+			if type == FRAME_TEXT:
+				rv.append(( FRAME_TEXT, buffer[start:offset].decode("utf-8") ))
+			elif type == FRAME_BUTTON:
+				button, pressed = BUTTON.unpack_from(buffer, start)
+				rv.append(( FRAME_BUTTON, SCButtons(button), bool(pressed) ))
+			elif type == FRAME_POSITION:
+				source, x, y = POSITION.unpack_from(buffer, start)
+				rv.append(( FRAME_POSITION, SOURCES[source], x, y ))
+		self.buffer = buffer[offset:]
+		return rv
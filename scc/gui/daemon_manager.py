@@ -12,6 +12,7 @@ from __future__ import unicode_literals
 
 from scc.paths import get_daemon_socket
 from scc.tools import find_binary
+from scc.framing import FrameReader, FRAME_TEXT, FRAME_BUTTON, FRAME_POSITION
 from gi.repository import GObject, Gio, GLib
 
 import os, sys, logging
@@ -55,12 +56,19 @@ class DaemonManager(GObject.GObject):
 	
 	RECONNECT_INTERVAL = 5
 	
-	def __init__(self):
+	def __init__(self, binary=False):
+		"""
+		If 'binary' is True, binary protocol is requested when connected,
+		so events are received as fixed-size records instead of text.
+		"""
 		GObject.GObject.__init__(self)
 		self.alive = None
 		self.connection = None
 		self.connecting = False
-		self.buffer = ""
+		self.binary = binary
+		self.buffer = b""
+		self._reader = None		# FrameReader, set after switching to binary protocol
+		self._switching = False	# True while waiting for response to 'Protocol: binary'
 		self._connect()
 		self._requests = []
 	
@@ -101,7 +109,12 @@ class DaemonManager(GObject.GObject):
 		except Exception, e:
 			self._on_daemon_died()
 			return
-		self.buffer = ""
+		self.buffer = b""
+		self._reader = None
+		self._switching = self.binary
+		if self.binary:
+			(self.connection.get_output_stream()
+				.write_all(b"Protocol: binary\n", None))
 		self.connection.get_input_stream().read_bytes_async(102400,
 			1, None, self._on_read_data)
 	
@@ -116,53 +129,76 @@ class DaemonManager(GObject.GObject):
 			# Broken sonnection, daemon was probbaly terminated
 			self._on_daemon_died()
 			return
-		data = response.get_data().decode("utf-8")
+		data = response.get_data()
 		if len(data) == 0:
 			# Connection terminated
 			self._on_daemon_died()
 			return
 		self.buffer += data
-		while "\n" in self.buffer:
-			line, self.buffer = self.buffer.split("\n", 1)
-			if line.startswith("Version:"):
-				version = line.split(":", 1)[-1].strip()
-				log.debug("Connected to daemon, version %s", version)
-			elif line.startswith("Ready."):
-				log.debug("Daemon is ready.")
-				self.alive = True
-				self.emit('alive')
-			elif line.startswith("OK."):
-				if len(self._requests) > 0:
-					success_cb, error_cb = self._requests[-1]
-					self._requests = self._requests[0:-1]
-					success_cb()
-			elif line.startswith("Fail:"):
-				if len(self._requests) > 0:
-					success_cb, error_cb = self._requests[-1]
-					self._requests = self._requests[0:-1]
-					error_cb(line[5:].strip())
-			elif line.startswith("Event:"):
-				data = line[6:].strip().split(" ")
-				self.emit('event', data[0], [ int(x) for x in data[1:] ])
-			elif line.startswith("Error:"):
-				error = line.split(":", 1)[-1].strip()
-				self.alive = True
-				log.debug("Daemon reported error '%s'", error)
-				self.emit('error', error)
-			elif line.startswith("Current profile:"):
-				profile = line.split(":", 1)[-1].strip()
-				log.debug("Daemon reported profile change: %s", profile)
-				self.emit('profile-changed', profile)
-			elif line.startswith("PID:") or line == "SCCDaemon":
-				# ignore
-				pass
-			else:
-				self.emit('unknown-msg', line)
+		while self._reader is None and b"\n" in self.buffer:
+			line, self.buffer = self.buffer.split(b"\n", 1)
+			self._on_message(line.decode("utf-8"))
+		if self._reader is not None:
+			# Everything after response to 'Protocol: binary' is framed
+			self._reader.feed(self.buffer)
+			self.buffer = b""
+			for frame in self._reader.frames():
+				if frame[0] == FRAME_POSITION:
+					self.emit('event', frame[1], [ frame[2], frame[3] ])
+				elif frame[0] == FRAME_BUTTON:
+					self.emit('event', frame[1].name, [ 1 if frame[2] else 0 ])
+				elif frame[0] == FRAME_TEXT:
+					self._on_message(frame[1])
 		# Connection is held forever to detect when daemon exits
 		self.connection.get_input_stream().read_bytes_async(102400,
 			1, None, self._on_read_data)
 	
 	
+	def _on_message(self, line):
+		""" Handles one text message received from daemon """
+		if line.startswith("Version:"):
+			version = line.split(":", 1)[-1].strip()
+			log.debug("Connected to daemon, version %s", version)
+		elif line.startswith("Ready."):
+			log.debug("Daemon is ready.")
+			self.alive = True
+			self.emit('alive')
+		elif line.startswith("OK."):
+			if self._switching:
+				# Response to 'Protocol: binary'
+				self._switching = False
+				self._reader = FrameReader()
+			elif len(self._requests) > 0:
+				success_cb, error_cb = self._requests[-1]
+				self._requests = self._requests[0:-1]
+				success_cb()
+		elif line.startswith("Fail:"):
+			if self._switching:
+				# Daemon doesn't support binary protocol, text is used
+				self._switching = False
+			elif len(self._requests) > 0:
+				success_cb, error_cb = self._requests[-1]
+				self._requests = self._requests[0:-1]
+				error_cb(line[5:].strip())
+		elif line.startswith("Event:"):
+			data = line[6:].strip().split(" ")
+			self.emit('event', data[0], [ int(x) for x in data[1:] ])
+		elif line.startswith("Error:"):
+			error = line.split(":", 1)[-1].strip()
+			self.alive = True
+			log.debug("Daemon reported error '%s'", error)
+			self.emit('error', error)
+		elif line.startswith("Current profile:"):
+			profile = line.split(":", 1)[-1].strip()
+			log.debug("Daemon reported profile change: %s", profile)
+			self.emit('profile-changed', profile)
+		elif line.startswith("PID:") or line == "SCCDaemon":
+			# ignore
+			pass
+		else:
+			self.emit('unknown-msg', line)
+	
+	
 	def is_alive(self):
 		""" Returns True if daemon is running """
 		return self.alive
@@ -0,0 +1,92 @@
+#!/usr/bin/env python2
+"""
+SC-Controller - INotify
+
+Minimal ctypes wrapper around Linux inotify API, used to watch profile files
+without polling. Instances have fileno() and can be added to EventLoop.
+"""
+from __future__ import unicode_literals
+
+import os, errno, struct, ctypes, ctypes.util
+
+IN_MODIFY		= 0x00000002
+IN_CLOSE_WRITE	= 0x00000008
+IN_MOVED_FROM	= 0x00000040
+IN_MOVED_TO		= 0x00000080
+IN_CREATE		= 0x00000100
+IN_DELETE		= 0x00000200
+IN_IGNORED		= 0x00008000
+IN_NONBLOCK		= 0x00000800
+IN_CLOEXEC		= 0x00080000
+
+EVENT = struct.Struct(b"iIII")		# wd, mask, cookie, len
+
+_libc = None
+
+
+class INotify(object):
+	"""
+	Throws OSError if inotify is not available.
+	"""
+
+	def __init__(self):
+		global _libc
+		if _libc is None:
+			_libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+			if not hasattr(_libc, "inotify_init1"):
+				raise OSError(errno.ENOSYS, "inotify is not available")
+		self._fd = _libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+		if self._fd < 0:
+			self._raise()
+
+
+	def _raise(self):
+		e = ctypes.get_errno()
+		raise OSError(e, os.strerror(e))
+
+
+	def fileno(self):
+		return self._fd
+
+
+	def add_watch(self, path, mask):
+		""" Starts watching file or directory. Returns watch descriptor """
+		if isinstance(path, unicode):
+			path = path.encode("utf-8")
+		wd = _libc.inotify_add_watch(self._fd, path, ctypes.c_uint32(mask))
+		if wd < 0:
+			self._raise()
+		return wd
+
+
+	def rm_watch(self, wd):
+		_libc.inotify_rm_watch(self._fd, wd)
+
+
+	def read_events(self):
+		"""
+		Returns list of all events that are available, as (wd, mask, name)
+		tuples. 'name' is name of file in watched directory, or None if
+		event is related to watched file or directory itself.
+		"""
+		rv = []
+		while True:
+			try:
+				data = os.read(self._fd, 16384)
+			except OSError, e:
+				if e.errno in (errno.EAGAIN, errno.EINTR):
+					return rv
+				raise
+			offset = 0
+			while offset + EVENT.size <= len(data):
+				wd, mask, cookie, length = EVENT.unpack_from(data, offset)
+				offset += EVENT.size
+				name = data[offset:offset+length].rstrip(b"\x00")
+				offset += length
+				rv.append(( wd, mask, name.decode("utf-8") if name else None ))
+
+
+	def close(self):
+		if self._fd >= 0:
+			os.close(self._fd)
+			self._fd = -1
@@ -0,0 +1,151 @@
+#!/usr/bin/env python2
+"""
+SC-Controller - Latency statistics
+
+Measures how long it takes to process one input report, from moment when it's
+received from USB to moment when last generated event is written to uinput.
+Durations are stored in fixed-size histograms, so memory usage and cost of
+recording don't grow with number of measured reports.
+"""
+from __future__ import unicode_literals
+
+from scc.eventloop import monotonic
+from collections import OrderedDict
+
+# Stages of input processing, in order in which they are measured
+STAGES = ( "unpack", "buttons", "stick", "gyro", "triggers", "pads",
+	"scheduled", "emit", "sync", "total" )
+
+
+class Histogram(object):
+	"""
+	HDR-style histogram of durations in microseconds.
+
+	Values bellow 2^SUB_BITS are stored exactly, bigger values are stored in
+	buckets that have width of 1/2^(SUB_BITS-1) of bucket start, so relative
+	error is never bigger than ~6%. Values above 2^MAX_BITS are clamped.
+	"""
+	SUB_BITS = 5
+	MAX_BITS = 26		# 2^26us is more than minute
+	SUB_COUNT = 1 << SUB_BITS
+	HALF_COUNT = SUB_COUNT >> 1
+	SIZE = SUB_COUNT + (MAX_BITS - SUB_BITS) * HALF_COUNT
+	MAX_VALUE = (1 << MAX_BITS) - 1
+
+	def __init__(self):
+		self.reset()
+
+
+	def reset(self):
+		self.counts = [ 0 ] * self.SIZE
+		self.count = 0
+		self.total = 0
+		self.max = 0
+
+
+	@classmethod
+	def _index(cls, value):
+		""" Returns index of bucket for value """
+		if value < cls.SUB_COUNT:
+			return value
+		shift = value.bit_length() - cls.SUB_BITS
+		return cls.SUB_COUNT + (shift - 1) * cls.HALF_COUNT + (value >> shift) - cls.HALF_COUNT
+
+
+	@classmethod
+	def _highest_value(cls, index):
+		""" Returns highest value that is stored in bucket with given index """
+		if index < cls.SUB_COUNT:
+			return index
+		shift = (index - cls.SUB_COUNT) // cls.HALF_COUNT + 1
+		sub = (index - cls.SUB_COUNT) % cls.HALF_COUNT + cls.HALF_COUNT
+		return ((sub + 1) << shift) - 1
+
+
+	def record(self, value):
+		""" Records one value, in microseconds """
+		value = max(0, min(int(value), self.MAX_VALUE))
+		self.counts[self._index(value)] += 1
+		self.count += 1
+		self.total += value
+		if value > self.max:
+			self.max = value
+
+
+	def percentile(self, p):
+		"""
+		Returns value (in microseconds) bellow which 'p' percent
+		of recorded values lies. Returns 0 if nothing was recorded.
+		"""
+		if self.count == 0:
+			return 0
+		limit = max(1, int(self.count * p / 100.0 + 0.5))
+		seen = 0
+		for index, c in enumerate(self.counts):
+			seen += c
+			if seen >= limit:
+				return min(self._highest_value(index), self.max)
+		return self.max
+
+
+	def mean(self):
+		if self.count == 0:
+			return 0
+		return self.total / self.count
+
+
+class LatencyStats(object):
+	"""
+	Set of histograms, one for each of STAGES.
+
+	begin() is called when report is received, mark(stage) after each stage
+	of processing and end() when all events are written.
+	"""
+	def __init__(self):
+		self.histograms = OrderedDict([ (s, Histogram()) for s in STAGES ])
+		self.start = None
+		self._last = None
+
+
+	def begin(self):
+		""" Called when processing of new input report starts """
+		self.start = self._last = monotonic()
+
+
+	def mark(self, stage):
+		"""
+		Records time since begin() or last mark() as duration of 'stage'.
+		If begin() was not called for current report (report is being
+		re-fired by timer), measurement starts here instead.
+		"""
+		now = monotonic()
+		if self.start is None:
+			self.start = self._last = now
+			return
+		self.histograms[stage].record((now - self._last) * 1000000.0)
+		self._last = now
+
+
+	def end(self):
+		""" Records duration of 'sync' stage and of entire processing """
+		self.mark("sync")
+		if self.start is not None:
+			self.histograms["total"].record((self._last - self.start) * 1000000.0)
+		self.start = None
+
+
+	def reset(self):
+		for h in self.histograms.values():
+			h.reset()
+
+
+	def report(self):
+		"""
+		Returns list of (stage, count, mean, p50, p90, p99, max) tuples,
+		with all durations in microseconds.
+		"""
+		return [
+			(stage, h.count, h.mean(), h.percentile(50), h.percentile(90),
+				h.percentile(99), h.max)
+			for (stage, h) in self.histograms.items()
+		]
@@ -267,14 +267,21 @@ class EnumMeta(type):
             enum_member.__objclass__ = enum_class
             enum_member.__init__(*args)
             # If another member with the same value was already defined, the
-            # new member becomes an alias to the existing one.
-            for name, canonical_member in enum_class._member_map_.items():
-                if canonical_member.value == enum_member._value_:
-                    enum_member = canonical_member
-                    break
-            else:
+            # new member becomes an alias to the existing one. Hashable values
+            # are looked up in _value2member_map_, as linear search makes
+            # creating enums with hundreds of members (uinput Keys) slow.
+            try:
+                enum_member = enum_class._value2member_map_[value]
+            except KeyError:
                 # Aliases don't appear in member names (only in __members__).
                 enum_class._member_names_.append(member_name)
+            except TypeError:
+                for name, canonical_member in enum_class._member_map_.items():
+                    if canonical_member.value == enum_member._value_:
+                        enum_member = canonical_member
+                        break
+                else:
+                    enum_class._member_names_.append(member_name)
             # performance boost for any member that would not shadow
             # a DynamicClassAttribute (aka _RouteClassAttributeToGetattr)
             if member_name not in base_attributes:
@@ -1,32 +1,61 @@
 #!/usr/bin/python2
 from __future__ import unicode_literals
 
-from collections import deque
+from itertools import count
 from scc.uinput import Gamepad, Keyboard, Mouse, Rels
 from scc.constants import SCStatus, SCButtons, SCI_NULL
 from scc.constants import FE_STICK, FE_TRIGGER, FE_PAD
 from scc.constants import CI_NAMES, ControllerInput
 from scc.constants import LEFT, RIGHT, STICK, GYRO
+from scc.smoothing import RunningMean
+from scc.special_actions import SpecialAction
 from scc.profile import Profile
 
 
-import traceback, logging, time
+import traceback, logging, time, heapq
 log = logging.getLogger("Mapper")
 
+
+class ScheduledTask(object):
+	"""
+	Returned by Mapper.schedule. Calling cancel() prevents callback
+	from being called, if it was not called already.
+	"""
+	__slots__ = ("when", "callback")
+	
+	def __init__(self, when, callback):
+		self.when = when
+		self.callback = callback
+	
+	
+	def cancel(self):
+		self.callback = None
+
+
 class Mapper(object):
 	DEBUG = False
+	MOUSE_SMOOTHING = 8		# Default number of positions averaged by mouse_dq_add
 	
-	def __init__(self, profile):
+	def __init__(self, profile, devices=None):
+		"""
+		'devices', if set, should be (gamepad, keyboard, mouse) tuple of
+		already created virtual devices. New uinput devices are created
+		if it's not set.
+		"""
 		self.profile = profile
 		self.controller = None
+		self._next_profile = None		# Profile to switch to at end of callback
+		self._in_callback = False
+		self.now = time.time()			# Time passed to last callback
+		self._held_over = 0				# Buttons held while profile was switched
 		
 		# Create virtual devices
-		log.debug("Creating virtual devices")
-		self.gamepad = Gamepad()
+		if devices is None:
+			log.debug("Creating virtual devices")
+			devices = Gamepad(), Keyboard(), Mouse()
+		self.gamepad, self.keyboard, self.mouse = devices
 		log.debug("Gamepad:  %s" % (self.gamepad, ))
-		self.keyboard = Keyboard()
 		log.debug("Keyboard: %s" % (self.keyboard, ))
-		self.mouse = Mouse()
 		log.debug("Mouse:    %s" % (self.mouse, ))
 		self.mouse.updateParams(
 			friction=Mouse.DEFAULT_FRICTION,
@@ -45,16 +74,102 @@ class Mapper(object):
 		# Setup emulation
 		self.keypress_list = []
 		self.keyrelease_list = []
-		self.mouse_dq = [ deque(maxlen=8), deque(maxlen=8), deque(maxlen=8), deque(maxlen=8) ] # x, y, wheel, hwheel
+		self.mouse_dq = [ RunningMean(Mapper.MOUSE_SMOOTHING) for x in xrange(4) ] # x, y, wheel, hwheel
 		self.mouse_tb = [ False, False ]		# trackball mode for mouse / wheel
 		self.mouse_feedback = [ None, None ]	# for mouse / wheel
 		self.travelled = [ 0, 0 ]				# for mouse / wheel, used when generating "rolling ball" feedback
 		self.syn_list = set()
-		self.scheduled_tasks = []
+		self.scheduled_tasks = []				# heap of (time, sequence, ScheduledTask)
+		self._task_seq = count()
 		self.buttons, self.old_buttons = 0, 0
-		self.state, self.old_state = SCI_NULL, SCI_NULL
+		self.state, self.old_state = SCI_NULL.copy(), SCI_NULL.copy()
 		self.mouse_movements = [ None, None, None, None ]
 		self.force_event = set()
+		
+		# scc.latency.LatencyStats instance, set when latency is measured
+		self.latency = None
+	
+	
+	def set_profile(self, profile):
+		"""
+		Switches to different profile. If called from action while input is
+		being processed, switch is done after all actions are processed,
+		so single input report is never handled by two different profiles.
+		"""
+		if self._in_callback:
+			self._next_profile = profile
+		else:
+			self._swap_profile(profile)
+			self.sync()
+	
+	
+	def _swap_profile(self, profile):
+		"""
+		Releases everything that is held using actions of current profile
+		and replaces it.
+		
+		 - Buttons that are held are released, and when they are physically
+		   released later, actions from new profile are not called.
+		 - Trackball momentum is kept, so cursor keeps rolling as if finger
+		   was lifted from pad.
+		 - Scheduled tasks are kept, so running macros can finish and
+		   release keys they pressed.
+		 - Special actions (menus, profile switch, turning controller off)
+		   are not released at all, see release_binding.
+		"""
+		old = self.profile
+		held = self.buttons
+		while held:
+			bit = held & -held
+			held ^= bit
+			if bit in old.buttons:
+				self.release_binding("buttons", bit, old.buttons[bit])
+		for what in (LEFT, RIGHT):
+			if what in old.triggers:
+				self.release_binding("triggers", what, old.triggers[what])
+			self.release_binding("pads", what, old.pads[what])
+		self.release_binding("stick", None, old.stick)
+		self._held_over = self.buttons
+		self.profile = profile
+	
+	
+	def release_binding(self, attribute, key, action):
+		"""
+		If physical input with action bound to (attribute, key) is being
+		used, sends events to 'action' as if it was just released.
+		Used before action is replaced. See Profile.get_binding for
+		meaning of 'attribute' and 'key'.
+		
+		Special actions are only dropped, as they don't hold anything
+		that would need releasing and releasing some of them would
+		show menu, switch profile again or turn controller off.
+		"""
+		if isinstance(action.strip(), SpecialAction):
+			if attribute == "buttons":
+				self._held_over |= key & self.buttons
+			return
+		if attribute == "buttons":
+			if self.buttons & key:
+				action.button_release(self)
+				self._held_over |= key
+		elif attribute == "triggers":
+			position = self.state.ltrig if key == LEFT else self.state.rtrig
+			if position:
+				action.trigger(self, 0, position)
+		elif attribute == "stick":
+			if not self.buttons & SCButtons.LPADTOUCH:
+				if self.state.lpad_x or self.state.lpad_y:
+					action.whole(self, 0, 0, STICK)
+		elif attribute == "pads":
+			bit = SCButtons.LPADTOUCH if key == LEFT else SCButtons.RPADTOUCH
+			if self.buttons & bit:
+				# Pad actions recognize release by looking at touch button
+				buttons, old_buttons = self.buttons, self.old_buttons
+				self.buttons, self.old_buttons = buttons & ~bit, old_buttons | bit
+				try:
+					action.whole(self, 0, 0, key)
+				finally:
+					self.buttons, self.old_buttons = buttons, old_buttons
 	
 	
 	def sync(self):
@@ -95,10 +210,31 @@ class Mapper(object):
 		"""
 		Schedules callback to be ran no sooner than after 'delay's.
 		Callback is called with mapper as only argument.
+		
+		When called from callback, 'delay' is counted from time passed
+		to it, so replayed input is timed by recording, not by wall clock.
+		
+		Returns ScheduledTask that can be used to cancel callback.
 		"""
-		when = time.time() + delay
-		self.scheduled_tasks.append( (when, cb) )
-		self.scheduled_tasks.sort(key=lambda a: a[0])
+		now = self.now if self._in_callback else time.time()
+		task = ScheduledTask(now + delay, cb)
+		# Sequence number keeps tasks with same time in order in which
+		# they were scheduled and prevents comparing tasks themselves
+		heapq.heappush(self.scheduled_tasks, (task.when, next(self._task_seq), task))
+		return task
+	
+	
+	def run_scheduled(self, now):
+		"""
+		Calls all scheduled callbacks that are due by 'now'. Callbacks
+		scheduled while this is running are called on next tick at soonest.
+		"""
+		tasks = self.scheduled_tasks
+		while tasks and tasks[0][0] <= now:
+			task = heapq.heappop(tasks)[2]
+			cb, task.callback = task.callback, None
+			if cb is not None:
+				cb(self)
 	
 	
 	def mouse_dq_clear(self, *axes):
@@ -107,25 +243,32 @@ class Mapper(object):
 			self.mouse_dq[axis].clear()
 	
 	
+	def set_mouse_smoothing(self, axis, size, weighted=False):
+		"""
+		Sets how many last positions are averaged by mouse_dq_add for given
+		axis and if newer positions should have more weight.
+		Larger number means smoother, but less responsive, movement.
+		"""
+		self.mouse_dq[axis] = RunningMean(size, weighted)
+	
+	
 	def mouse_dq_add(self, axis, position, speed, hapticdata):
 		""" Used by trackpad, trackball and mouse wheel emulation """
 		t = self.mouse_movements[axis]
+		dq = self.mouse_dq[axis]
 		if t is None:
 			try:
-				prev = int(sum(self.mouse_dq[axis]) / len(self.mouse_dq[axis]))
+				prev = int(dq.mean())
 			except ZeroDivisionError:
 				prev = position
 			t = self.mouse_movements[axis] = [ prev, 0, False ]
-		self.mouse_dq[axis].append(position)
+		dq.add(position)
 		if axis >= 2:	# 2 - wheel, 3 - horisontal wheel
 			self.mouse_feedback[1] = hapticdata
 		else:
 			self.mouse_feedback[0] = hapticdata
 		
-		try:
-			t[1] = int(sum(self.mouse_dq[axis]) / len(self.mouse_dq[axis]))
-		except ZeroDivisionError:
-			t[1] = 0
+		t[1] = int(dq.mean())
 	
 	
 	def do_trackball(self, move_or_wheel, stop=False):
@@ -182,11 +325,16 @@ class Mapper(object):
 	
 	
 	def callback(self, controller, now, sci):
-		# Store state
-		self.old_state = self.state
+		latency = self.latency
+		if latency: latency.mark("unpack")
+		self._in_callback = True
+		self.now = now
+		
+		# Store state. Controller reuses 'sci' for next packet, so values are
+		# copied into two objects owned by mapper, which swap roles every time
+		self.old_state, self.state = self.state, self.old_state
+		self.state.copy_from(sci)
 		self.old_buttons = self.buttons
-
-		self.state = sci
 		self.buttons = sci.buttons
 		
 		if self.buttons & SCButtons.LPAD and not self.buttons & SCButtons.LPADTOUCH:
@@ -200,51 +348,92 @@ class Mapper(object):
 		btn_rem = xor & self.old_buttons
 		btn_add = xor & self.buttons
 		
+		# Actions are not called directly, but using handlers compiled
+		# from them. See Profile.get_handler
+		profile = self.profile
+		handlers, get_handler = profile.handlers, profile.get_handler
+		
 		try:
 			if btn_add or btn_rem:
-				# At least one button was pressed
-				for x in self.profile.buttons:
-					if x & btn_add:
-						self.profile.buttons[x].button_press(self)
-					elif x & btn_rem:
-						self.profile.buttons[x].button_release(self)
-			
+				# At least one button was pressed. Only changed bits are looked
+				# up, so NoAction bindings and untouched buttons are skipped.
+				buttons = profile.buttons
+				changed = xor
+				if self._held_over:
+					# Buttons pressed before profile was switched are
+					# not released using actions from new profile
+					changed &= ~(btn_rem & self._held_over)
+					self._held_over &= ~xor
+				while changed:
+					bit = changed & -changed
+					changed ^= bit
+					action = buttons.get(bit)
+					if action:
+						press, release = handlers.get(action) or get_handler("buttons", bit)
+						if bit & btn_add:
+							press(self)
+						else:
+							release(self)
+			if latency: latency.mark("buttons")
 			
 			# Check stick
 			if not self.buttons & SCButtons.LPADTOUCH:
 				if FE_STICK in fe or self.old_state.lpad_x != sci.lpad_x or self.old_state.lpad_y != sci.lpad_y:
-					self.profile.stick.whole(self, sci.lpad_x, sci.lpad_y, STICK)
+					action = profile.stick
+					if action:
+						handler = handlers.get(action) or get_handler("stick", None)
+						handler(self, sci.lpad_x, sci.lpad_y, STICK)
+			if latency: latency.mark("stick")
 			
 			# Check gyro
 			if controller.getGyroEnabled():
-				self.profile.gyro.gyro(self, sci.gpitch, sci.gyaw, sci.groll, sci.q1, sci.q2, sci.q3, sci.q4)
+				action = profile.gyro
+				if action:
+					handler = handlers.get(action) or get_handler("gyro", None)
+					handler(self, sci.gpitch, sci.gyaw, sci.groll, sci.q1, sci.q2, sci.q3, sci.q4)
+			if latency: latency.mark("gyro")
 			
 			# Check triggers
 			if FE_TRIGGER in fe or sci.ltrig != self.old_state.ltrig:
-				if LEFT in self.profile.triggers:
-					self.profile.triggers[LEFT].trigger(self, sci.ltrig, self.old_state.ltrig)
+				action = profile.triggers.get(LEFT)
+				if action:
+					handler = handlers.get(action) or get_handler("triggers", LEFT)
+					handler(self, sci.ltrig, self.old_state.ltrig)
 			if FE_TRIGGER in fe or sci.rtrig != self.old_state.rtrig:
-				if RIGHT in self.profile.triggers:
-					self.profile.triggers[RIGHT].trigger(self, sci.rtrig, self.old_state.rtrig)
+				action = profile.triggers.get(RIGHT)
+				if action:
+					handler = handlers.get(action) or get_handler("triggers", RIGHT)
+					handler(self, sci.rtrig, self.old_state.rtrig)
+			if latency: latency.mark("triggers")
 			
 			# Check pads
 			if FE_PAD in fe or self.buttons & SCButtons.RPADTOUCH or SCButtons.RPADTOUCH & btn_rem:
 				# RPAD
-				self.profile.pads[RIGHT].whole(self, sci.rpad_x, sci.rpad_y, RIGHT)
+				action = profile.pads[RIGHT]
+				if action:
+					handler = handlers.get(action) or get_handler("pads", RIGHT)
+					handler(self, sci.rpad_x, sci.rpad_y, RIGHT)
 			
 			if (FE_PAD in fe and self.buttons & SCButtons.LPADTOUCH) or self.buttons & SCButtons.LPADTOUCH or SCButtons.LPADTOUCH & btn_rem:
 				# LPAD
-				self.profile.pads[LEFT].whole(self, sci.lpad_x, sci.lpad_y, LEFT)
+				action = profile.pads[LEFT]
+				if action:
+					handler = handlers.get(action) or get_handler("pads", LEFT)
+					handler(self, sci.lpad_x, sci.lpad_y, LEFT)
+			if latency: latency.mark("pads")
 		except Exception, e:
 			# Log error but don't crash here, it breaks too many things at once
 			log.error("Error while processing controller event")
 			log.error(traceback.format_exc())
 		
-		if len(self.scheduled_tasks) > 0 and self.scheduled_tasks[0][0] <= now:
-			cb = self.scheduled_tasks[0][1]
-			self.scheduled_tasks = self.scheduled_tasks[1:]
-			cb(self)
+		if self.scheduled_tasks and self.scheduled_tasks[0][0] <= now:
+			self.run_scheduled(now)
+		if latency: latency.mark("scheduled")
 		
+		self._in_callback = False
+		if self._next_profile is not None:
+			self._swap_profile(self._next_profile)
+			self._next_profile = None
 		
 		# Generate events - keys
 		if len(self.keypress_list):
@@ -257,32 +446,29 @@ class Mapper(object):
 		mx, my = self._get_mouse_movement(0), self._get_mouse_movement(1)
 		wx, wy = self._get_mouse_movement(2), self._get_mouse_movement(3)
 		if mx != 0 or my != 0:
-			self.travelled[0] += self.mouse.moveEvent(mx, my * -1, False)
+			self.travelled[0] += self.mouse.moveEvent(mx, my * -1, False, now)
 			self.syn_list.add(self.mouse)
 			self.mouse_movements[0] = self.mouse_movements[1] = None
 		if wx != 0 or wy != 0:
-			if self.mouse.scrollEvent(wx, wy, False):
+			if self.mouse.scrollEvent(wx, wy, False, now):
 				# Returns True
 				self.travelled[1] += 500
 			self.syn_list.add(self.mouse)
 			self.mouse_movements[2] = self.mouse_movements[3] = None
 		# Generate events - trackball
 		if self.mouse_tb[0]:
-			dist = self.mouse.moveEvent(0, 0, True)
+			self.travelled[0] += self.mouse.moveEvent(0, 0, True, now)
 			self.syn_list.add(self.mouse)
-			if dist:
-				self.travelled[0] += dist
-			else:
+			if not self.mouse.isMoving():
 				self.mouse_tb[0] = False
 				self.mouse_feedback[0] = None
 		
 		if self.mouse_tb[1]:
-			dist = self.mouse.scrollEvent(0, 0, True)
-			self.syn_list.add(self.mouse)
-			if dist:
+			if self.mouse.scrollEvent(0, 0, True, now):
 				# scrollEvent returns True, not number
 				self.travelled[1] += 500
-			else:
+			self.syn_list.add(self.mouse)
+			if not self.mouse.isScrolling():
 				self.mouse_tb[1] = False
 				self.mouse_feedback[1] = None
 		
@@ -292,6 +478,7 @@ class Mapper(object):
 				if self.travelled[i] > self.mouse_feedback[i].frequency:
 					self.travelled[i] = 0
 					self.send_feedback(self.mouse_feedback[i])
-		
+		if latency: latency.mark("emit")
 		
 		self.sync()
+		if latency: latency.end()
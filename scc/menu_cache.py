@@ -0,0 +1,82 @@
+#!/usr/bin/env python2
+"""
+SC-Controller - Menu Cache
+
+Keeps menus loaded from .menu files, so daemon doesn't have to read and
+parse menu file every time when item is selected from it.
+
+Every cached menu is remembered together with modification time and size of
+its file and loaded again when file changes. Checking is done when menu is
+looked up before displaying it, so by the time when item is selected, menu
+is already loaded and up to date. Only SIZE most recently used menus are
+kept and menu is forgotten as soon as its file is found to be removed.
+"""
+from __future__ import unicode_literals
+
+from scc.paths import get_menus_path, get_default_menus_path
+from scc.parser import TalkingActionParser
+from scc.menu_data import MenuData
+
+from collections import OrderedDict
+import os, json, logging
+log = logging.getLogger("MenuCache")
+
+
+class MenuCache(object):
+	SIZE = 32		# Number of menus kept loaded
+
+	def __init__(self):
+		self.paths = ( get_menus_path(), get_default_menus_path() )
+		self._menus = OrderedDict()		# filename -> (stat, MenuData), last is newest
+
+
+	def find(self, menu_id):
+		"""
+		Returns filename of menu file with given name or None if not found.
+		If menu with same name exists in both directories, default one
+		is used.
+		"""
+		for path in reversed(self.paths):
+			filename = os.path.join(path, menu_id)
+			if os.path.exists(filename):
+				return filename
+		return None
+
+
+	def _stat(self, filename):
+		try:
+			st = os.stat(filename)
+			return st.st_mtime, st.st_size
+		except OSError:
+			return None
+
+
+	def get(self, filename):
+		"""
+		Returns MenuData loaded from 'filename', loading it if it's not
+		cached yet or if file was changed since it was loaded.
+
+		Throws IOError or ValueError if file cannot be read or decoded.
+		"""
+		stat = self._stat(filename)
+		cached = self._menus.pop(filename, None)
+		if cached is not None and cached[0] == stat:
+			self._menus[filename] = cached
+			return cached[1]
+		data = json.loads(open(filename, "r").read())
+		menu = MenuData.from_json_data(data, TalkingActionParser())
+		self._menus[filename] = stat, menu
+		if len(self._menus) > self.SIZE:
+			self._menus.popitem(last=False)
+		return menu
+
+
+	def get_cached(self, filename):
+		"""
+		As get(), but returns already cached menu without checking if
+		file was changed. Used when item is selected from displayed menu,
+		which was checked when it was being displayed.
+		"""
+		if filename in self._menus:
+			return self._menus[filename][1]
+		return self.get(filename)
@@ -13,6 +13,7 @@ class MenuData(object):
 	""" Contains list of menu items. Indexable """
 	def __init__(self):
 		self.__items = []
+		self.__index = {}	# id -> item
 	
 	
 	def __len__(self):
@@ -37,10 +38,16 @@ class MenuData(object):
 		Returns item with specified ID.
 		Throws KeyError if there is no such item.
 		"""
-		for a in self:
-			if a.id == id:
-				return a
-		raise KeyError("No such item")
+		try:
+			return self.__index[id]
+		except KeyError:
+			raise KeyError("No such item")
+	
+	
+	def __add(self, item):
+		self.__items.append(item)
+		# If IDs are duplicated, first item wins
+		self.__index.setdefault(item.id, item)
 	
 	
 	def index(self, a):
@@ -51,7 +58,10 @@ class MenuData(object):
 		""" Returns menu data as dict storable in json (profile) file """
 		rv = []
 		for i in self:
-			if i.action:
+			if i._data is not None:
+				# Not parsed yet, no need to do it just to save it back
+				item_data = dict(i._data)
+			elif i.action:
 				item_data = i.action.encode()
 			else:
 				item_data = {}
@@ -81,26 +91,37 @@ class MenuData(object):
 		# Parse data
 		m = MenuData()
 		for id, label in data:
-			m.__items.append(MenuItem(id, label))
+			m.__add(MenuItem(id, label))
 		return m
 	
 	
+	def set_action_parser(self, action_parser):
+		"""
+		Sets parser used by items which actions were not parsed yet.
+		Used when menu is recreated from profile cache.
+		"""
+		for i in self.__items:
+			if i._data is not None:
+				i._parser = action_parser
+	
+	
 	@staticmethod
 	def from_json_data(data, action_parser=None):
 		"""
 		Loads menu from parsed JSON dict.
 		Actions are parsed only if action_parser is set to ActionParser instance.
+		Parsing is postponed until action of item is accessed for first time.
 		"""
 		m = MenuData()
 		for i in data:
 			if "id" not in i:
 				# Cannot add menu without ID
 				continue
-			action = None
-			if action_parser:
-				action = action_parser.from_json_data(i)
 			label = i["name"] if "name" in i else i["id"]
-			m.__items.append(MenuItem(i["id"], label, action))
+			item = MenuItem(i["id"], label)
+			if action_parser:
+				item._data, item._parser = i, action_parser
+			m.__add(item)
 		
 		return m
 	
@@ -125,9 +146,32 @@ class MenuData(object):
 
 
 class MenuItem(object):
-	""" Really just dummy container """
+	"""
+	Really just dummy container.
+	
+	If created by MenuData.from_json_data, action is parsed from JSON data
+	only when it's accessed for first time.
+	"""
+	_parser = None
+	
 	def __init__(self, id, label, action=None):
 		self.id = id
 		self.label = label
-		self.action = action
+		self._action = action
+		self._data = None	# JSON data of action that was not parsed yet
 		self.widget = None	# May be set by UI code
+	
+	
+	def get_action(self):
+		if self._data is not None:
+			self._action = self._parser.from_json_data(self._data)
+			self._data, self._parser = None, None
+		return self._action
+	
+	
+	def set_action(self, action):
+		self._action = action
+		self._data, self._parser = None, None
+	
+	
+	action = property(get_action, set_action)
@@ -128,6 +128,29 @@ class ClickModifier(Modifier):
 		if mapper.was_pressed(SCButtons.RPAD):
 			# Just released
 			return self.action.whole(mapper, 0, 0, what)
+	
+	
+	def compile(self, event):
+		if event in ("button_press", "button_release", "trigger"):
+			# These are just passed to child action
+			return self.action.compile(event)
+		if event != "whole":
+			return Modifier.compile(self, event)
+		child = self.action.compile("whole")
+		
+		def whole(mapper, x, y, what):
+			# Same as whole() above
+			if what in (STICK, LEFT):
+				if mapper.buttons & SCButtons.LPAD:
+					if what == STICK: mapper.force_event.add(FE_STICK)
+					return child(mapper, x, y, what)
+				if mapper.old_buttons & SCButtons.LPAD:
+					return child(mapper, 0, 0, what)
+			if mapper.buttons & SCButtons.RPAD:
+				return child(mapper, x, y, what)
+			if mapper.old_buttons & SCButtons.RPAD:
+				return child(mapper, 0, 0, what)
+		return whole
 
 
 class ModeModifier(Modifier):
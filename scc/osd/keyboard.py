@@ -151,7 +151,8 @@ class Keyboard(OSDWindow, TimerManager):
 	
 	
 	def run(self):
-		self.daemon = DaemonManager()
+		# Binary protocol, as pad events are received at high rate
+		self.daemon = DaemonManager(binary=True)
 		self._cononect_handlers()
 		OSDWindow.run(self)
 	
@@ -182,7 +182,8 @@ class Menu(OSDWindow, TimerManager):
 	
 	
 	def run(self):
-		self.daemon = DaemonManager()
+		# Binary protocol, as pad events are received at high rate
+		self.daemon = DaemonManager(binary=True)
 		self._cononect_handlers()
 		OSDWindow.run(self)
 	
@@ -6,7 +6,6 @@ Parses action(s) expressed as string or in dict loaded from json file into
 one or more Action instances.
 """
 from __future__ import unicode_literals
-from tokenize import generate_tokens, TokenError
 from collections import namedtuple
 
 from scc.constants import SCButtons, HapticPos, PITCH, YAW, ROLL
@@ -18,10 +17,63 @@ from scc.uinput import Keys, Axes, Rels
 from scc.macros import Macro
 
 import token as TokenType
-import sys
+import sys, re
 
 
-class ParseError(Exception): pass
+class ParseError(Exception):
+	"""
+	Raised when action cannot be parsed. 'column' is offset in parsed
+	string where error was found, or None if it's not known.
+	"""
+	def __init__(self, message, column=None):
+		if column is not None:
+			message = "%s (at column %s)" % (message, column + 1)
+		Exception.__init__(self, message)
+		self.column = column
+
+
+Token = namedtuple('Token', 'type value column')
+_new_token = tuple.__new__
+
+# Single regular expression matching any token of action language. Only one
+# group matches; its index, looked up in _TOKEN_GROUPS, is type of token.
+_TOKEN_RE = re.compile(r"""
+	[ \t\r\f]*(?:
+		([A-Za-z_][A-Za-z0-9_]*)					# NAME
+		|(0[xX][0-9a-fA-F]+|0[bB][01]+
+			|(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:[eE][-+]?[0-9]+)?)	# NUMBER
+		|("(?:[^"\\\n]|\\.)*"|'(?:[^'\\\n]|\\.)*')		# STRING
+		|([(),.;-])								# OP
+		|(\n)									# NEWLINE
+		|(\Z)									# end of string
+	)""", re.VERBOSE)
+_TOKEN_GROUPS = ( None, TokenType.NAME, TokenType.NUMBER, TokenType.STRING,
+	TokenType.OP, TokenType.NEWLINE, TokenType.ENDMARKER )
+
+
+def tokenize(string):
+	"""
+	Generates Token tuples for string in action language. Whitespace other
+	than newline is skipped. Raises ParseError on first character that
+	cannot start token.
+	"""
+	# scanner().match continues where previous match ended and returns
+	# None on first character that doesn't start any token
+	match, ENDMARKER = _TOKEN_RE.scanner(string).match, TokenType.ENDMARKER
+	pos = 0
+	while True:
+		m = match()
+		if m is None:
+			pos = len(string) - len(string[pos:].lstrip(" \t\r\f"))
+			if string[pos] in "'\"":
+				raise ParseError("Unterminated string", pos)
+			raise ParseError("Unexpected '%s'" % (string[pos],), pos)
+		type = _TOKEN_GROUPS[m.lastindex]
+		if type == ENDMARKER:
+			return
+		start, pos = m.span(m.lastindex)
+		# tuple.__new__ skips argument processing done by Token()
+		yield _new_token(Token, (type, string[start:pos], start))
 
 
 def build_action_constants():
@@ -55,8 +107,6 @@ class ActionParser(object):
 			error = ap.get_error()
 			# do something with error
 	"""
-	Token = namedtuple('Token', 'type value')
-	
 	CONSTS = build_action_constants()
 	
 	
@@ -88,11 +138,11 @@ class ActionParser(object):
 			y = self.from_json_data(data["Y"]) if "Y" in data else NoAction()
 			a = XYAction(x, y)
 		if "sensitivity" in data:
-			args = data["sensitivity"]
+			args = list(data["sensitivity"])
 			args.append(a)
 			a = SensitivityModifier(*args)
 		if "feedback" in data:
-			args = data["feedback"]
+			args = list(data["feedback"])
 			if hasattr(HapticPos, args[0]):
 				args[0] = getattr(HapticPos, args[0])
 			args.append(a)
@@ -121,17 +171,13 @@ class ActionParser(object):
 		Restarts parsing with new string
 		Returns self for chaining.
 		"""
-		
 		try:
-			self.tokens = [
-				ActionParser.Token(type, string)
-				for (type, string, trash, trash, trash)
-				in generate_tokens( iter([string]).next )
-				if type != TokenType.ENDMARKER
-			]
-		except TokenError:
-			self.tokens = None
+			self.tokens = tuple(tokenize(string))
+		except ParseError, e:
+			# Raised when parse() is called
+			self.tokens = e
 		self.index = 0
+		self.length = len(string)
 		return self
 	
 	
@@ -156,7 +202,7 @@ class ActionParser(object):
 		t = self._next_token()
 		while t.type == TokenType.NEWLINE or t.value == "\n":
 			if not self._tokens_left():
-				raise ParseError("Expected parameter at end of string")
+				raise ParseError("Expected parameter at end of string", self.length)
 			t = self._next_token()
 		
 		if t.type == TokenType.NAME:
@@ -168,24 +214,24 @@ class ActionParser(object):
 			else:
 				# Constant
 				if not t.value in ActionParser.CONSTS:
-					raise ParseError("Expected parameter, got '%s' which is not defined" % (t.value,))
+					raise ParseError("Expected parameter, got '%s' which is not defined" % (t.value,), t.column)
 				parameter = ActionParser.CONSTS[t.value]
 			
 			# Check for dots
 			while self._tokens_left() and self._peek_token().type == TokenType.OP and self._peek_token().value == '.':
 				self._next_token()
 				if not self._tokens_left():
-					raise ParseError("Expected NAME after '.'")
+					raise ParseError("Expected NAME after '.'", self.length)
 				
 				t = self._next_token()
 				if not hasattr(parameter, t.value):
-					raise ParseError("%s has no attribute '%s'" % (parameter, t.value,))
+					raise ParseError("%s has no attribute '%s'" % (parameter, t.value,), t.column)
 				parameter = getattr(parameter, t.value)
 			return parameter
 		
 		if t.type == TokenType.OP and t.value == "-":
 			if not self._tokens_left() or self._peek_token().type != TokenType.NUMBER:
-				raise ParseError("Expected number after '-'")
+				raise ParseError("Expected number after '-'", t.column + 1)
 			return - self._parse_number()
 		
 		if t.type == TokenType.NUMBER:
@@ -195,13 +241,13 @@ class ActionParser(object):
 		if t.type == TokenType.STRING:
 			return t.value[1:-1].decode('string_escape')
 		
-		raise ParseError("Expected parameter, got '%s'" % (t.value,))
+		raise ParseError("Expected parameter, got '%s'" % (t.value,), t.column)
 
 
 	def _parse_number(self):
 		t = self._next_token()
 		if t.type != TokenType.NUMBER:
-			raise ParseError("Expected number, got '%s'" % (t.value,))
+			raise ParseError("Expected number, got '%s'" % (t.value,), t.column)
 		if "." in t.value:
 			return float(t.value)
 		elif "e" in t.value.lower():
@@ -219,7 +265,7 @@ class ActionParser(object):
 		# Check and skip over '('
 		t = self._next_token()
 		if t.type != TokenType.OP or t.value != '(':
-			raise ParseError("Expected '(' of parameter list, got '%s'" % (t.value,))
+			raise ParseError("Expected '(' of parameter list, got '%s'" % (t.value,), t.column)
 
 		parameters = []
 		while self._tokens_left():
@@ -232,32 +278,35 @@ class ActionParser(object):
 			# Parse one parameter
 			parameters.append(self._parse_parameter())
 			# Check if next token is either ')' or ','
+			if not self._tokens_left():
+				break
 			t = self._peek_token()
 			while t.type == TokenType.NEWLINE or t.value == "\n":
 				self._next_token()
 				if not self._tokens_left():
-					raise ParseError("Expected ',' or end of parameter list after parameter '%s'" % (parameters[-1],))
+					raise ParseError("Expected ',' or end of parameter list after parameter '%s'" % (parameters[-1],), self.length)
 				t = self._peek_token()
 			if t.type == TokenType.OP and t.value == ')':
 				pass
 			elif t.type == TokenType.OP and t.value == ',':
 				self._next_token()
 			else:
-				raise ParseError("Expected ',' or end of parameter list after parameter '%s'" % (parameters[-1],))
+				raise ParseError("Expected ',' or end of parameter list after parameter '%s'" % (parameters[-1],), t.column)
 
 
 		# Code shouldn't reach here, unless there is not closing ')' in parameter list
-		raise ParseError("Unmatched parenthesis")
+		raise ParseError("Unmatched parenthesis", self.length)
 	
 	
-	def _create_action(self, cls, *pars):
+	def _create_action(self, column, cls, *pars):
+		""" 'column' is position of action name, used in error message """
 		try:
 			return cls(*pars)
 		except ValueError, e:
-			raise ParseError(unicode(e))
+			raise ParseError(unicode(e), column)
 		except TypeError, e:
 			print >>sys.stderr, e
-			raise ParseError("Invalid number of parameters for '%s'" % (cls.COMMAND))
+			raise ParseError("Invalid number of parameters for '%s'" % (cls.COMMAND), column)
 	
 	
 	def _parse_action(self):
@@ -270,16 +319,16 @@ class ActionParser(object):
 		# Check if next token is TokenType.NAME and grab action name from it
 		t = self._next_token()
 		if t.type != TokenType.NAME:
-			raise ParseError("Expected action name, got '%s'" % (t.value,))
+			raise ParseError("Expected action name, got '%s'" % (t.value,), t.column)
 		if t.value not in ACTIONS:
-			raise ParseError("Unknown action '%s'" % (t.value,))
-		action_name = t.value
+			raise ParseError("Unknown action '%s'" % (t.value,), t.column)
+		action_name, column = t.value, t.column
 		action_class = ACTIONS[action_name]
 		
 		# Check if there are any tokens left - return action without parameters
 		# if not
 		if not self._tokens_left():
-			return self._create_action(action_class)
+			return self._create_action(column, action_class)
 		
 		# Check if token after action name is parenthesis and if yes, parse
 		# parameters from it
@@ -288,7 +337,7 @@ class ActionParser(object):
 		if t.type == TokenType.OP and t.value == '(':
 			parameters  = self._parse_parameters()
 			if not self._tokens_left():
-				return self._create_action(action_class, *parameters)
+				return self._create_action(column, action_class, *parameters)
 			t = self._peek_token()
 		
 		# ... or, if it is one of ';', 'and' or 'or' and if yes, parse next action
@@ -296,8 +345,8 @@ class ActionParser(object):
 			# Two (or more) actions joined by 'and'
 			self._next_token()
 			if not self._tokens_left():
-				raise ParseError("Expected action after 'and'")
-			action1 = self._create_action(action_class, *parameters)
+				raise ParseError("Expected action after 'and'", self.length)
+			action1 = self._create_action(column, action_class, *parameters)
 			action2 = self._parse_action()
 			return MultiAction(action1, action2)
 		
@@ -306,12 +355,12 @@ class ActionParser(object):
 			self._next_token()
 			if not self._tokens_left():
 				# Newline at end of string is not error
-				return self._create_action(action_class, *parameters)
+				return self._create_action(column, action_class, *parameters)
 			t = self._peek_token()
 			if t.type == TokenType.OP and t.value in (')', ','):
 				# ')' starts next line
-				return self._create_action(action_class, *parameters)
-			action1 = self._create_action(action_class, *parameters)
+				return self._create_action(column, action_class, *parameters)
+			action1 = self._create_action(column, action_class, *parameters)
 			action2 = self._parse_action()
 			return MultiAction(action1, action2)
 		
@@ -322,12 +371,12 @@ class ActionParser(object):
 				self._next_token()
 			if not self._tokens_left():
 				# Having ';' at end of string is not actually error
-				return self._create_action(action_class, *parameters)
-			action1 = self._create_action(action_class, *parameters)
+				return self._create_action(column, action_class, *parameters)
+			action1 = self._create_action(column, action_class, *parameters)
 			action2 = self._parse_action()
 			return Macro(action1, action2)
 		
-		return self._create_action(action_class, *parameters)
+		return self._create_action(column, action_class, *parameters)
 	
 	
 	def parse(self):
@@ -335,11 +384,14 @@ class ActionParser(object):
 		Returns parsed action.
 		Throws ParseError if action cannot be parsed.
 		"""
-		if self.tokens == None:
-			raise ParseError("Syntax error")
+		if isinstance(self.tokens, ParseError):
+			raise self.tokens
+		if not self._tokens_left():
+			raise ParseError("Expected action", 0)
 		a = self._parse_action()
 		if self._tokens_left():
-			raise ParseError("Unexpected '%s'" % (self._next_token().value, ))
+			t = self._next_token()
+			raise ParseError("Unexpected '%s'" % (t.value, ), t.column)
 		return a
 
 
@@ -362,3 +414,68 @@ class TalkingActionParser(ActionParser):
 			return ActionParser.parse(self)
 		except ParseError, e:
 			print >>sys.stderr, "Warning: Failed to parse '%s':" % (self.string,), e
+
+
+def main():
+	"""
+	Benchmarks tokenizer and parser on all actions from profiles given
+	as arguments, or from all default profiles.
+	
+	Usage: python2 -m scc.parser [profile.sccprofile ...] [--repeat N]
+	"""
+	import os, json, time, argparse, tokenize as pytokenize
+	from scc.paths import get_default_profiles_path
+	from scc.profile import Profile
+	parser = argparse.ArgumentParser(description="Benchmarks action parser")
+	parser.add_argument('profile', type=str, nargs='*')
+	parser.add_argument('--repeat', type=int, default=100,
+		help="number of times every measurement is repeated (default: 100)")
+	args = parser.parse_args()
+	
+	files = args.profile
+	if not files:
+		path = os.path.normpath(os.path.join(os.path.split(__file__)[0], "../default_profiles"))
+		if not os.path.exists(path):
+			path = get_default_profiles_path()
+		files = sorted([ os.path.join(path, x) for x in os.listdir(path)
+			if x.endswith(".sccprofile") ])
+	
+	strings = []
+	def collect(data):
+		if isinstance(data, dict):
+			if isinstance(data.get("action"), basestring):
+				strings.append(data["action"])
+			for x in data.values(): collect(x)
+		elif isinstance(data, list):
+			for x in data: collect(x)
+	for filename in files:
+		collect(json.loads(open(filename, "r").read()))
+	
+	def measure(name, count, fn):
+		t = time.time()
+		for i in xrange(args.repeat):
+			fn()
+		t = time.time() - t
+		print "%-24s %10.2fus per %s" % (name + ":", t * 1000000.0 / args.repeat / count,
+			"action" if count == len(strings) else "profile")
+	
+	def python_tokenize():
+		for s in strings:
+			list(pytokenize.generate_tokens(iter([s]).next))
+	
+	def scanner():
+		for s in strings:
+			tuple(tokenize(s))
+	
+	def load():
+		for filename in files:
+			Profile(ActionParser()).load(filename)
+	
+	print "%s actions in %s profiles" % (len(strings), len(files))
+	measure("tokenize module", len(strings), python_tokenize)
+	measure("action scanner", len(strings), scanner)
+	measure("load", len(files), load)
+
+
+if __name__ == "__main__":
+	main()
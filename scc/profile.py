@@ -26,6 +26,11 @@ class Profile(object):
 	LPAD_AXES  = STICK_AXES
 	RPAD_AXES  = { X : "rpad_x", Y : "rpad_y" }
 	TRIGGERS   = [ LEFT, RIGHT ]
+	# Action method called for input of each attribute, except buttons
+	EVENTS     = { "stick" : "whole", "pads" : "whole", "triggers" : "trigger", "gyro" : "gyro" }
+	# If False, handlers are methods of actions, as they were before
+	# actions could be compiled. Used to test compiled handlers.
+	COMPILE    = True
 	
 	def __init__(self, parser):
 		self.parser = parser
@@ -35,6 +40,9 @@ class Profile(object):
 		self.triggers = { Profile.LEFT : NoAction(), Profile.RIGHT : NoAction() }
 		self.pads = { Profile.LEFT : NoAction(), Profile.RIGHT : NoAction() }
 		self.gyro = NoAction()
+		self.sources = None		# see get_binding_sources, set by load_data
+		self.handlers = {}		# action -> handler, see get_handler
+		self._compiled = {}		# (attribute, key) -> action with handler
 	
 	
 	def save(self, filename):
@@ -63,6 +71,11 @@ class Profile(object):
 	def load(self, filename):
 		""" Loads profile from file. Returns self """
 		data = json.loads(open(filename, "r").read())
+		return self.load_data(data)
+	
+	
+	def load_data(self, data):
+		""" Loads profile from already decoded JSON data. Returns self """
 		# Buttons
 		self.buttons = {}
 		for x in SCButtons:
@@ -107,9 +120,58 @@ class Profile(object):
 						raise ValueError("Invalid character '%s' in menu id '%s'" % (invalid_char, id))
 				self.menus[id] = MenuData.from_json_data(data["menus"][id], self.parser)
 		
+		self.sources = Profile.get_binding_sources(data)
 		return self
 	
 	
+	@staticmethod
+	def get_binding_sources(data):
+		"""
+		Returns JSON data of every action and menu in decoded profile file,
+		in dict keyed by (attribute, key) tuples, as used by get_binding.
+		Comparing these between two versions of same file shows which
+		bindings were changed.
+		"""
+		rv = { ("buttons", x) : data["buttons"].get(x.name) for x in SCButtons }
+		rv["stick", None] = data.get("stick")
+		rv["gyro", None] = data.get("gyro")
+		if "triggers" in data:
+			# Old format
+			for x in Profile.TRIGGERS:
+				rv["triggers", x] = data["triggers"].get(x)
+			rv["pads", Profile.LEFT] = data.get("left_pad")
+			rv["pads", Profile.RIGHT] = data.get("right_pad")
+		else:
+			rv["triggers", Profile.LEFT] = data.get("trigger_left")
+			rv["triggers", Profile.RIGHT] = data.get("trigger_right")
+			rv["pads", Profile.LEFT] = data.get("pad_left")
+			rv["pads", Profile.RIGHT] = data.get("pad_right")
+		for id in data.get("menus", {}):
+			rv["menus", id] = data["menus"][id]
+		return rv
+	
+	
+	def get_binding(self, attribute, key):
+		"""
+		Returns action (or menu) bound to key in given attribute ('buttons',
+		'triggers', 'pads' or 'menus'), or value of attribute ('stick' or
+		'gyro') if key is None. Returns None for menu that doesn't exist.
+		"""
+		if key is None:
+			return getattr(self, attribute)
+		return getattr(self, attribute).get(key)
+	
+	
+	def set_binding(self, attribute, key, value):
+		""" Reverse of get_binding. Setting menu to None removes it """
+		if key is None:
+			setattr(self, attribute, value)
+		elif value is None:
+			getattr(self, attribute).pop(key, None)
+		else:
+			getattr(self, attribute)[key] = value
+	
+	
 	def compress(self):
 		"""
 		Calls compress on every action to throw out some redundant stuff.
@@ -120,6 +182,52 @@ class Profile(object):
 				dct[x] = dct[x].compress()
 		self.stick = self.stick.compress()
 		self.gyro = self.gyro.compress()
+		self.compile()
+	
+	
+	def compile(self):
+		"""
+		Compiles every action into handler used by mapper to process input
+		instead of calling methods of action. See Action.compile.
+		Called by compress(), so profile is ready to be used right after
+		it's loaded.
+		"""
+		self.handlers, self._compiled = {}, {}
+		for x in SCButtons:
+			self.get_handler("buttons", x)
+		for x in (Profile.LEFT, Profile.RIGHT):
+			self.get_handler("triggers", x)
+			self.get_handler("pads", x)
+		self.get_handler("stick", None)
+		self.get_handler("gyro", None)
+	
+	
+	def get_handler(self, attribute, key):
+		"""
+		Returns handler compiled from action bound to (attribute, key),
+		see get_binding, or None if there is no action bound.
+		For 'buttons', handler is (press, release) tuple of callables.
+		
+		If COMPILE is False, methods of action are returned instead.
+		
+		Compiled handlers are stored in 'handlers' dict, keyed by action
+		(parser creates new action for every binding, so every action is
+		bound only once), so mapper can find them without calling this.
+		If binding was changed since, handler of new action is compiled.
+		"""
+		action = self.get_binding(attribute, key)
+		if not action:
+			return None
+		if action not in self.handlers:
+			# Handler of replaced action is not needed anymore
+			self.handlers.pop(self._compiled.get((attribute, key)), None)
+			compile = action.compile if self.COMPILE else lambda event : getattr(action, event)
+			if attribute == "buttons":
+				self.handlers[action] = (compile("button_press"), compile("button_release"))
+			else:
+				self.handlers[action] = compile(Profile.EVENTS[attribute])
+			self._compiled[attribute, key] = action
+		return self.handlers[action]
 	
 
 class Encoder(JSONEncoder):
@@ -0,0 +1,226 @@
+#!/usr/bin/env python2
+"""
+SC-Controller - Profile Cache
+
+Stores profiles in compiled form, so daemon doesn't have to decode JSON and
+parse every action again when same profile is loaded repeatedly.
+
+Cache file contains tree of already compressed actions and menus, encoded
+into nested tuples of basic types and stored with marshal. Only instances
+of known classes (actions, menus, haptic data and enums used as action
+parameters) can be stored and recreated, so unlike pickle, loading cache
+file can't be used to execute arbitrary code.
+
+Every cache file is keyed by hash of profile source, by FORMAT_VERSION and
+by version of installed code; if any doesn't match, profile is loaded from
+JSON and cache is rewritten.
+"""
+from __future__ import unicode_literals
+
+from scc.constants import SCButtons, HapticPos, SCStatus, SCPacketType
+from scc.uinput import Keys, KeysOnly, Axes, Rels
+from scc.paths import get_cache_path
+from scc.controller import HapticData
+from scc.menu_data import MenuData, MenuItem
+from scc.actions import Action, NoAction
+from scc.profile import Profile
+
+import scc.modifiers, scc.macros, scc.special_actions
+import scc.actions, scc.menu_data, scc.controller
+import os, sys, json, marshal, hashlib, logging
+log = logging.getLogger("ProfileCache")
+
+# Increase every time when anything in Action classes changes
+FORMAT_VERSION = 3
+MAGIC = b"SCCPROF"
+
+# Tags used in encoded data. Everything that is not tuple is stored as it is.
+T_TUPLE, T_LIST, T_DICT, T_SET, T_ENUM, T_OBJECT, T_REF, T_NOACTION = range(8)
+ENUMS = { x.__name__ : x for x in (SCButtons, HapticPos, SCStatus, SCPacketType,
+		Keys, KeysOnly, Axes, Rels) }
+PLAIN = (int, long, float, bool, str, unicode, type(None))
+# Attributes that are not stored and have to be set again after loading
+TRANSIENT = ( "_parser", )
+
+
+class CacheError(Exception): pass
+
+
+def _subclasses(cls):
+	rv = [ cls ]
+	for x in cls.__subclasses__():
+		rv += _subclasses(x)
+	return rv
+
+
+_known = None
+def _known_classes():
+	""" Returns dict of all classes which instances can be stored in cache """
+	global _known
+	if _known is None:
+		_known = { "%s.%s" % (x.__module__, x.__name__) : x
+			for x in _subclasses(Action) + [ MenuData, MenuItem, HapticData ] }
+	return _known
+
+
+class Encoder(object):
+	""" Converts object tree to nested tuples that marshal can store """
+
+	def __init__(self):
+		self.classes = { v : k for (k, v) in _known_classes().items() }
+		self.memo = {}		# id(object) -> index in order of encoding
+		self.keep = []		# keeps memoized objects alive while encoding
+
+
+	def encode(self, value):
+		t = type(value)
+		if t in PLAIN:
+			return value
+		if t.__name__ in ENUMS and ENUMS[t.__name__] is t:
+			return (T_ENUM, t.__name__, value.name)
+		if t is tuple:
+			return (T_TUPLE, tuple([ self.encode(x) for x in value ]))
+		if value is NoAction():
+			return (T_NOACTION,)
+
+		# Everything else is mutable and may be referenced from multiple places
+		if id(value) in self.memo:
+			return (T_REF, self.memo[id(value)])
+		self.memo[id(value)] = len(self.memo)
+		self.keep.append(value)
+		if t is list:
+			return (T_LIST, tuple([ self.encode(x) for x in value ]))
+		if t is set:
+			return (T_SET, tuple([ self.encode(x) for x in value ]))
+		if t is dict:
+			return (T_DICT, tuple([ (self.encode(k), self.encode(v))
+				for (k, v) in value.items() ]))
+		if t in self.classes:
+			return (T_OBJECT, self.classes[t], tuple([ (k, self.encode(v))
+				for (k, v) in value.__dict__.items() if k not in TRANSIENT ]))
+		raise CacheError("Cannot store %s" % (t,))
+
+
+class Decoder(object):
+	""" Reverses what Encoder does """
+
+	def __init__(self):
+		self.classes = _known_classes()
+		self.memo = []
+
+
+	def decode(self, value):
+		if type(value) is not tuple:
+			return value
+		tag = value[0]
+		if tag == T_OBJECT:
+			cls = self.classes[value[1]]
+			obj = object.__new__(cls)
+			self.memo.append(obj)
+			d = obj.__dict__
+			for k, v in value[2]:
+				d[k] = self.decode(v)
+			return obj
+		if tag == T_ENUM:
+			return ENUMS[value[1]]._member_map_[value[2]]
+		if tag == T_TUPLE:
+			return tuple([ self.decode(x) for x in value[1] ])
+		if tag == T_NOACTION:
+			return NoAction()
+		if tag == T_REF:
+			return self.memo[value[1]]
+		if tag == T_LIST:
+			rv = []
+			self.memo.append(rv)
+			rv.extend([ self.decode(x) for x in value[1] ])
+			return rv
+		if tag == T_DICT:
+			rv = {}
+			self.memo.append(rv)
+			for k, v in value[1]:
+				rv[self.decode(k)] = self.decode(v)
+			return rv
+		if tag == T_SET:
+			rv = set()
+			self.memo.append(rv)
+			rv.update([ self.decode(x) for x in value[1] ])
+			return rv
+		raise CacheError("Invalid tag %s" % (tag,))
+
+
+_code_version = None
+def _get_code_version():
+	"""
+	Returns string identifying installed version of modules which classes
+	are stored in cache. There is no version number that would change with
+	every upgrade, so it's computed from size and mtime of those modules.
+	"""
+	global _code_version
+	if _code_version is None:
+		h = hashlib.sha1()
+		for m in (scc.actions, scc.modifiers, scc.macros, scc.special_actions,
+				scc.menu_data, scc.controller, sys.modules[__name__]):
+			try:
+				st = os.stat(m.__file__)
+				h.update(("%s %s %s;" % (m.__name__, st.st_size, st.st_mtime)).encode("utf-8"))
+			except (OSError, AttributeError):
+				h.update(m.__name__.encode("utf-8"))
+		_code_version = h.hexdigest()
+	return _code_version
+
+
+# Attributes of Profile that are stored in cache
+FIELDS = ( "buttons", "triggers", "pads", "stick", "gyro", "menus", "sources" )
+
+
+def get_cache_filename(filename):
+	""" Returns path to cache file for profile stored in 'filename' """
+	key = hashlib.sha1(os.path.abspath(filename).encode("utf-8")).hexdigest()
+	return os.path.join(get_cache_path(), "profiles", key + ".bin")
+
+
+def load_profile(filename, parser):
+	"""
+	Returns compressed Profile loaded from 'filename', using compiled cache
+	if it's available and up to date. If it's not, profile is parsed and
+	cache is updated.
+
+	Throws same exceptions as Profile.load.
+	"""
+	source = open(filename, "rb").read()
+	key = hashlib.sha1(source).hexdigest()
+	cache_filename = get_cache_filename(filename)
+	p = Profile(parser)
+
+	try:
+		data = marshal.loads(open(cache_filename, "rb").read())
+		if data[0:5] == (MAGIC, FORMAT_VERSION, sys.hexversion, _get_code_version(), key):
+			decoder = Decoder()
+			for name, value in zip(FIELDS, data[5]):
+				setattr(p, name, decoder.decode(value))
+			for menu in p.menus.values():
+				menu.set_action_parser(parser)
+			# Handlers are not cached, they are compiled as after compress()
+			p.compile()
+			return p
+	except IOError:
+		# Not cached yet
+		pass
+	except Exception, e:
+		log.warning("Failed to load cached profile %s: %s", filename, e)
+
+	p.load_data(json.loads(source)).compress()
+	try:
+		encoder = Encoder()
+		data = (MAGIC, FORMAT_VERSION, sys.hexversion, _get_code_version(), key,
+			tuple([ encoder.encode(getattr(p, name)) for name in FIELDS ]))
+		if not os.path.exists(os.path.dirname(cache_filename)):
+			os.makedirs(os.path.dirname(cache_filename))
+		# Written to temporary file first, so another process
+		# never reads half-written cache
+		tmp = "%s.%s.tmp" % (cache_filename, os.getpid())
+		open(tmp, "wb").write(marshal.dumps(data))
+		os.rename(tmp, cache_filename)
+	except Exception, e:
+		log.warning("Failed to store cached profile %s: %s", filename, e)
+	return p
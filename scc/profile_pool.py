@@ -0,0 +1,187 @@
+#!/usr/bin/env python2
+"""
+SC-Controller - Profile Pool
+
+Keeps loaded and compressed profiles ready, so switching to profile using
+'profile' action doesn't have to wait for file to be read and parsed.
+
+Pool indexes user and default profile directories, re-indexing them when
+their modification time changes, and keeps one spare Profile instance for
+explicitly pinned profiles, for recently used profiles and for profiles
+that recently used profiles can switch to. Spare instance is handed out
+and replaced by new one, as actions keep their state and every mapper needs
+its own instance. Spare instances are loaded only while event loop is idle,
+so loading them never delays processing of controller input.
+"""
+from __future__ import unicode_literals
+
+from scc.paths import get_profiles_path, get_default_profiles_path
+from scc.special_actions import ChangeProfileAction
+from scc.profile_cache import load_profile
+from scc.parser import TalkingActionParser
+from scc.actions import Action
+from scc.menu_data import MenuData, MenuItem
+
+from collections import OrderedDict
+import os, logging
+log = logging.getLogger("ProfilePool")
+
+
+def referenced_profiles(profile):
+	"""
+	Returns set of names of profiles that can be loaded using 'profile'
+	action from given profile.
+	"""
+	rv, seen = set(), set()
+	def walk(value):
+		if isinstance(value, (list, tuple, set)):
+			for x in value: walk(x)
+		elif isinstance(value, dict):
+			for x in value.values(): walk(x)
+		elif isinstance(value, (Action, MenuData, MenuItem)):
+			if id(value) in seen:
+				return
+			seen.add(id(value))
+			if isinstance(value, ChangeProfileAction):
+				rv.add(value.profile)
+			# Menu items that were not parsed yet are skipped, parsing
+			# them here would defeat purpose of parsing them lazily
+			walk(value.__dict__.values())
+	walk([ profile.buttons, profile.triggers, profile.pads, profile.stick,
+		profile.gyro, profile.menus ])
+	return rv
+
+
+class ProfilePool(object):
+	SIZE = 8		# Number of not pinned profiles kept ready
+	IDLE_TIME = 1.0	# Seconds without any input before spare profile is loaded
+
+	def __init__(self, loop):
+		self.loop = loop
+		self.paths = ( get_profiles_path(), get_default_profiles_path() )
+		self._mtimes = {}				# directory -> mtime when indexed
+		self._index = {}				# profile name -> filename
+		self._ready = {}				# filename -> (stat, Profile)
+		self._links = {}				# filename -> names of referenced profiles
+		self._failed = {}				# filename -> stat when loading failed
+		self._recent = OrderedDict()	# recently used filenames, last is newest
+		self._pinned = set()
+		self._timer = None
+
+
+	def _check_index(self):
+		""" Re-indexes profile directories if any of them was changed """
+		mtimes = {}
+		for path in self.paths:
+			try:
+				mtimes[path] = os.stat(path).st_mtime
+			except OSError:
+				mtimes[path] = None
+		if mtimes != self._mtimes:
+			self._mtimes = mtimes
+			self._index = {}
+			# Profiles in user directory override default ones
+			for path in reversed(self.paths):
+				try:
+					names = os.listdir(path)
+				except OSError:
+					continue
+				for x in names:
+					if x.endswith(".sccprofile") and not x.startswith("."):
+						self._index[x[0:-len(".sccprofile")]] = os.path.join(path, x)
+
+
+	def find(self, name):
+		""" Returns filename of profile with given name or None if not found """
+		self._check_index()
+		return self._index.get(name)
+
+
+	def get(self, filename):
+		"""
+		Returns compressed Profile loaded from 'filename'. If there is spare
+		instance ready and file was not changed since it was loaded, it's
+		returned immediately. Otherwise, profile is loaded.
+
+		Throws same exceptions as Profile.load.
+		"""
+		ready = self._ready.pop(filename, None)
+		if ready is not None and ready[0] == self._stat(filename):
+			p = ready[1]
+		else:
+			p = load_profile(filename, TalkingActionParser())
+		if filename in self._recent:
+			del self._recent[filename]
+		self._recent[filename] = True
+		if len(self._recent) > self.SIZE:
+			self._recent.popitem(last=False)
+		self._schedule()
+		return p
+
+
+	def pin(self, filename):
+		""" Keeps spare instance of profile ready until unpin() is called """
+		self._pinned.add(filename)
+		self._schedule()
+
+
+	def unpin(self, filename):
+		self._pinned.discard(filename)
+		self._schedule()
+
+
+	def _stat(self, filename):
+		try:
+			st = os.stat(filename)
+			return st.st_mtime, st.st_size
+		except OSError:
+			return None
+
+
+	def _wanted(self):
+		""" Returns list of filenames which should have spare instance ready """
+		rv = list(self._pinned)
+		for filename in reversed(self._recent.keys()):
+			for x in [ filename ] + [ self.find(name) for name in self._links.get(filename, ()) ]:
+				if x is not None and x not in rv:
+					rv.append(x)
+		return rv[0:len(self._pinned) + self.SIZE]
+
+
+	def _schedule(self):
+		if self._timer is None:
+			self._timer = self.loop.schedule(0, self._refill)
+
+
+	def _refill(self):
+		"""
+		Loads one missing or outdated spare profile and schedules itself
+		again if there is more to load, so event loop is never blocked
+		for long. If loop is not idle, loading is postponed.
+		"""
+		idle = self.loop.get_idle_time()
+		if idle < self.IDLE_TIME:
+			self._timer = self.loop.schedule(self.IDLE_TIME - idle, self._refill)
+			return
+		self._timer = None
+		wanted = self._wanted()
+		for filename in self._ready.keys():
+			if filename not in wanted:
+				del self._ready[filename]
+		for filename in wanted:
+			stat = self._stat(filename)
+			if self._failed.get(filename, False) == stat:
+				# Don't try again until file is changed
+				continue
+			if filename not in self._ready or self._ready[filename][0] != stat:
+				try:
+					p = load_profile(filename, TalkingActionParser())
+				except Exception, e:
+					log.warning("Failed to preload profile %s: %s", filename, e)
+					self._failed[filename] = stat
+				else:
+					self._failed.pop(filename, None)
+					self._ready[filename] = stat, p
+					self._links[filename] = referenced_profiles(p)
+				self._schedule()
+				return
@@ -0,0 +1,152 @@
+#!/usr/bin/env python2
+"""
+SC-Controller - Profile Watcher
+
+Watches active profile files using inotify and reports which bindings were
+changed every time when one of them is saved, so daemon can swap only
+changed actions instead of reloading entire profile.
+
+Directories are watched instead of files, as most editors (and GUI) save
+files by writing new file and renaming it over old one.
+"""
+from __future__ import unicode_literals
+
+from scc.inotify import INotify, IN_CLOSE_WRITE, IN_MOVED_TO
+from scc.profile import Profile
+
+import os, json, logging
+log = logging.getLogger("PWatcher")
+
+
+class ProfileWatcher(object):
+	DELAY = 0.1		# Changes are processed after this delay, so file
+					# saved in multiple steps is not read half-written.
+	MASK = IN_CLOSE_WRITE | IN_MOVED_TO
+
+	def __init__(self, loop, callback):
+		"""
+		'callback' is called with (filename, data, changed) as arguments,
+		where 'data' is decoded JSON from changed file and 'changed' is list
+		of (attribute, key) tuples as used by Profile.get_binding.
+
+		Throws OSError if inotify is not available.
+		"""
+		self.loop = loop
+		self.callback = callback
+		self._inotify = INotify()
+		self._dirs = {}			# directory -> watch descriptor
+		self._wds = {}			# watch descriptor -> directory
+		self._files = {}		# filename -> binding sources or None until read
+		self._pending = set()
+		self._timer = None
+		loop.add_fd(self._inotify.fileno(), self._on_events)
+
+
+	def set_files(self, filenames, sources=None):
+		"""
+		Sets list of files to watch, replacing previous one.
+
+		'sources' may map some of filenames to binding sources of profile
+		that was actually loaded from them (see Profile.sources). File is
+		then compared with them soon, so change saved after profile was
+		loaded but before this call is not lost. Snapshot of other newly
+		watched files is read from them.
+		"""
+		filenames = set([ os.path.abspath(x) for x in filenames if x is not None ])
+		sources = { os.path.abspath(x) : sources[x] for x in (sources or {})
+			if sources[x] is not None }
+		for filename in set(self._files.keys()) - filenames:
+			del self._files[filename]
+			self._pending.discard(filename)
+		for filename in filenames:
+			if filename in sources:
+				self._files[filename] = sources[filename]
+				self._pending.add(filename)
+			elif filename not in self._files:
+				self._files[filename] = None
+				# Snapshot of current state is taken after profile is
+				# switched, so switching doesn't have to wait for it
+				self.loop.schedule(0, self._snapshot, filename)
+		if self._pending and self._timer is None:
+			self._timer = self.loop.schedule(ProfileWatcher.DELAY, self._process)
+
+		dirs = set([ os.path.dirname(x) for x in self._files ])
+		for path in set(self._dirs.keys()) - dirs:
+			wd = self._dirs.pop(path)
+			del self._wds[wd]
+			self._inotify.rm_watch(wd)
+		for path in dirs - set(self._dirs.keys()):
+			try:
+				wd = self._inotify.add_watch(path, ProfileWatcher.MASK)
+			except OSError, e:
+				log.warning("Cannot watch %s: %s", path, e)
+				continue
+			self._dirs[path] = wd
+			self._wds[wd] = path
+
+
+	def is_watched(self, filename):
+		""" Returns True if changes of given file are being watched """
+		filename = os.path.abspath(filename)
+		return filename in self._files and os.path.dirname(filename) in self._dirs
+
+
+	def check(self, filename):
+		"""
+		Compares file with its last known state right away, without waiting
+		for inotify event. Changes found are passed to callback before this
+		method returns.
+		"""
+		filename = os.path.abspath(filename)
+		if filename not in self._files:
+			return
+		self._pending.add(filename)
+		if self._timer is not None:
+			self._timer.cancel()
+		self._process()
+
+
+	def _read(self, filename):
+		""" Returns (data, binding sources) or (None, None) on failure """
+		try:
+			data = json.loads(open(filename, "r").read())
+			return data, Profile.get_binding_sources(data)
+		except Exception, e:
+			log.warning("Failed to read %s: %s", filename, e)
+			return None, None
+
+
+	def _snapshot(self, filename):
+		if filename in self._files and self._files[filename] is None:
+			self._files[filename] = self._read(filename)[1]
+
+
+	def _on_events(self, fd, events):
+		for wd, mask, name in self._inotify.read_events():
+			if wd in self._wds and name is not None:
+				filename = os.path.join(self._wds[wd], name)
+				if filename in self._files:
+					self._pending.add(filename)
+		if self._pending and self._timer is None:
+			self._timer = self.loop.schedule(ProfileWatcher.DELAY, self._process)
+
+
+	def _process(self):
+		self._timer = None
+		pending, self._pending = self._pending, set()
+		for filename in pending:
+			if filename not in self._files:
+				continue
+			data, sources = self._read(filename)
+			if data is None:
+				# Invalid file is not applied, previous state is kept
+				continue
+			old, self._files[filename] = self._files[filename], sources
+			if old is None:
+				# Nothing to compare with, everything is considered changed
+				changed = sources.keys()
+			else:
+				changed = [ key for key in set(old.keys()) | set(sources.keys())
+					if old.get(key) != sources.get(key) ]
+			if changed:
+				self.callback(filename, data, changed)
@@ -0,0 +1,71 @@
+#!/usr/bin/env python2
+"""
+SC-Controller - Input Recorder
+
+Stores raw packets received from controller into file, so they can be later
+fed to mapper using scc.replay, without physical controller being connected.
+
+File starts with header (magic + version), followed by fixed-size records,
+each containing time since recording started (in seconds) and one 64B packet.
+"""
+from __future__ import unicode_literals
+
+import struct, time, logging
+log = logging.getLogger("Recorder")
+
+MAGIC	= b"SCCR"
+VERSION	= 1
+HEADER	= struct.Struct(b"<4sB3x")
+RECORD	= struct.Struct(b"<d64s")
+
+
+class InputRecorder(object):
+	""" Writes packets passed to record() method into file """
+
+	def __init__(self, filename):
+		self.filename = filename
+		self._file = open(filename, "wb")
+		self._file.write(HEADER.pack(MAGIC, VERSION))
+		self._start = None
+		log.debug("Recording input to %s", filename)
+
+
+	def record(self, data):
+		""" Stores one packet, as received from controller """
+		now = time.time()
+		if self._start is None:
+			self._start = now
+		self._file.write(RECORD.pack(now - self._start, data))
+
+
+	def close(self):
+		if self._file:
+			self._file.close()
+			self._file = None
+
+
+def read_recording(filename):
+	"""
+	Generator yielding (time, packet) tuples from file created
+	by InputRecorder.
+
+	Throws ValueError if file is not recording or uses unsupported version.
+	"""
+	f = open(filename, "rb")
+	try:
+		header = f.read(HEADER.size)
+		if len(header) != HEADER.size:
+			raise ValueError("Not a recording: %s" % (filename,))
+		magic, version = HEADER.unpack(header)
+		if magic != MAGIC:
+			raise ValueError("Not a recording: %s" % (filename,))
+		if version != VERSION:
+			raise ValueError("Unsupported recording version: %s" % (version,))
+		while True:
+			data = f.read(RECORD.size)
+			if len(data) < RECORD.size:
+				# End of file (or truncated last record, which is ignored)
+				break
+			yield RECORD.unpack(data)
+	finally:
+		f.close()
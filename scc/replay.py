@@ -0,0 +1,153 @@
+#!/usr/bin/env python2
+"""
+SC-Controller - Input Replay
+
+Feeds input recorded by scc.recorder through packet parsing and mapper,
+exactly as if it was coming from physical controller. Virtual devices use
+'recording' backend, which only keeps generated events, so this can be used
+to benchmark and test entire input path on machine without controller or
+access to /dev/uinput.
+
+Usage: python2 -m scc.replay profile.sccprofile recording [--speed N] [--latency]
+"""
+from __future__ import unicode_literals
+
+from scc.lib import usb1
+from scc.controller import SCController
+from scc.uinput import RecordingUInput, set_backend
+from scc.parser import TalkingActionParser
+from scc.recorder import read_recording
+from scc.latency import LatencyStats
+from scc.profile import Profile
+from scc.mapper import Mapper
+
+import sys, time, logging
+log = logging.getLogger("Replay")
+
+
+class ReplayTransfer(object):
+	""" Mimics completed usb1 transfer holding one recorded packet """
+	def __init__(self, data):
+		self.data = data
+
+	def getStatus(self):
+		return usb1.TRANSFER_COMPLETED
+
+	def getActualLength(self):
+		return len(self.data)
+
+	def getBuffer(self):
+		return self.data
+
+	def submit(self):
+		pass
+
+
+class ReplayController(SCController):
+	"""
+	SCController that receives packets from feed() method instead of
+	USB device. Packets are parsed by same code as with real controller.
+	"""
+	def __init__(self, callback):
+		# SCController.__init__ is not called, as it opens USB device
+		self._init_state(callback)
+		self._now = self._lastusb
+		self.feedback_count = 0
+
+
+	def feed(self, data, now=None):
+		"""
+		Processes one packet, as if it was just received from USB.
+		'now' is passed to mapper as current time, so scheduled tasks
+		and everything else timed follows recorded time instead of
+		speed of replay. Current time is used if not set.
+		"""
+		self._now = time.time() if now is None else now
+		self._processReceivedData(ReplayTransfer(data))
+		# Haptic feedback and configuration messages have nowhere to go
+		self.feedback_count += len(self._cmsg)
+		self._cmsg = []
+
+
+	def _callback(self):
+		self._lastusb = self._now
+		self._cb(self, self._now, self._tup)
+
+
+def create_mapper(profile_file):
+	"""
+	Returns (mapper, controller) tuple with profile loaded. Virtual devices
+	of mapper are created with 'recording' backend, so events they generated
+	are available in mapper.gamepad.backend.events and so on.
+	"""
+	profile = Profile(TalkingActionParser())
+	profile.load(profile_file).compress()
+	set_backend("recording")
+	mapper = Mapper(profile)
+	controller = ReplayController(mapper.callback)
+	controller.configure_controller(enable_gyros=bool(profile.gyro))
+	mapper.set_controller(controller)
+	return mapper, controller
+
+
+def replay(controller, filename, speed=1.0):
+	"""
+	Feeds all packets from recording to controller, with time when
+	packet was recorded passed as mapper's current time.
+	'speed' multiplies original speed of recording, 0 replays packets
+	as fast as possible.
+
+	Returns number of replayed packets.
+	"""
+	count = 0
+	start = time.time()
+	for t, data in read_recording(filename):
+		if speed > 0:
+			delay = start + t / speed - time.time()
+			if delay > 0:
+				time.sleep(delay)
+		controller.feed(data, t)
+		count += 1
+	return count
+
+
+def main():
+	import argparse
+	from scc.tools import init_logging, set_logging_level
+	init_logging()
+	parser = argparse.ArgumentParser(description="Replays recorded controller input")
+	parser.add_argument('profile', type=str)
+	parser.add_argument('recording', type=str)
+	parser.add_argument('--speed', type=float, default=1.0,
+		help="replay speed multiplier, 0 to replay as fast as possible (default: 1.0)")
+	parser.add_argument('--latency', action='store_true',
+		help="measures and prints time spent in each stage of input processing")
+	parser.add_argument('--debug', action='store_true', help="enables debug logging")
+	args = parser.parse_args()
+	set_logging_level(args.debug, args.debug)
+
+	# Everything is counted, not only last RecordingUInput.MAX_EVENTS events
+	RecordingUInput.MAX_EVENTS = None
+	mapper, controller = create_mapper(args.profile)
+	if args.latency:
+		mapper.latency = LatencyStats()
+		controller.setLatencyStats(mapper.latency)
+	t = time.time()
+	count = replay(controller, args.recording, args.speed)
+	t = time.time() - t
+
+	print "Replayed %s packets in %0.3fs" % (count, t)
+	if count:
+		print "%0.1fus per packet" % (t * 1000000.0 / count,)
+	for name, dev in ( ("Gamepad", mapper.gamepad), ("Keyboard", mapper.keyboard),
+				("Mouse", mapper.mouse) ):
+		print "%-9s %6s events, %6s writes" % (name + ":", len(dev.backend.events), dev.backend.write_count)
+	print "Feedback: %6s messages" % (controller.feedback_count,)
+	if mapper.latency:
+		print "%-10s %7s %7s %7s %7s %7s %7s" % ("stage (us)", "count", "mean", "p50", "p90", "p99", "max")
+		for data in mapper.latency.report():
+			print "%-10s %7s %7s %7s %7s %7s %7s" % data
+
+
+if __name__ == "__main__":
+	main()
@@ -6,26 +6,27 @@ from __future__ import unicode_literals
 from scc.tools import _
 
 from scc.lib.daemon import Daemon
-from scc.lib.usb1 import USBError
-from scc.paths import get_profiles_path, get_default_profiles_path
-from scc.paths import get_menus_path, get_default_menus_path
+from scc.lib.usb1 import USBError, USBContext
 from scc.constants import SCButtons, LEFT, RIGHT, STICK
-from scc.parser import TalkingActionParser
-from scc.controller import SCController
+from scc.parser import TalkingActionParser, ParseError
+from scc.controller import SCController, find_devices, run_controllers
+from scc.eventloop import EventLoop
+from scc.recorder import InputRecorder
+from scc.latency import LatencyStats
+from scc import framing
 from scc.tools import set_logging_level, find_binary
-from scc.menu_data import MenuData
+from scc.profile_watcher import ProfileWatcher
+from scc.profile_pool import ProfilePool
+from scc.menu_cache import MenuCache
 from scc.uinput import Keys, Axes
 from scc.profile import Profile
 from scc.actions import Action
 from scc.mapper import Mapper
 
-from SocketServer import UnixStreamServer, ThreadingMixIn, StreamRequestHandler
-import os, sys, signal, socket, select, time, json, logging
+from collections import deque
+import os, sys, signal, socket, select, errno, time, json, logging
 import threading, traceback, subprocess
 log = logging.getLogger("SCCDaemon")
-tlog = logging.getLogger("Socket Thread")
-
-class ThreadingUnixStreamServer(ThreadingMixIn, UnixStreamServer): daemon_threads = True
 
 
 class SCCDaemon(Daemon):
@@ -38,45 +39,193 @@ class SCCDaemon(Daemon):
 		self.exiting = False
 		self.socket_file = socket_file
 		self.sserver = None
-		self.mapper = None
+		self.loop = EventLoop()		# Handles usb, control socket and timers
+		self.profiles = ProfilePool(self.loop)
+		self.menus = MenuCache()		# Menus loaded from .menu files
+		self.watcher = None			# ProfileWatcher, if inotify is available
+		self.mapper = None			# Mapper of first controller
+		self.mappers = []			# Mappers of all controllers, in order of find_devices
+		self.profile_files = []		# Profile loaded by each of mappers
 		self.error = None
 		self.osd_daemon = None
 		self.lock = threading.Lock()
 		self.profile_file = None
+		self.recorder = None
 		self.clients = set()
 		self.cwd = os.getcwd()
 	
 	
 	def load_profile(self, filename):
+		""" Sets profile of first controller and default for any other """
 		self.profile_file = filename
+		self.profiles.pin(filename)
 		if self.mapper is not None:
 			self.mapper.profile.load(filename).compress()
+			self.profile_files[0] = filename
 	
 	
-	def _set_profile(self, filename):
-		# Called from socket server thread
-		p = Profile(TalkingActionParser())
-		p.load(filename).compress()
-		self.profile_file = filename
+	def record_to(self, filename):
+		"""
+		Enables recording of all input received from controller into file.
+		Recording can be replayed later using scc.replay.
+		"""
+		self.recorder = InputRecorder(filename)
+	
+	
+	def _get_mapper(self, index):
+		"""
+		Returns Mapper for controller at given position, creating new one,
+		with its own virtual devices and default profile loaded, if needed.
+		"""
+		while len(self.mappers) <= index:
+			mapper = Mapper(Profile(TalkingActionParser()))
+			mapper.set_special_actions_handler(self)
+			self.mappers.append(mapper)
+			self.profile_files.append(self.profile_file)
+			if self.profile_file is not None:
+				try:
+					mapper.profile = self.profiles.get(self.profile_file)
+				except Exception, e:
+					log.warning("Failed to load profile. Starting with no mappings.")
+					log.warning("Reason: %s", e)
+			self._update_watched({ self.profile_file : mapper.profile.sources })
+		return self.mappers[index]
+	
+	
+	def _set_profile(self, filename, mapper=None, profile=None):
+		"""
+		Loads profile for controller handled by 'mapper',
+		or for first controller if mapper is not set.
+		'profile' may be set to already loaded profile from 'filename'.
+		
+		Returns loaded profile. It's not used right away; caller has to pass
+		it to mapper.set_profile after self.lock is released, as releasing
+		actions of old profile may call back into daemon.
+		Returns None if 'filename' is already loaded and watched for
+		changes, as ProfileWatcher applies changes in it without
+		switching entire profile. Caller should then pass 'filename' to
+		self.watcher.check after self.lock is released, so changes saved
+		since are applied right away. Profile is not reset in such case;
+		held buttons, running macros and modes of unchanged bindings are
+		kept.
+		
+		Should be called while self.lock is acquired.
+		"""
+		mapper = mapper or self.mapper
+		index = self.mappers.index(mapper)
+		current = self.profile_files[index]
+		if (current is not None and os.path.abspath(current) == os.path.abspath(filename)
+				and self.watcher and self.watcher.is_watched(filename)):
+			log.debug("Profile '%s' is already loaded", filename)
+			return None
+		p = self.profiles.get(filename) if profile is None else profile
+		self.profile_files[index] = filename
+		self._update_gyro(mapper, mapper.profile.gyro, p.gyro)
 		
-		if self.mapper.profile.gyro and not p.gyro:
+		if mapper is self.mapper:
+			# Locks are applied to new profile before it's used,
+			# so locked inputs never reach unlocked action
+			for c in self.clients:
+				c.reaply_locks(self, p)
+		self._update_watched({ filename : p.sources })
+		if mapper is self.mapper:
+			self.profile_file = filename
+			# Notify all connected clients about change
+			self._send_to_all(("Current profile: %s\n" % (self.profile_file,)).encode("utf-8"))
+		return p
+	
+	
+	def _update_gyro(self, mapper, old_gyro, new_gyro):
+		""" Turns gyro sensor on or off when gyro action is set or removed """
+		if old_gyro and not new_gyro:
 			# Turn off gyro sensor that was enabled but is no longer needed
-			if self.mapper.get_controller():
+			if mapper.get_controller():
 				log.debug("Turning gyrosensor OFF")
-				self.mapper.get_controller().configure_controller(enable_gyros=False)
-		elif not self.mapper.profile.gyro and p.gyro:
+				mapper.get_controller().configure_controller(enable_gyros=False)
+		elif not old_gyro and new_gyro:
 			# Turn on gyro sensor that was turned off, if profile has gyro action set
-			if self.mapper.get_controller():
+			if mapper.get_controller():
 				log.debug("Turning gyrosensor ON")
-				self.mapper.get_controller().configure_controller(enable_gyros=True)
+				mapper.get_controller().configure_controller(enable_gyros=True)
+	
+	
+	def start_watching(self):
+		""" Starts watching loaded profiles for changes, if possible """
+		try:
+			self.watcher = ProfileWatcher(self.loop, self._on_profile_changed)
+		except OSError, e:
+			log.warning("Cannot watch profiles for changes: %s", e)
+			return
+		self._update_watched()
+	
+	
+	def _update_watched(self, sources=None):
+		"""
+		'sources' maps filenames of just loaded profiles to their
+		Profile.sources, see ProfileWatcher.set_files
+		"""
+		if self.watcher:
+			self.watcher.set_files(self.profile_files, sources)
+	
+	
+	def _on_profile_changed(self, filename, data, changed):
+		"""
+		Called by ProfileWatcher when loaded profile file is saved.
+		Only changed bindings are replaced, so buttons that are held,
+		running macros and modes of unchanged actions are not affected.
+		"""
+		replaced = []
+		self.lock.acquire()
+		try:
+			for i in xrange(len(self.mappers)):
+				if self.profile_files[i] is None or os.path.abspath(self.profile_files[i]) != filename:
+					continue
+				try:
+					# Every mapper needs its own instances of actions
+					p = Profile(TalkingActionParser()).load_data(data)
+					p.compress()
+				except Exception, e:
+					log.error("Failed to reload profile '%s': %s", filename, e)
+					break
+				mapper = self.mappers[i]
+				replaced.append((mapper, self._apply_changes(mapper, p, changed)))
+				log.info("Reloaded %s binding(s) in profile '%s'", len(changed), filename)
+		finally:
+			self.lock.release()
+		# Released actions may call back into daemon, so it's done
+		# only after lock is released
+		for mapper, actions in replaced:
+			for attribute, key, old in actions:
+				mapper.release_binding(attribute, key, old)
+			mapper.sync()
+	
+	
+	def _apply_changes(self, mapper, p, changed):
+		"""
+		Replaces changed bindings in profile used by 'mapper' with
+		bindings from 'p'.
+		
+		Returns list of (attribute, key, action) tuples with replaced
+		actions. Caller should pass them to mapper.release_binding after
+		self.lock is released, so actions that were replaced while physical
+		button, trigger, stick or pad is used get released.
 		
-		# This last line kinda depends on GIL...
-		self.mapper.profile = p
-		# Re-apply all locks
-		for c in self.clients:
-			c.reaply_locks(self)
-		# Notify all connected clients about change
-		self._send_to_all(("Current profile: %s\n" % (self.profile_file,)).encode("utf-8"))
+		Should be called while self.lock is acquired.
+		"""
+		rv = []
+		for attribute, key in changed:
+			action = p.get_binding(attribute, key)
+			old = mapper.profile.get_binding(attribute, key)
+			if isinstance(old, LockedAction):
+				# Locked action stays locked, only action that will be
+				# restored after unlocking is changed
+				old.original_action = action
+				continue
+			if attribute == "gyro":
+				self._update_gyro(mapper, old, action)
+			mapper.profile.set_binding(attribute, key, action)
+			rv.append((attribute, key, old))
+		return rv
 	
 	
 	def _send_to_all(self, message_str):
@@ -145,13 +294,16 @@ class SCCDaemon(Daemon):
 			"--cancel-with", action.cancel_with.name
 		]
 		if "." in action.menu_id:
-			path = None
-			for d in ( get_menus_path(), get_default_menus_path() ):
-				if os.path.exists(os.path.join(d, action.menu_id)):
-					path = os.path.join(d, action.menu_id)
+			path = self.menus.find(action.menu_id)
 			if not path:
 				log.error("Cannot show menu: Menu '%s' not found", action.menu_id)
 				return
+			try:
+				# Loaded now, so selecting item doesn't have to read file
+				self.menus.get(path)
+			except Exception, e:
+				log.error("Cannot show menu: %s", e)
+				return
 			p += [ "--from-file", path ]
 		else:
 			p += [ "--from-profile", self.profile_file, action.menu_id ]
@@ -169,32 +321,36 @@ class SCCDaemon(Daemon):
 			# Small sanity check
 			log.error("Cannot load profile: Profile '%s' not found", name)
 			return
-		filename = name + ".sccprofile"
-		for p in (get_profiles_path(), get_default_profiles_path()):
-			path = os.path.join(p, filename)
-			if os.path.exists(path):
-				self.lock.acquire()
-				try:
-					self._set_profile(path)
-					self.lock.release()
-					log.info("Loaded profile '%s'", name)
-				except Exception, e:
-					self.lock.release()
-					log.error(e)
-				return
-		log.error("Cannot load profile: Profile '%s' not found", name)
+		path = self.profiles.find(name)
+		if path is None:
+			log.error("Cannot load profile: Profile '%s' not found", name)
+			return
+		try:
+			# Usually already loaded, but if not, loading
+			# doesn't have to block socket clients
+			p = self.profiles.get(path)
+		except Exception, e:
+			log.error(e)
+			return
+		self.lock.acquire()
+		try:
+			p = self._set_profile(path, mapper, p)
+			self.lock.release()
+		except Exception, e:
+			self.lock.release()
+			log.error(e)
+			return
+		if p is not None:
+			# Swapped by mapper, at end of its tick if it's processing input now
+			mapper.set_profile(p)
+		else:
+			self.watcher.check(path)
+		log.info("Loaded profile '%s'", name)
 	
 	
 	def on_start(self):
 		os.chdir(self.cwd)
-		self.mapper = Mapper(Profile(TalkingActionParser()))
-		self.mapper.set_special_actions_handler(self)
-		if self.profile_file is not None:
-			try:
-				self.mapper.profile.load(self.profile_file).compress()
-			except Exception, e:
-				log.warning("Failed to load profile. Starting with no mappings.")
-				log.warning("Reason: %s", e)
+		self.mapper = self._get_mapper(0)
 	
 	
 	def on_controller_status(self, sc, onoff):
@@ -206,6 +362,8 @@ class SCCDaemon(Daemon):
 	
 	def sigterm(self, *a):
 		self.exiting = True
+		if self.recorder:
+			self.recorder.close()
 		if self.osd_daemon:
 			self.osd_daemon.wfile.close()
 		sys.exit(0)
@@ -235,21 +393,34 @@ class SCCDaemon(Daemon):
 		signal.signal(signal.SIGTERM, self.sigterm)
 		self.lock.acquire()
 		self.start_listening()
+		self.start_watching()
 		self.start_osd()
 		while True:
+			controllers = []
 			try:
-				sc = None
-				sc = SCController(callback=self.mapper.callback)
-				sc.configure_controller(enable_gyros=bool(self.mapper.profile.gyro))
-				self.mapper.set_controller(sc)
-				sc.setStatusCallback(self.on_controller_status)
+				# All controllers share one USBContext and are handled
+				# by single loop in run_controllers
+				ctx = USBContext()
+				devices = find_devices(ctx)
+				if len(devices) == 0:
+					raise ValueError('Controller Device not found')
+				for i in xrange(len(devices)):
+					mapper = self._get_mapper(i)
+					sc = SCController(mapper.callback, ctx, devices[i])
+					controllers.append(sc)
+					sc.configure_controller(enable_gyros=bool(mapper.profile.gyro))
+					mapper.set_controller(sc)
+					sc.setStatusCallback(self.on_controller_status)
+					sc.setLatencyStats(mapper.latency)
+				controllers[0].setRecorder(self.recorder)
+				log.debug("Found %s controller(s)", len(controllers))
 				if self.error is not None:
 					self.error = None
 					log.debug("Recovered after error")
 					self._send_to_all(b"Ready.\n")
 				self.lock.release()
-				sc.run()
-				# Reaches here only if USB dongle is disconnected or gets stuck
+				run_controllers(ctx, controllers, self.loop)
+				# Reaches here only if all USB dongles are disconnected or get stuck
 				self.lock.acquire()
 			except (ValueError, USBError), e:
 				# When SCController fails to initialize, daemon should
@@ -261,38 +432,48 @@ class SCCDaemon(Daemon):
 				# fixed by higher power (aka. user)
 				was_error = self.error is not None
 				self.error = unicode(e)
-				if sc: sc.unclaim()
+				for sc in controllers:
+					sc.unclaim()
 				try:
 					self.lock.release()
 				except: pass
 				log.error(e)
 				if not was_error:
 					self._send_to_all(("Error: %s\n" % (self.error,)).encode("utf-8"))
-				time.sleep(5)
+				# Control socket is still served while waiting
+				self.loop.sleep(5)
 				self.lock.acquire()
 	
 	
 	def start_listening(self):
+		"""
+		Creates control socket. Socket and connected clients are
+		served by self.loop, together with controllers.
+		"""
 		if os.path.exists(self.socket_file):
 			os.unlink(self.socket_file)
-		instance = self
-		
-		class SSHandler(StreamRequestHandler):
-			def handle(self):
-				instance._sshandler(self.rfile, self.wfile)
-		
-		self.sserver = ThreadingUnixStreamServer(self.socket_file, SSHandler)
-		t = threading.Thread(target=self.sserver.serve_forever)
-		t.daemon = True
-		t.start()
+		self.sserver = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		self.sserver.bind(self.socket_file)
+		self.sserver.listen(5)
+		self.sserver.setblocking(False)
+		self.loop.add_fd(self.sserver.fileno(), self._on_connection)
 		os.chmod(self.socket_file, 0600)
 		log.debug("Created control socket %s", self.socket_file)
 	
 	
-	def _sshandler(self, rfile, wfile):
+	def _on_connection(self, fd, events):
+		""" Called by event loop when client connects to control socket """
+		try:
+			connection, trash = self.sserver.accept()
+		except socket.error:
+			return
+		connection.setblocking(False)
 		self.lock.acquire()
-		client = Client(rfile, wfile)
+		client = Client(connection, self.loop)
 		self.clients.add(client)
+		self.loop.add_fd(connection.fileno(),
+			lambda fd, events : self._on_client_event(client, events))
+		wfile = client.wfile
 		wfile.write(b"SCCDaemon\n")
 		wfile.write(("Version: %s\n" % (SCCDaemon.VERSION,)).encode("utf-8"))
 		wfile.write(("PID: %s\n" % (os.getpid(),)).encode("utf-8"))
@@ -301,74 +482,65 @@ class SCCDaemon(Daemon):
 			wfile.write(b"Ready.\n")
 		else:
 			wfile.write(("Error: %s\n" % (self.error,)).encode("utf-8"))
-		
 		self.lock.release()
-		while True:
-			try:
-				line = rfile.readline()
-			except Exception:
-				# Connection terminated
-				break
-			if len(line) == 0: break
+	
+	
+	def _on_client_event(self, client, events):
+		"""
+		Called by event loop when client socket is readable or writable.
+		Sends queued data and handles every complete line received from client.
+		"""
+		if events & select.POLLOUT:
+			client.wfile.on_writable()
+		if events & ~select.POLLOUT:
+			self._on_client_data(client)
+		self._remove_broken_clients()
+	
+	
+	def _on_client_data(self, client):
+		try:
+			data = client.connection.recv(4096)
+		except socket.error, e:
+			if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+				return
+			# Connection terminated
+			data = b""
+		if len(data) == 0:
+			self.lock.acquire()
+			self._remove_client(client)
+			self.lock.release()
+			return
+		client.buffer += data
+		while b"\n" in client.buffer and client in self.clients:
+			line, client.buffer = client.buffer.split(b"\n", 1)
 			if len(line.strip("\t\n ")) > 0:
-				self._handle_message(client, line.strip("\n"))
-		self.lock.acquire()
+				self._handle_message(client, line)
+	
+	
+	def _remove_broken_clients(self):
+		""" Disconnects all clients to which data cannot be sent """
+		broken = [ c for c in self.clients if c.wfile.broken ]
+		if len(broken):
+			self.lock.acquire()
+			for c in broken:
+				self._remove_client(c)
+			self.lock.release()
+	
+	
+	def _remove_client(self, client):
+		"""
+		Disconnects client and unlocks everything it had locked.
+		Should be called while self.lock is acquired.
+		"""
+		if client not in self.clients:
+			return
 		client.unlock_actions(self)
 		if self.osd_daemon == client:
 			log.info("scc-osd-daemon lost")
 			self.osd_daemon = None
 		self.clients.remove(client)
-		self.lock.release()
-	
-	
-	def _listen_on_socket(self):
-		tlog.debug("Listening...")
-		self.socket.listen(2)
-		reads = [ self.socket ]
-		while len(reads):
-			try:
-				readable, trash, errors = select.select(reads, [], reads, 1)
-			except socket.error:
-				# Happens durring exit
-				tlog.debug("Socket lost")
-				return
-			for s in reads:
-				if s is self.socket:
-					try:
-						connection, client = s.accept()
-					except socket.error:
-						# Happens when ^C is pressed
-						continue
-					reads.append(connection)
-					connection.send(b"SCCDaemon\n")
-					connection.send(("Version: %s\n" % (SCCDaemon.VERSION,)).encode("utf-8"))
-					connection.send(("PID: %s\n" % (os.getpid(),)).encode("utf-8"))
-					connection.send(("Current profile: %s\n" % (self.profile_file,)).encode("utf-8"))
-				else:
-					try:
-						data = s.recv(1024)
-					except socket.error:
-						# Remote side closed
-						data = None
-					if data and "\n" in data:
-						data = data.decode("utf-8")
-						filename = data[0:data.index("\n")]
-						tlog.debug("Loading profile '%s'", filename)
-						try:
-							self._set_profile(filename)
-							connection.send(b"OK\n")
-						except Exception, e:
-							tb = traceback.format_exc()
-							tlog.debug("Failed")
-							tlog.error(e)
-							connection.send(unicode(tb).encode("utf-8"))
-						while s in reads:
-							reads.remove(s)
-						s.close()
-					else:
-						while s in reads:
-							reads.remove(s)
-						s.close()
+		self.loop.remove_fd(client.connection.fileno())
+		client.close()
 	
 	
 	def _handle_message(self, client, message):
@@ -379,15 +551,23 @@ class SCCDaemon(Daemon):
 			self.lock.acquire()
 			try:
 				filename = message[8:].decode("utf-8").strip("\t ")
-				self._set_profile(filename)
-				log.info("Loaded profile '%s'", filename)
+				mapper = self.mappers[client.controller]
+				p = self._set_profile(filename, mapper)
 				self.lock.release()
-				client.wfile.write(b"OK.\n")
 			except Exception, e:
 				log.error(e)
 				self.lock.release()
 				tb = unicode(traceback.format_exc()).encode("utf-8").encode('string_escape')
 				client.wfile.write(b"Fail: " + tb + b"\n")
+				return
+			if p is not None:
+				# Released actions of old profile may need lock as well
+				mapper.set_profile(p)
+			else:
+				# Already loaded, only changes saved since are applied
+				self.watcher.check(filename)
+			log.info("Loaded profile '%s'", filename)
+			client.wfile.write(b"OK.\n")
 		elif message.startswith("Lock:"):
 			to_lock = [ x for x in message[5:].strip(" \t\r").split(" ") ]
 			self.lock.acquire()
@@ -432,14 +612,15 @@ class SCCDaemon(Daemon):
 				menu_id, item_id = message[9:].strip().split(" ")[:2]
 				menuaction = None
 				if "." in menu_id:
-					# TODO: Move this common place
-					data = json.loads(open(menu_id, "r").read())
-					menudata = MenuData.from_json_data(data, TalkingActionParser())
-					menuaction = menudata.get_by_id(item_id).action
+					menuaction = self.menus.get_cached(menu_id).get_by_id(item_id).action
 				else:
 					menuaction = self.mapper.profile.menus[menu_id].get_by_id(item_id).action
 				client.wfile.write(b"OK.\n")
-			except:
+			except ParseError, e:
+				# Actions of menu items are parsed only when needed
+				log.error("Failed to parse action of item '%s' in menu '%s': %s", item_id, menu_id, e)
+				client.wfile.write(b"Fail: Failed to parse action of selected menu item\n")
+			except Exception:
 				log.warning("Selected menu item is no longer valid.")
 				client.wfile.write(b"Fail: Selected menu item is no longer valid\n")
 			if menuaction:
@@ -448,17 +629,79 @@ class SCCDaemon(Daemon):
 		elif message == "Register: osd":
 			self.lock.acquire()
 			if self.osd_daemon:
-				try:
-					self.osd_daemon.wfile.close()
-				except: pass
+				self._remove_client(self.osd_daemon)
 			self.osd_daemon = client
 			self.lock.release()
 			log.info("Registered scc-osd-daemon")
 			client.wfile.write(b"OK.\n")
+		elif message.startswith("Controller:"):
+			self.lock.acquire()
+			try:
+				index = int(message[11:].strip(" \t\r"))
+				if index < 0 or index >= len(self.mappers):
+					raise ValueError("No such controller")
+				client.controller = index
+				client.wfile.write(b"OK.\n")
+			except ValueError:
+				client.wfile.write(b"Fail: No such controller\n")
+			self.lock.release()
+		elif message.startswith("Protocol:"):
+			if message[9:].strip(" \t\r") == "binary":
+				# 'OK.' is last message sent as text
+				client.wfile.write(b"OK.\n")
+				client.wfile.framed = True
+			else:
+				client.wfile.write(b"Fail: Unknown protocol\n")
+		elif message.startswith("Interval:"):
+			try:
+				client.event_interval = max(0, int(message[9:].strip(" \t\r"))) / 1000.0
+				client.wfile.write(b"OK.\n")
+			except ValueError:
+				client.wfile.write(b"Fail: Invalid interval\n")
+		elif message.startswith("Latency:"):
+			self._handle_latency(client, message[8:].strip(" \t\r"))
 		else:
 			client.wfile.write(b"Fail: Unknown command\n")
 	
 	
+	def _set_latency_stats(self, latency):
+		""" Sets (or unsets) LatencyStats used by mapper and controller """
+		self.mapper.latency = latency
+		if self.mapper.get_controller():
+			self.mapper.get_controller().setLatencyStats(latency)
+	
+	
+	def _handle_latency(self, client, command):
+		"""
+		Handles 'Latency:' message. Command can be 'on', 'off', 'reset'
+		or 'report'.
+		"""
+		self.lock.acquire()
+		try:
+			latency = self.mapper.latency
+			if command == "on":
+				if latency is None:
+					self._set_latency_stats(LatencyStats())
+					log.info("Latency measuring enabled")
+			elif command == "off":
+				self._set_latency_stats(None)
+			elif command in ("reset", "report"):
+				if latency is None:
+					client.wfile.write(b"Fail: Latency measuring is not enabled\n")
+					return
+				if command == "reset":
+					latency.reset()
+				else:
+					for data in latency.report():
+						client.wfile.write(("Latency: %s %s %s %s %s %s %s\n" % data).encode("utf-8"))
+			else:
+				client.wfile.write(b"Fail: Unknown latency command\n")
+				return
+			client.wfile.write(b"OK.\n")
+		finally:
+			self.lock.release()
+	
+	
 	def _can_lock_action(self, what):
 		"""
 		Returns True if action assigned to axis,
@@ -483,31 +726,35 @@ class SCCDaemon(Daemon):
 		return False
 	
 	
-	def _lock_action(self, what, client):
+	def _lock_action(self, what, client, profile=None):
 		"""
 		Locks action so event can be send to client instead of handling it.
 		
+		Action is locked in 'profile', or in profile of first
+		controller if 'profile' is not set.
+		
 		Should be called while self.lock is acquired.
 		"""
+		profile = profile or self.mapper.profile
 		if what == STICK:
-			a = self.mapper.profile.stick.compress()
-			self.mapper.profile.stick = LockedAction(what, client, a)
+			a = profile.stick.compress()
+			profile.stick = LockedAction(what, client, a)
 			return
 		if what == SCButtons.LT:
-			a = self.mapper.profile.triggers[LEFT].compress()
-			self.mapper.profile.triggers[LEFT] = LockedAction(what, client, a)
+			a = profile.triggers[LEFT].compress()
+			profile.triggers[LEFT] = LockedAction(what, client, a)
 			return
 		if what == SCButtons.RT:
-			a = self.mapper.profile.triggers[RIGHT].compress()
-			self.mapper.profile.triggers[RIGHT] = LockedAction(what, client, a)
+			a = profile.triggers[RIGHT].compress()
+			profile.triggers[RIGHT] = LockedAction(what, client, a)
 			return
 		if what in SCButtons:
-			a = self.mapper.profile.buttons[what].compress()
-			self.mapper.profile.buttons[what] = LockedAction(what, client, a)
+			a = profile.buttons[what].compress()
+			profile.buttons[what] = LockedAction(what, client, a)
 			return
 		if what in (LEFT, RIGHT):
-			a = self.mapper.profile.pads[what].compress()
-			self.mapper.profile.pads[what] = LockedAction(what, client, a)
+			a = profile.pads[what].compress()
+			profile.pads[what] = LockedAction(what, client, a)
 			return
 		# TODO: Triggers
 			
@@ -566,7 +813,8 @@ class SCCDaemon(Daemon):
 	
 	
 	def _remove_socket(self):
-		self.sserver.shutdown()
+		self.loop.remove_fd(self.sserver.fileno())
+		self.sserver.close()
 		if os.path.exists(self.socket_file):
 			os.unlink(self.socket_file)
 		log.debug("Control socket removed")
@@ -583,11 +831,189 @@ class SCCDaemon(Daemon):
 		self.sigterm()
 
 
+class SocketWriter(object):
+	"""
+	File-like object used to send data to client without ever blocking.
+	
+	Data that cannot be sent right away is queued and sent by event loop
+	once socket is writable. Queue is bounded; when it's full, client is
+	considered too slow and writer is marked as broken, same as when
+	write fails. Nothing is thrown in either case, daemon disconnects
+	broken clients once it's safe to do so.
+	"""
+	MAX_QUEUE = 256		# messages
+	
+	def __init__(self, connection, loop):
+		self.connection = connection
+		self.loop = loop
+		self.broken = False
+		self.framed = False			# Set when client switches to binary protocol
+		self._queue = deque()		# of [key, data] lists
+		self._keyed = {}			# key -> queued [key, data] that can still be replaced
+	
+	
+	def write(self, data):
+		"""
+		Sends or queues newline-terminated text message(s), converted
+		to frames if client uses binary protocol.
+		"""
+		if self.framed:
+			data = framing.pack_text(data)
+		self.send_raw(data)
+	
+	
+	def send_raw(self, data, key=None):
+		"""
+		Sends or queues data as they are.
+		
+		If 'key' is set and message with same key is still waiting in
+		queue, that message is replaced by new data, so only latest value
+		gets sent. Only messages queued after last message without key
+		can be replaced, so nothing is reordered around it.
+		If queue is full, new keyed message is dropped, while any other
+		message causes client to be disconnected.
+		"""
+		if self.broken:
+			return
+		if key is not None and key in self._keyed:
+			self._keyed[key][1] = data
+			return
+		if len(self._queue) == 0:
+			# Nothing is waiting, try to send right away
+			try:
+				sent = self.connection.send(data)
+			except socket.error, e:
+				if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+					self.broken = True
+					return
+				sent = 0
+			if sent == len(data):
+				return
+			# Rest of message can't be replaced anymore
+			self._queue.append([ None, data[sent:] ])
+			self._keyed = {}
+			self.loop.modify_fd(self.connection.fileno(), select.POLLIN | select.POLLOUT)
+			return
+		if len(self._queue) >= self.MAX_QUEUE:
+			if key is None:
+				log.warning("Client is not reading fast enough, disconnecting")
+				self.broken = True
+			return
+		entry = [ key, data ]
+		self._queue.append(entry)
+		if key is not None:
+			self._keyed[key] = entry
+		else:
+			self._keyed = {}
+	
+	
+	def on_writable(self):
+		""" Called by event loop when socket can accept more data """
+		queue = self._queue
+		try:
+			while queue:
+				entry = queue[0]
+				if entry[0] is not None:
+					# Message is being sent, so it can't be replaced anymore
+					if self._keyed.get(entry[0]) is entry:
+						del self._keyed[entry[0]]
+					entry[0] = None
+				sent = self.connection.send(entry[1])
+				if sent < len(entry[1]):
+					entry[1] = entry[1][sent:]
+					return
+				queue.popleft()
+		except socket.error, e:
+			if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+				self.broken = True
+			return
+		self.loop.modify_fd(self.connection.fileno(), select.POLLIN)
+	
+	
+	def flush(self):
+		# Queue is flushed by event loop
+		pass
+	
+	
+	def close(self):
+		self.broken = True
+		try:
+			self.connection.shutdown(socket.SHUT_RDWR)
+		except socket.error:
+			pass
+
+
 class Client(object):
-	def __init__(self, rfile, wfile):
-		self.rfile = rfile
-		self.wfile = wfile
+	# Default minimal time between two 'Event:' messages for same pad or stick
+	EVENT_INTERVAL = 1.0 / 60.0
+	
+	def __init__(self, connection, loop):
+		self.connection = connection
+		self.loop = loop
+		self.wfile = SocketWriter(connection, loop)
+		self.buffer = b""		# Received data that doesn't form complete line yet
 		self.locked_actions = set()
+		self.controller = 0		# Index of controller affected by 'Profile:' message
+		self.event_interval = Client.EVENT_INTERVAL
+		self._pending_events = {}	# source -> latest not yet sent 'Event:' message
+		self._event_timer = None	# Set while interval after last sent position runs
+	
+	
+	def close(self):
+		if self._event_timer:
+			self._event_timer.cancel()
+			self._event_timer = None
+		self.wfile.close()
+		self.connection.close()
+	
+	
+	def send_button(self, button, pressed):
+		"""
+		Sends button event right away. Positions that are waiting
+		are sent first, so client sees events in correct order.
+		"""
+		if len(self._pending_events):
+			self._flush_positions()
+		if self.wfile.framed:
+			self.wfile.send_raw(framing.pack_button(button, pressed))
+		else:
+			self.wfile.send_raw(("Event: %s %s\n" % (button.name, 1 if pressed else 0)).encode("utf-8"))
+	
+	
+	def send_position(self, source, x, y):
+		"""
+		Sends event with new position of pad or stick.
+		
+		At most one message per source is sent in every event_interval;
+		if position changes more often, only latest one is sent at end
+		of interval.
+		"""
+		if self.wfile.framed:
+			data = framing.pack_position(source, x, y)
+		else:
+			data = ("Event: %s %s %s\n" % (source, x, y)).encode("utf-8")
+		if self.event_interval <= 0:
+			self.wfile.send_raw(data, source)
+		elif self._event_timer is None:
+			# Nothing was sent recently
+			self.wfile.send_raw(data, source)
+			self._event_timer = self.loop.schedule(self.event_interval, self._on_event_timer)
+		else:
+			self._pending_events[source] = data
+	
+	
+	def _flush_positions(self):
+		for source, data in self._pending_events.items():
+			self.wfile.send_raw(data, source)
+		self._pending_events.clear()
+	
+	
+	def _on_event_timer(self):
+		if len(self._pending_events):
+			self._flush_positions()
+			self._event_timer = self.loop.schedule(self.event_interval, self._on_event_timer)
+		else:
+			self._event_timer = None
 	
 	
 	def unlock_actions(self, daemon):
@@ -598,14 +1024,15 @@ class Client(object):
 			log.debug("%s unlocked", a.what)
 	
 	
-	def reaply_locks(self, daemon):
+	def reaply_locks(self, daemon, profile=None):
 		"""
-		Called after profile is changed.
+		Called when profile is changed, with new profile
+		before it's used by mapper.
 		Should be called while daemon.lock is acquired
 		"""
 		s, self.locked_actions = self.locked_actions, set()
 		for a in s:
-			daemon._lock_action(a.what, self)
+			daemon._lock_action(a.what, self, profile)
 
 
 
@@ -624,12 +1051,14 @@ class LockedAction(Action):
 		pass
 	
 	def button_press(self, mapper):
-		self.client.wfile.write(("Event: %s 1\n" % (self.what.name,)).encode("utf-8"))
+		self.client.send_button(self.what, True)
 	
 	def button_release(self, mapper):
-		self.client.wfile.write(("Event: %s 0\n" % (self.what.name,)).encode("utf-8"))
+		self.client.send_button(self.what, False)
 	
 	def whole(self, mapper, x, y, what):
-		if abs(x - self.old_pos[0]) > self.MIN_DIFFERENCE or abs(y - self.old_pos[1] > self.MIN_DIFFERENCE):
+		if abs(x - self.old_pos[0]) > self.MIN_DIFFERENCE or abs(y - self.old_pos[1]) > self.MIN_DIFFERENCE:
 			self.old_pos = x, y
-			self.client.wfile.write(("Event: %s %s %s\n" % (what, x, y)).encode("utf-8"))
+			# Positions are coalesced by client; button events are never
+			# replaced or delayed
+			self.client.send_position(what, x, y)
@@ -0,0 +1,73 @@
+#!/usr/bin/env python2
+"""
+SC-Controller - Smoothing
+
+Moving average over fixed number of last values, updated in constant time
+no matter how many values are averaged.
+"""
+from __future__ import unicode_literals
+
+
+class RunningMean(object):
+	"""
+	Keeps last 'size' values in ring buffer together with their sum, so
+	adding value and computing mean doesn't have to iterate over them.
+
+	If 'weighted' is True, mean is weighted linearly, with newest value
+	having weight of 'size' and oldest weight of 1, so result follows
+	recent values more closely.
+
+	Integer values are averaged using integer division, same as
+	sum(values) / len(values) would.
+	"""
+	__slots__ = ("size", "weighted", "values", "count", "index", "total", "wtotal")
+
+	def __init__(self, size, weighted=False):
+		self.size = max(1, size)
+		self.weighted = weighted
+		self.values = [ 0 ] * self.size
+		self.count = 0
+		self.index = 0
+		self.total = 0		# Sum of values
+		self.wtotal = 0		# Sum of values multiplied by their weights
+
+
+	def __len__(self):
+		return self.count
+
+
+	def add(self, value):
+		values, i = self.values, self.index
+		if self.weighted:
+			if self.count < self.size:
+				self.wtotal += (self.count + 1) * value
+			else:
+				# Subtracting total lowers weight of every value by one,
+				# so oldest value drops out
+				self.wtotal += self.size * value - self.total
+		if self.count < self.size:
+			self.count += 1
+		self.total += value - values[i]
+		values[i] = value
+		i += 1
+		if i == self.size:
+			i = 0
+			# Recomputed once per round, so rounding errors of
+			# floats can't accumulate
+			self.total = sum(values)
+			if self.weighted:
+				self.wtotal = sum([ (j + 1) * values[j] for j in xrange(self.size) ])
+		self.index = i
+
+
+	def mean(self):
+		""" Throws ZeroDivisionError if there are no values """
+		if self.weighted:
+			return self.wtotal / (self.count * (self.count + 1) / 2)
+		return self.total / self.count
+
+
+	def clear(self):
+		if self.count:
+			self.values = [ 0 ] * self.size
+			self.count = self.index = self.total = self.wtotal = 0
@@ -0,0 +1,126 @@
+#!/usr/bin/env python2
+"""
+SC-Controller - Trackball
+
+Physics of virtual ball used by Mouse to emulate trackball and scroll
+wheel. Ball is pushed by finger while pad is touched and keeps rolling,
+slowed down by friction, after finger is lifted.
+
+Time is not read from any clock, it's passed by caller, so same input
+produces same movement when it's replayed. Rolling is integrated in fixed
+time steps and time that didn't fill entire step is carried over to next
+update, so ball slows down in same way no matter how regularly it's updated.
+"""
+from __future__ import unicode_literals
+
+from scc.smoothing import RunningMean
+from math import pi, sqrt, ceil
+
+
+class BallPhysics(object):
+	STEP = 0.002		# Length of one integration step, in seconds
+
+	__slots__ = ( "xscale", "yscale", "radscale", "a", "xvel", "yvel",
+		"ix", "iy", "steps", "_dx", "_dy", "_last", "_carry", "_xmean", "_ymean" )
+
+	def __init__(self):
+		""" set_params has to be called before ball is used """
+		self.xvel = self.yvel = 0.0		# Angular velocity, in rad/s
+		self.ix = self.iy = 0			# Whole units moved by last update
+		self.steps = 0					# Steps integrated by last roll()
+		self._dx = self._dy = 0.0		# Not yet emitted fractions of unit
+		self._carry = 0.0
+		self._last = None				# Time of last update
+
+
+	def set_params(self, mass, r, friction, ampli, degree, xscale, yscale, mean_len):
+		""" See Mouse.updateParams for meaning of parameters """
+		self.xscale = xscale
+		self.yscale = yscale
+		self.radscale = (degree * pi / 180) / ampli
+		I = (2 * mass * r**2) / 5.0
+		self.a = r * friction / I
+		# Means of last velocities, used when finger is lifted
+		self._xmean = RunningMean(mean_len)
+		self._ymean = RunningMean(mean_len)
+
+
+	def is_rolling(self):
+		return self.xvel != 0.0 or self.yvel != 0.0
+
+
+	def stop(self):
+		self.xvel = self.yvel = 0.0
+
+
+	def _move(self, dx, dy):
+		""" Adds scaled displacement and sets ix, iy to whole units of it """
+		self._dx += dx * self.xscale
+		self._dy += dy * self.yscale
+		self.ix = ix = int(self._dx)
+		self.iy = iy = int(self._dy)
+		self._dx -= ix
+		self._dy -= iy
+
+
+	def push(self, dx, dy, now):
+		"""
+		Moves ball by finger. 'now' is current time, in seconds.
+		Sets ix, iy and returns distance moved.
+		"""
+		dt = 0.0 if self._last is None else now - self._last
+		self._last, self._carry = now, 0.0
+		self._move(dx, dy)
+		# Velocity that ball keeps when finger is lifted is mean
+		# of previous movements
+		if len(self._xmean):
+			self.xvel = self._xmean.mean()
+			self.yvel = self._ymean.mean()
+		else:
+			self.xvel = self.yvel = 0.0
+		if dt > 0:
+			self._xmean.add(dx * self.radscale / dt)
+			self._ymean.add(dy * self.radscale / dt)
+		return sqrt(dx * dx + dy * dy)
+
+
+	def roll(self, now):
+		"""
+		Moves ball by its own momentum for time elapsed since last update.
+		'now' is current time, in seconds.
+		Sets ix, iy and steps and returns distance moved.
+		"""
+		# Finger was lifted since last update
+		self._xmean.clear()
+		self._ymean.clear()
+		step = BallPhysics.STEP
+		elapsed = self._carry
+		if self._last is not None:
+			elapsed += max(0.0, now - self._last)
+		self._last = now
+		self.steps = steps = int(elapsed / step)
+		self._carry = elapsed - steps * step
+
+		dx = dy = 0.0
+		hyp = sqrt(self.xvel * self.xvel + self.yvel * self.yvel)
+		if steps and hyp != 0.0:
+			# Friction lowers speed by same amount every step, without
+			# changing direction, until ball stops. That makes speeds
+			# an arithmetic sequence, which is summed without iterating,
+			# so all elapsed time is integrated however long it was.
+			dvel = self.a * step
+			if dvel > 0.0:
+				steps = min(steps, int(ceil(hyp / dvel)))
+				end = max(0.0, hyp - steps * dvel)
+			else:
+				end = hyp
+			# Displacement is mean velocity over step times length of
+			# step, summed for every step
+			total = steps * hyp - dvel * steps * (steps - 1) * 0.5
+			dist = (2.0 * total - hyp + end) * 0.5 * step / self.radscale
+			dx = self.xvel / hyp * dist
+			dy = self.yvel / hyp * dist
+			self.xvel *= end / hyp
+			self.yvel *= end / hyp
+		self._move(dx, dy)
+		return sqrt(dx * dx + dy * dy)
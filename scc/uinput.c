@@ -31,6 +31,9 @@
 
 #pragma GCC diagnostic ignored "-Wunused-result"
 
+/* Maximum number of events written by single write() call */
+#define UINPUT_BATCH_SIZE 64
+
 int uinput_init(
 	int	 key_len,
 	__u16 * key,
@@ -182,6 +185,27 @@ void uinput_scan(int fd, __s32 val)
 	write(fd, &ev, sizeof(ev));
 }
 
+void uinput_write(int fd, int count, __u16 * types, __u16 * codes, __s32 * values)
+{
+	struct input_event evs[UINPUT_BATCH_SIZE];
+	int i, n;
+
+	while (count > 0) {
+		n = count > UINPUT_BATCH_SIZE ? UINPUT_BATCH_SIZE : count;
+		memset(evs, 0, sizeof(struct input_event) * n);
+		for (i = 0; i < n; i++) {
+			evs[i].type = types[i];
+			evs[i].code = codes[i];
+			evs[i].value = values[i];
+		}
+		write(fd, evs, sizeof(struct input_event) * n);
+		types += n;
+		codes += n;
+		values += n;
+		count -= n;
+	}
+}
+
 void uinput_set_delay_period(int fd, __s32 delay, __s32 period)
 {
 	struct input_event ev;
@@ -23,20 +23,25 @@
 # THE SOFTWARE.
 
 import os
-import ctypes
 import time
-from math import pi, copysign, sqrt
+import fcntl
+import struct
+import ctypes
 from scc.lib import IntEnum
-from scc.cheader import defines
+from scc.cheader import cached_defines
+from scc.paths import get_cache_path
 from scc.tools import find_lib
+from scc.trackball import BallPhysics
 
 from collections import deque
 
-# Get All defines from linux headers
+# Get All defines from linux headers. Parsing them is slow, so parsed
+# values are cached in ~/.cache/scc and reparsed only when header changes.
+CHEAD_CACHE = os.path.join(get_cache_path(), "input-defines.json")
 if os.path.exists('/usr/include/linux/input-event-codes.h'):
-	CHEAD = defines('/usr/include', 'linux/input-event-codes.h')
+	CHEAD = cached_defines('/usr/include', 'linux/input-event-codes.h', CHEAD_CACHE)
 else:
-	CHEAD = defines('/usr/include', 'linux/input.h')
+	CHEAD = cached_defines('/usr/include', 'linux/input.h', CHEAD_CACHE)
 
 # Keys enum contains all keys and button from linux/uinput.h (KEY_* BTN_*)
 Keys = IntEnum('Keys', {i: CHEAD[i] for i in CHEAD.keys() if (i.startswith('KEY_') or
@@ -50,6 +55,12 @@ Axes = IntEnum('Axes', {i: CHEAD[i] for i in CHEAD.keys() if i.startswith('ABS_'
 # Rels enum contains all rels from linux/uinput.h (REL_*)
 Rels = IntEnum('Rels', {i: CHEAD[i] for i in CHEAD.keys() if i.startswith('REL_')})
 
+# Event types and codes used when writing events
+EV_SYN, EV_KEY, EV_REL, EV_ABS, EV_MSC = [ CHEAD[x] for x in
+	('EV_SYN', 'EV_KEY', 'EV_REL', 'EV_ABS', 'EV_MSC') ]
+SYN_REPORT, MSC_SCAN = CHEAD['SYN_REPORT'], CHEAD['MSC_SCAN']
+EV_REP, REP_DELAY, REP_PERIOD = CHEAD['EV_REP'], CHEAD['REP_DELAY'], CHEAD['REP_PERIOD']
+
 # Scan codes for each keys (taken from a logitech keyboard)
 Scans = {
 	Keys.KEY_ESC: 0x70029,
@@ -173,23 +184,13 @@ Scans = {
 
 
 
-class UInput(object):
+class LibUInput(object):
 	"""
-	UInput class permits to create a uinput device.
-
-	See Gamepad, Mouse, Keyboard for examples
+	Virtual device created and written to using compiled libuinput library.
 	"""
 
-
-	def __init__(self, vendor, product, name, keys, axes, rels, keyboard=False):
+	def __init__(self, vendor, product, name, keys, axes, rels, keyboard):
 		self._lib = None
-		self._k = keys
-		if not axes or len(axes) == 0:
-			self._a, self._amin, self._amax, self._afuzz, self._aflat = [[]] * 5
-		else:
-			self._a, self._amin, self._amax, self._afuzz, self._aflat = zip(*axes)
-
-		self._r = rels
 		lib, search_paths = find_lib("libuinput", os.path.dirname(__file__))
 		if not lib:
 			raise OSError('Cant find libuinput. searched at:\n {}'.format(
@@ -198,27 +199,32 @@ class UInput(object):
 		)
 		self._lib = ctypes.CDLL(lib)
 
-		c_k		= (ctypes.c_uint16 * len(self._k))(*self._k)
-		c_a		= (ctypes.c_uint16 * len(self._a))(*self._a)
-		c_amin	 = (ctypes.c_int32  * len(self._amin ))(*self._amin )
-		c_amax	 = (ctypes.c_int32  * len(self._amax ))(*self._amax )
-		c_afuzz	= (ctypes.c_int32  * len(self._afuzz))(*self._afuzz)
-		c_aflat	= (ctypes.c_int32  * len(self._aflat))(*self._aflat)
-		c_r		= (ctypes.c_uint16 * len(self._r))(*self._r)
+		if not axes or len(axes) == 0:
+			a, amin, amax, afuzz, aflat = [[]] * 5
+		else:
+			a, amin, amax, afuzz, aflat = zip(*axes)
+
+		c_k		= (ctypes.c_uint16 * len(keys))(*keys)
+		c_a		= (ctypes.c_uint16 * len(a))(*a)
+		c_amin	 = (ctypes.c_int32  * len(amin ))(*amin )
+		c_amax	 = (ctypes.c_int32  * len(amax ))(*amax )
+		c_afuzz	= (ctypes.c_int32  * len(afuzz))(*afuzz)
+		c_aflat	= (ctypes.c_int32  * len(aflat))(*aflat)
+		c_r		= (ctypes.c_uint16 * len(rels))(*rels)
 		c_vendor   = ctypes.c_uint16(vendor)
 		c_product  = ctypes.c_uint16(product)
 		c_keyboard = ctypes.c_int(keyboard)
 
 		c_name = ctypes.c_char_p(name)
-		self._fd = self._lib.uinput_init(ctypes.c_int(len(self._k)),
+		self._fd = self._lib.uinput_init(ctypes.c_int(len(keys)),
 										 c_k,
-										 ctypes.c_int(len(self._a)),
+										 ctypes.c_int(len(a)),
 										 c_a,
 										 c_amin,
 										 c_amax,
 										 c_afuzz,
 										 c_aflat,
-										 ctypes.c_int(len(self._r)),
+										 ctypes.c_int(len(rels)),
 										 c_r,
 										 c_keyboard,
 										 c_vendor,
@@ -226,6 +232,243 @@ class UInput(object):
 										 c_name)
 
 
+	def write(self, events):
+		""" Writes list of (type, code, value) tuples to device """
+		count = len(events)
+		types, codes, values = zip(*events)
+		self._lib.uinput_write(self._fd,
+							   ctypes.c_int(count),
+							   (ctypes.c_uint16 * count)(*types),
+							   (ctypes.c_uint16 * count)(*codes),
+							   (ctypes.c_int32 * count)(*values))
+
+
+	def set_delay_period(self, delay, period):
+		self._lib.uinput_set_delay_period(self._fd,
+										  ctypes.c_int32(delay),
+										  ctypes.c_int32(period))
+
+
+	def destroy(self):
+		self._lib.uinput_destroy(self._fd)
+
+
+# Constants from linux/uinput.h, used by NativeUInput
+def _IO(nr): return (ord('U') << 8) | nr
+def _IOW(nr, size): return (1 << 30) | (size << 16) | (ord('U') << 8) | nr
+UI_DEV_CREATE	= _IO(1)
+UI_DEV_DESTROY	= _IO(2)
+UI_SET_EVBIT	= _IOW(100, 4)
+UI_SET_KEYBIT	= _IOW(101, 4)
+UI_SET_RELBIT	= _IOW(102, 4)
+UI_SET_ABSBIT	= _IOW(103, 4)
+UI_SET_MSCBIT	= _IOW(104, 4)
+UINPUT_MAX_NAME_SIZE = 80
+BUS_USB = 0x03
+ABS_CNT = CHEAD['ABS_CNT']
+
+# struct input_event; timestamp is left zeroed, kernel fills it in
+INPUT_EVENT = struct.Struct(b"@%sxHHi" % (2 * struct.calcsize(b"@l"),))
+# struct uinput_user_dev: name, input_id, ff_effects_max,
+# absmax, absmin, absfuzz and absflat
+UINPUT_USER_DEV = struct.Struct(b"=%ss4HI%si" % (UINPUT_MAX_NAME_SIZE, 4 * ABS_CNT))
+
+
+class NativeUInput(object):
+	"""
+	Virtual device created by talking to /dev/uinput directly, without
+	libuinput. Events are packed into preallocated buffer and written
+	using single os.write call.
+
+	Throws OSError if /dev/uinput cannot be opened or configured.
+	"""
+
+	def __init__(self, vendor, product, name, keys, axes, rels, keyboard):
+		self._fd = -1
+		fd = os.open("/dev/uinput", os.O_WRONLY | os.O_NONBLOCK)
+		try:
+			absinfo = [ 0 ] * (4 * ABS_CNT)
+			if keys:
+				fcntl.ioctl(fd, UI_SET_EVBIT, EV_KEY)
+			for k in keys:
+				fcntl.ioctl(fd, UI_SET_KEYBIT, k)
+			if axes:
+				fcntl.ioctl(fd, UI_SET_EVBIT, EV_ABS)
+			for a, amin, amax, afuzz, aflat in axes:
+				fcntl.ioctl(fd, UI_SET_ABSBIT, a)
+				absinfo[a] = amax
+				absinfo[ABS_CNT + a] = amin
+				absinfo[2 * ABS_CNT + a] = afuzz
+				absinfo[3 * ABS_CNT + a] = aflat
+			if rels:
+				fcntl.ioctl(fd, UI_SET_EVBIT, EV_REL)
+			for r in rels:
+				fcntl.ioctl(fd, UI_SET_RELBIT, r)
+			if keyboard:
+				fcntl.ioctl(fd, UI_SET_EVBIT, EV_MSC)
+				fcntl.ioctl(fd, UI_SET_MSCBIT, MSC_SCAN)
+				fcntl.ioctl(fd, UI_SET_EVBIT, EV_REP)
+			os.write(fd, UINPUT_USER_DEV.pack(name, BUS_USB, vendor, product,
+				1, 0, *absinfo))
+			fcntl.ioctl(fd, UI_DEV_CREATE)
+		except:
+			os.close(fd)
+			raise
+		self._fd = fd
+		self._allocate(UInput.MAX_BUFFERED + 1)
+
+
+	def _allocate(self, count):
+		""" (Re)allocates buffer large enough for 'count' events """
+		self._size = count
+		self._buf = bytearray(INPUT_EVENT.size * count)
+		self._view = memoryview(self._buf)
+
+
+	def write(self, events):
+		""" Writes list of (type, code, value) tuples to device """
+		if len(events) > self._size:
+			self._allocate(len(events))
+		buf, pack_into, size = self._buf, INPUT_EVENT.pack_into, INPUT_EVENT.size
+		offset = 0
+		for type, code, value in events:
+			pack_into(buf, offset, type, code, value)
+			offset += size
+		try:
+			os.write(self._fd, self._view[0:offset])
+		except OSError:
+			# As with libuinput, failed write is not fatal
+			pass
+
+
+	def set_delay_period(self, delay, period):
+		self.write([ (EV_REP, REP_DELAY, delay), (EV_REP, REP_PERIOD, period) ])
+
+
+	def destroy(self):
+		if self._fd >= 0:
+			try:
+				fcntl.ioctl(self._fd, UI_DEV_DESTROY)
+			except IOError:
+				pass
+			os.close(self._fd)
+			self._fd = -1
+
+
+class NullUInput(object):
+	"""
+	Backend that creates no device and throws away everything written to it.
+	Doesn't need access to /dev/uinput.
+	"""
+
+	def __init__(self, vendor, product, name, keys, axes, rels, keyboard):
+		self.name = name
+
+
+	def write(self, events):
+		pass
+
+
+	def set_delay_period(self, delay, period):
+		pass
+
+
+	def destroy(self):
+		pass
+
+
+class RecordingUInput(NullUInput):
+	"""
+	Backend that creates no device and keeps everything written to it in
+	'events', as (time, type, code, value) tuples. All events written
+	together share same time. 'write_count' is number of writes device
+	would receive.
+
+	Only last MAX_EVENTS events are kept, so daemon started with this
+	backend doesn't run out of memory.
+	"""
+	MAX_EVENTS = 100000
+
+	def __init__(self, vendor, product, name, keys, axes, rels, keyboard):
+		NullUInput.__init__(self, vendor, product, name, keys, axes, rels, keyboard)
+		self.events = deque(maxlen=RecordingUInput.MAX_EVENTS)
+		self.write_count = 0
+
+
+	def write(self, events):
+		now = time.time()
+		self.write_count += 1
+		self.events.extend([ (now, type, code, value) for (type, code, value) in events ])
+
+
+	def set_delay_period(self, delay, period):
+		self.write([ (EV_REP, REP_DELAY, delay), (EV_REP, REP_PERIOD, period) ])
+
+
+	def clear(self):
+		self.events.clear()
+		self.write_count = 0
+
+
+BACKENDS = { "libuinput" : LibUInput, "native" : NativeUInput,
+	"null" : NullUInput, "recording" : RecordingUInput }
+_backend = None
+
+
+def set_backend(name):
+	"""
+	Selects how virtual devices are created. 'libuinput' uses compiled
+	library, 'native' writes to /dev/uinput directly and None (default)
+	uses libuinput if it's available, falling back to 'native' otherwise.
+	'null' and 'recording' create no device at all, see NullUInput and
+	RecordingUInput. Affects only devices created after call.
+
+	Throws KeyError if backend is not known.
+	"""
+	global _backend
+	_backend = None if name is None else BACKENDS[name]
+
+
+def get_backend():
+	""" Returns class used to create virtual devices """
+	if _backend is None:
+		if find_lib("libuinput", os.path.dirname(__file__))[0]:
+			return LibUInput
+		return NativeUInput
+	return _backend
+
+
+class UInput(object):
+	"""
+	UInput class permits to create a uinput device.
+
+	Generated events are buffered and written to device all at once,
+	using single syscall, when synEvent is called.
+
+	See Gamepad, Mouse, Keyboard for examples
+	"""
+
+	# Maximum number of events buffered before they are written even
+	# without synEvent being called
+	MAX_BUFFERED = 64
+
+	def __init__(self, vendor, product, name, keys, axes, rels, keyboard=False):
+		self.backend = None		# Object that events are written to
+		self._buffer = []
+		axes = axes or []
+		self._k = keys
+		self._a = [ a[0] for a in axes ]
+		self._r = rels
+		self.backend = get_backend()(vendor, product, name, keys, axes, rels, keyboard)
+
+
+	def _event(self, type, code, val):
+		""" Adds event to buffer, writing it if buffer is full """
+		self._buffer.append((type, code, val))
+		if len(self._buffer) >= self.MAX_BUFFERED:
+			self.flush()
+
+
 	def keyEvent(self, key, val):
 		"""
 		Generate a key or btn event
@@ -233,9 +476,7 @@ class UInput(object):
 		@param int axis		 key or btn event (KEY_* or BTN_*)
 		@param int val		  event value
 		"""
-		self._lib.uinput_key(self._fd,
-							 ctypes.c_uint16(key),
-							 ctypes.c_int32(val))
+		self._event(EV_KEY, key, val)
 
 
 	def axisEvent(self, axis, val):
@@ -245,9 +486,7 @@ class UInput(object):
 		@param int axis		 abs event (ABS_*)
 		@param int val		  event value
 		"""
-		self._lib.uinput_abs(self._fd,
-							 ctypes.c_uint16(axis),
-							 ctypes.c_int32(val))
+		self._event(EV_ABS, axis, val)
 
 	def relEvent(self, rel, val):
 		"""
@@ -256,9 +495,7 @@ class UInput(object):
 		@param int rel		  rel event (REL_*)
 		@param int val		  event value
 		"""
-		self._lib.uinput_rel(self._fd,
-							 ctypes.c_uint16(rel),
-							 ctypes.c_int32(val))
+		self._event(EV_REL, rel, val)
 
 	def scanEvent(self, val):
 		"""
@@ -266,14 +503,25 @@ class UInput(object):
 
 		@param int val		  scan event value (scancode)
 		"""
-		self._lib.uinput_scan(self._fd,
-							  ctypes.c_int32(val))
+		self._event(EV_MSC, MSC_SCAN, val)
 
 	def synEvent(self):
 		"""
-		Generate a syn event
+		Generate a syn event and write all buffered events to device.
+		Does nothing if there are no buffered events.
 		"""
-		self._lib.uinput_syn(self._fd)
+		if len(self._buffer):
+			self._buffer.append((EV_SYN, SYN_REPORT, 0))
+			self.flush()
+
+
+	def flush(self):
+		"""
+		Writes all buffered events to device using single syscall.
+		"""
+		if len(self._buffer):
+			self.backend.write(self._buffer)
+			self._buffer = []
 
 
 	def setDelayPeriod(self, delay, period):
@@ -284,9 +532,8 @@ class UInput(object):
 		@param int period	   period is ms
 		"""
 
-		self._lib.uinput_set_delay_period(self._fd,
-										  ctypes.c_int32(delay),
-										  ctypes.c_int32(period))
+		self.flush()
+		self.backend.set_delay_period(delay, period)
 
 	def keyManaged(self, ev):
 		return ev in self._k
@@ -299,8 +546,9 @@ class UInput(object):
 
 
 	def __del__(self):
-		if self._lib:
-			self._lib.uinput_destroy(self._fd)
+		if self.backend is not None:
+			self.flush()
+			self.backend.destroy()
 
 
 class Gamepad(UInput):
@@ -341,6 +589,9 @@ class Mouse(UInput):
 
 	moveEvent can emulate free ball rotation of a track ball
 	updateParams permit to upgrade ball model and move scale
+
+	moveEvent and scrollEvent don't generate syn event, so events generated
+	in multiple calls can be written together. Call synEvent when done.
 	"""
 
 	DEFAULT_FRICTION = 10.0
@@ -369,18 +620,10 @@ class Mouse(UInput):
 										  Rels.REL_Y,
 										  Rels.REL_WHEEL,
 										  Rels.REL_HWHEEL])
-		self._dx = 0.0
-		self._dy = 0.0
-		self._xvel = 0.0
-		self._yvel = 0.0
-		self._lastTime = time.time()
+		self._ball = BallPhysics()
 		self.updateParams()
 
-		self._scr_dx = 0.0
-		self._scr_dy = 0.0
-		self._scr_xvel = 0.0
-		self._scr_yvel = 0.0
-		self._scr_lastTime = time.time()
+		self._scr_ball = BallPhysics()
 		self.updateScrollParams()
 
 
@@ -404,20 +647,7 @@ class Mouse(UInput):
 		@param float xscale	 scale applied on move param to input event on x axis
 		@param float yscale	 scale applied on move param to input event on y axis
 		"""
-		self._xscale = xscale
-		self._yscale = yscale
-
-		self._ampli  = ampli
-		self._degree = degree
-		self._radscale = (degree * pi / 180) / ampli
-		self._mass = mass
-		self._friction = friction
-		self._r = r
-		self._I = (2 * self._mass * self._r**2) / 5.0
-		self._a = self._r * self._friction / self._I
-
-		self._xvel_dq = deque(maxlen=mean_len)
-		self._yvel_dq = deque(maxlen=mean_len)
+		self._ball.set_params(mass, r, friction, ampli, degree, xscale, yscale, mean_len)
 
 	def updateScrollParams(self,
 						   mass=20.0,
@@ -439,190 +669,72 @@ class Mouse(UInput):
 		@param float xscale	 scale applied on move param to input event on x axis
 		@param float yscale	 scale applied on move param to input event on y axis
 		"""
-		self._scr_xscale = xscale
-		self._scr_yscale = yscale
-		self._scr_ampli  = ampli
-		self._scr_degree = degree
-		self._scr_radscale = (degree * pi / 180) / ampli
-		self._scr_mass = mass
-		self._scr_friction = friction
-		self._scr_r = r
-		self._scr_I = (2 * self._scr_mass * self._scr_r**2) / 5.0
-		self._scr_a = self._scr_r * self._scr_friction / self._scr_I
-
-		self._scr_xvel_dq = deque(maxlen=mean_len)
-		self._scr_yvel_dq = deque(maxlen=mean_len)
-
-
-	def moveEvent(self, dx=0, dy=0, free=False):
+		self._scr_ball.set_params(mass, r, friction, ampli, degree, xscale, yscale, mean_len)
+
+
+	def moveEvent(self, dx=0, dy=0, free=False, now=None):
 		"""
 		Generate move events from parametters and displacement
 
 		@param int dx		   delta movement from last call on x axis
 		@param int dy		   delta movement from last call on y axis
 		@param bool free		set to true for free ball move
+		@param float now		current time, as passed to Mapper.callback;
+								time.time() is used if not set
 
 		@return float		   absolute distance moved this tick
 
 		"""
-		# Compute time step
-		_tmp = time.time()
-		dt = _tmp - self._lastTime
-		self._lastTime = _tmp
-
-		def _genevt():
-			_syn = False
-			if int(self._dx):
-				self.relEvent(rel=Rels.REL_X, val=int(self._dx))
-				self._dx -= int(self._dx)
-				_syn = True
-			if int(self._dy):
-				self.relEvent(rel=Rels.REL_Y, val=int(self._dy))
-				self._dy -= int(self._dy)
-				_syn = True
-			if _syn:
-				self.synEvent()
-
-		if not free:
-			# Compute mouse mouvement from interger part of d * scale
-			self._dx += dx * self._xscale
-			self._dy += dy * self._yscale
-
-			_genevt()
-
-			# Compute instant velocity
-			try:
-				self._xvel = sum(self._xvel_dq) / len(self._xvel_dq)
-				self._yvel = sum(self._yvel_dq) / len(self._yvel_dq)
-			except ZeroDivisionError:
-				self._xvel = 0.0
-				self._yvel = 0.0
-
-			self._xvel_dq.append(dx * self._radscale / dt)
-			self._yvel_dq.append(dy * self._radscale / dt)
-
+		ball = self._ball
+		if now is None:
+			now = time.time()
+		if free:
+			dist = ball.roll(now)
 		else:
-
-
-			# Free movement update velocity and compute movement
-			self._xvel_dq.clear()
-			self._yvel_dq.clear()
-
-			_hyp = sqrt((self._xvel**2) + (self._yvel**2))
-			if _hyp != 0.0:
-				_ax = self._a * (abs(self._xvel) / _hyp)
-				_ay = self._a * (abs(self._yvel) / _hyp)
-			else:
-				_ax = self._a
-				_ay = self._a
-
-			# Cap friction desceleration
-			_dvx = min(abs(self._xvel), _ax * dt)
-			_dvy = min(abs(self._yvel), _ay * dt)
-			
-			# compute new velocity
-			_xvel = self._xvel - copysign(_dvx, self._xvel)
-			_yvel = self._yvel - copysign(_dvy, self._yvel)
-
-			# compute displacement
-			dx = (((_xvel + self._xvel) / 2) * dt) / self._radscale
-			dy = (((_yvel + self._yvel) / 2) * dt) / self._radscale
-
-			self._xvel = _xvel
-			self._yvel = _yvel
-
-			self._dx += dx * self._xscale
-			self._dy += dy * self._yscale
-
-			_genevt()
-
-		return sqrt((dx**2) + (dy**2))
-
-	def scrollEvent(self, dx=0, dy=0, free=False):
+			dist = ball.push(dx, dy, now)
+		if ball.ix:
+			self._event(EV_REL, Rels.REL_X, ball.ix)
+		if ball.iy:
+			self._event(EV_REL, Rels.REL_Y, ball.iy)
+		return dist
+
+	def scrollEvent(self, dx=0, dy=0, free=False, now=None):
 		"""
 		Generate scroll events from parametters and displacement
 
 		@param int dx		   delta movement from last call on x axis
 		@param int dy		   delta movement from last call on y axis
 		@param bool free		set to true for free ball move
+		@param float now		current time, as passed to Mapper.callback;
+								time.time() is used if not set
 
-		@return float		   absolute distance moved this tick
+		@return bool		   True if any scroll event was generated
 
 		"""
-		# Compute time step
-		_tmp = time.time()
-		dt = _tmp - self._scr_lastTime
-		self._scr_lastTime = _tmp
-		
-		a_dx, a_dy = dx, dy
-
-		def _genevt():
-			_syn = False
-			if int(self._scr_dx):
-				self.relEvent(rel=Rels.REL_HWHEEL, val=int(copysign(1, self._scr_dx)))
-				self._scr_dx -= int(self._scr_dx)
-				_syn = True
-			if int(self._scr_dy):
-				self.relEvent(rel=Rels.REL_WHEEL,  val=int(copysign(1, self._scr_dy)))
-				self._scr_dy -= int(self._scr_dy)
-				_syn = True
-			if _syn:
-				self.synEvent()
-			return _syn
-
-		if not free:
-			# Compute mouse mouvement from interger part of d * scale
-			self._scr_dx += dx * self._scr_xscale
-			self._scr_dy += dy * self._scr_yscale
-
-			_nev = _genevt()
-
-			# Compute instant velocity
-			try:
-				self._scr_xvel = sum(self._scr_xvel_dq) / len(self._scr_xvel_dq)
-				self._scr_yvel = sum(self._scr_yvel_dq) / len(self._scr_yvel_dq)
-			except ZeroDivisionError:
-				self._scr_xvel = 0.0
-				self._scr_yvel = 0.0
-
-			self._scr_xvel_dq.append(dx * self._scr_radscale / dt)
-			self._scr_yvel_dq.append(dy * self._scr_radscale / dt)
-
+		ball = self._scr_ball
+		if now is None:
+			now = time.time()
+		if free:
+			ball.roll(now)
 		else:
-			# Free movement update velocity and compute movement
-
-			self._scr_xvel_dq.clear()
-			self._scr_yvel_dq.clear()
-
-			_hyp = sqrt((self._scr_xvel**2) + (self._scr_yvel**2))
-			if _hyp != 0.0:
-				_ax = self._scr_a * (abs(self._scr_xvel) / _hyp)
-				_ay = self._scr_a * (abs(self._scr_yvel) / _hyp)
-			else:
-				_ax = self._scr_a
-				_ay = self._scr_a
-
-			# Cap friction desceleration
-			_dvx = min(abs(self._scr_xvel), _ax * dt)
-			_dvy = min(abs(self._scr_yvel), _ay * dt)
-
-			# compute new velocity
-			_xvel = self._scr_xvel - copysign(_dvx, self._scr_xvel)
-			_yvel = self._scr_yvel - copysign(_dvy, self._scr_yvel)
-
-			# compute displacement
-			dx = (((_xvel + self._scr_xvel) / 2) * dt) / self._scr_radscale
-			dy = (((_yvel + self._scr_yvel) / 2) * dt) / self._scr_radscale
-
-			self._scr_xvel = _xvel
-			self._scr_yvel = _yvel
-
-			self._scr_dx += dx * self._scr_xscale
-			self._scr_dy += dy * self._scr_yscale
-
-			_nev = _genevt()
-		
-		return _nev
+			ball.push(dx, dy, now)
+		if ball.ix:
+			self._event(EV_REL, Rels.REL_HWHEEL, 1 if ball.ix > 0 else -1)
+		if ball.iy:
+			self._event(EV_REL, Rels.REL_WHEEL, 1 if ball.iy > 0 else -1)
+		if free and ball.steps and not (ball.ix or ball.iy):
+			# Free scrolling stops as soon as ball is not fast enough
+			# to scroll at least once per update
+			ball.stop()
+		return bool(ball.ix or ball.iy)
+
+	def isMoving(self):
+		""" Returns True while trackball emulated by moveEvent is rolling """
+		return self._ball.is_rolling()
+
+	def isScrolling(self):
+		""" Returns True while trackball emulated by scrollEvent is rolling """
+		return self._scr_ball.is_rolling()
 
 
 class Keyboard(UInput):
@@ -0,0 +1,45 @@
+"""
+Helpers shared by tests.
+
+Run tests using 'python2 -m unittest discover' in source directory.
+"""
+from __future__ import unicode_literals
+
+from scc.constants import CI_STRUCT, SCStatus, SCButtons
+import os, math
+
+DEFAULT_PROFILES = os.path.join(os.path.dirname(__file__), "..", "default_profiles")
+DATA = os.path.join(os.path.dirname(__file__), "data")
+
+
+def packet(seq, buttons=0, ltrig=0, rtrig=0, lpad=(0, 0), rpad=(0, 0), gyro=(0, 0, 0)):
+	""" Returns 64B input packet, as controller would send it """
+	return CI_STRUCT.pack(1, SCStatus.INPUT, seq, buttons, ltrig, rtrig,
+		lpad[0], lpad[1], rpad[0], rpad[1], gyro[0], gyro[1], gyro[2],
+		1000, 2000, 3000, 4000)
+
+
+def synthetic_input(count):
+	"""
+	Returns list of 'count' packets that press buttons in overlapping
+	patterns, touch both pads, move stick, triggers and gyro.
+	"""
+	rv = []
+	for i in xrange(count):
+		buttons = 0
+		for n, b in enumerate((SCButtons.A, SCButtons.B, SCButtons.X, SCButtons.Y,
+					SCButtons.LB, SCButtons.START, SCButtons.RPAD)):
+			if (i // (37 + 11 * n)) % 2:
+				buttons |= b
+		if (i // 100) % 2:
+			buttons |= SCButtons.RPADTOUCH
+		if (i // 130) % 3 == 1:
+			# Left pad and stick share same fields
+			buttons |= SCButtons.LPADTOUCH
+			lpad = int(25000 * math.sin(i / 17.0)), int(25000 * math.cos(i / 17.0))
+		else:
+			lpad = int(30000 * math.sin(i / 30.0)), int(25000 * math.cos(i / 23.0)) if (i // 200) % 2 else 0
+		rv.append(packet(i, buttons, (i * 7) % 256, (i * 3) % 256, lpad,
+			(int(20000 * math.cos(i / 10.0)), i * 10 % 30000),
+			(int(300 * math.sin(i / 5.0)), int(200 * math.cos(i / 7.0)), int(100 * math.sin(i / 3.0)))))
+	return rv
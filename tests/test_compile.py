@@ -0,0 +1,55 @@
+#!/usr/bin/env python2
+from __future__ import unicode_literals
+
+from scc.uinput import set_backend
+from scc.parser import TalkingActionParser
+from scc.replay import ReplayController
+from scc.profile import Profile
+from scc.mapper import Mapper
+from tests import DEFAULT_PROFILES, synthetic_input
+
+import os, unittest
+
+
+class TestCompiledHandlers(unittest.TestCase):
+	"""
+	Compiled handlers have to generate exactly same events as methods
+	of actions they were compiled from.
+	"""
+
+	def setUp(self):
+		set_backend("recording")
+
+
+	def tearDown(self):
+		set_backend(None)
+
+
+	def run_profile(self, filename, packets, compile):
+		p = Profile(TalkingActionParser())
+		p.COMPILE = compile
+		p.load(filename).compress()
+		mapper = Mapper(p)
+		controller = ReplayController(mapper.callback)
+		controller.configure_controller(enable_gyros=True)
+		mapper.set_controller(controller)
+		feedback = []
+		controller.addFeedback = lambda *a, **b : feedback.append((a, b))
+		for i in xrange(len(packets)):
+			controller.feed(packets[i], 10.0 + i * 0.004)
+		return feedback, [ [ e[1:] for e in dev.backend.events ]
+			for dev in (mapper.gamepad, mapper.keyboard, mapper.mouse) ]
+
+
+	def test_default_profiles(self):
+		packets = synthetic_input(3000)
+		for name in sorted(os.listdir(DEFAULT_PROFILES)):
+			filename = os.path.join(DEFAULT_PROFILES, name)
+			interpreted = self.run_profile(filename, packets, False)
+			compiled = self.run_profile(filename, packets, True)
+			self.assertTrue(sum(map(len, interpreted[1])) > 0, name)
+			self.assertEqual(interpreted, compiled, name)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python2
+from __future__ import unicode_literals
+
+from scc.parser import TalkingActionParser
+from scc.menu_cache import MenuCache
+from scc.menu_data import MenuData
+from scc.uinput import Keys
+
+import os, json, shutil, tempfile, unittest
+
+
+class TestMenuData(unittest.TestCase):
+
+	def test_duplicate_ids(self):
+		m = MenuData.from_json_data([
+			{ "id" : "a", "name" : "First", "action" : "button(Keys.KEY_A)" },
+			{ "id" : "b", "name" : "Second", "action" : "button(Keys.KEY_B)" },
+			{ "id" : "a", "name" : "Third", "action" : "button(Keys.KEY_C)" },
+		], TalkingActionParser())
+		self.assertEqual([ i.label for i in m ], [ "First", "Second", "Third" ])
+		# First item with duplicated ID wins, as it did before index was used
+		self.assertIs(m.get_by_id("a"), m[0])
+		self.assertEqual(m.get_by_id("a").action.button, Keys.KEY_A)
+		self.assertRaises(KeyError, m.get_by_id, "c")
+
+
+	def test_from_args(self):
+		m = MenuData.from_args([ "a", "First", "a", "Second" ])
+		self.assertEqual(m.get_by_id("a").label, "First")
+
+
+class TestMenuCache(unittest.TestCase):
+
+	def setUp(self):
+		self.tmp = tempfile.mkdtemp()
+		self.cache = MenuCache()
+
+
+	def tearDown(self):
+		shutil.rmtree(self.tmp)
+
+
+	def write(self, name, label, mtime=1000):
+		filename = os.path.join(self.tmp, name)
+		open(filename, "w").write(json.dumps([ { "id" : "item", "name" : label } ]))
+		os.utime(filename, (mtime, mtime))
+		return filename
+
+
+	def label(self, filename):
+		return self.cache.get(filename).get_by_id("item").label
+
+
+	def test_mtime(self):
+		filename = self.write("a.menu", "First")
+		menu = self.cache.get(filename)
+		self.assertIs(self.cache.get(filename), menu)
+		# Same size and mtime, file is not read again
+		self.write("a.menu", "Other")
+		self.assertEqual(self.label(filename), "First")
+		self.write("a.menu", "Other", mtime=2000)
+		self.assertEqual(self.label(filename), "Other")
+
+
+	def test_get_cached(self):
+		filename = self.write("a.menu", "First")
+		menu = self.cache.get(filename)
+		self.write("a.menu", "Second", mtime=2000)
+		self.assertIs(self.cache.get_cached(filename), menu)
+		self.assertEqual(self.label(filename), "Second")
+
+
+	def test_eviction(self):
+		self.cache.SIZE = 2
+		a, b, c = [ self.write(x, x) for x in ("a.menu", "b.menu", "c.menu") ]
+		menu_a, menu_b = self.cache.get(a), self.cache.get(b)
+		self.cache.get(a)
+		self.cache.get(c)
+		# 'b' was least recently used
+		self.assertIs(self.cache.get(a), menu_a)
+		self.assertIsNot(self.cache.get(b), menu_b)
+
+
+	def test_removed_file(self):
+		filename = self.write("a.menu", "First")
+		self.cache.get(filename)
+		os.unlink(filename)
+		self.assertRaises(IOError, self.cache.get, filename)
+		self.assertRaises(IOError, self.cache.get_cached, filename)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python2
+from __future__ import unicode_literals
+
+from scc.parser import ActionParser, ParseError, tokenize
+from scc.uinput import Keys
+
+import token as TokenType
+import unittest
+
+
+class TestScanner(unittest.TestCase):
+
+	def assertErrorAt(self, string, column):
+		""" Checks that parsing fails at 'column' (counted from 0) """
+		try:
+			ActionParser(string).parse()
+		except ParseError, e:
+			self.assertEqual(e.column, column, "%r: %s" % (string, e))
+			self.assertIn("(at column %s)" % (column + 1,), unicode(e))
+			return
+		self.fail("%r was parsed" % (string,))
+
+
+	def test_tokens(self):
+		self.assertEqual([ tuple(t) for t in tokenize('a(0x10, -1.5,\t"x\\"y")\n') ], [
+			(TokenType.NAME, "a", 0), (TokenType.OP, "(", 1),
+			(TokenType.NUMBER, "0x10", 2), (TokenType.OP, ",", 6),
+			(TokenType.OP, "-", 8), (TokenType.NUMBER, "1.5", 9),
+			(TokenType.OP, ",", 12), (TokenType.STRING, '"x\\"y"', 14),
+			(TokenType.OP, ")", 20), (TokenType.NEWLINE, "\n", 21),
+		])
+
+
+	def test_parse(self):
+		a = ActionParser("button(Keys.KEY_A)").parse()
+		self.assertEqual(a.COMMAND, "button")
+		self.assertEqual(a.parameters[0], Keys.KEY_A)
+		self.assertEqual(ActionParser("osd('a\\'b')").parse().text, "a'b")
+
+
+	def test_error_columns(self):
+		self.assertErrorAt("button(Keys.KEY_A) ?", 19)
+		self.assertErrorAt("osd('abc", 4)
+		self.assertErrorAt("button(Keys.KEY_A", 17)
+		self.assertErrorAt("button(Keys.KEY_A) and", 22)
+		self.assertErrorAt("foo(1)", 0)
+		self.assertErrorAt("button(Keys.NOPE)", 12)
+		self.assertErrorAt("  button(Keys.KEY_A))", 20)
+
+
+	def test_unicode_prefix(self):
+		# u'...' was accepted by tokenize module, but action language
+		# has no string prefixes
+		self.assertErrorAt("osd(u'abc')", 4)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python2
+from __future__ import unicode_literals
+
+from scc.profile_cache import Encoder, Decoder, FIELDS, load_profile, get_cache_filename
+from scc.parser import TalkingActionParser
+from scc.uinput import set_backend
+from scc.replay import ReplayController
+from scc.mapper import Mapper
+from scc.constants import SCButtons
+from scc.actions import NoAction
+from scc.profile import Profile
+from scc.uinput import Keys
+from tests import DEFAULT_PROFILES, synthetic_input
+import scc.profile_cache
+
+import os, json, shutil, tempfile, unittest
+
+
+class TestProfileCache(unittest.TestCase):
+
+	def setUp(self):
+		set_backend("recording")
+		self.tmp = tempfile.mkdtemp()
+		self.old_env = os.environ.get("XDG_CACHE_HOME")
+		os.environ["XDG_CACHE_HOME"] = os.path.join(self.tmp, "cache")
+		self.filename = os.path.join(self.tmp, "test.sccprofile")
+		shutil.copy(os.path.join(DEFAULT_PROFILES, "XBox Controller.sccprofile"), self.filename)
+		# Counts profiles that were parsed instead of loaded from cache
+		self.parsed = 0
+		def load_data(profile, data):
+			self.parsed += 1
+			return self.load_data(profile, data)
+		self.load_data, Profile.load_data = Profile.load_data, load_data
+
+
+	def tearDown(self):
+		set_backend(None)
+		Profile.load_data = self.load_data
+		if self.old_env is None:
+			del os.environ["XDG_CACHE_HOME"]
+		else:
+			os.environ["XDG_CACHE_HOME"] = self.old_env
+		shutil.rmtree(self.tmp)
+
+
+	def events(self, p):
+		""" Returns events generated by profile, to compare two profiles """
+		mapper = Mapper(p)
+		controller = ReplayController(mapper.callback)
+		controller.configure_controller(enable_gyros=True)
+		mapper.set_controller(controller)
+		for i, data in enumerate(synthetic_input(1000)):
+			controller.feed(data, 10.0 + i * 0.004)
+		return [ [ e[1:] for e in dev.backend.events ]
+			for dev in (mapper.gamepad, mapper.keyboard, mapper.mouse) ]
+
+
+	def test_round_trip(self):
+		shared = [ Keys.KEY_A, NoAction() ]
+		value = { "a" : (1, 2.5, "x", None), "b" : shared, "c" : shared,
+			"s" : set([ SCButtons.A ]) }
+		decoded = Decoder().decode(Encoder().encode(value))
+		self.assertEqual(decoded, value)
+		self.assertIs(decoded["b"], decoded["c"])
+		self.assertIs(decoded["b"][0], Keys.KEY_A)
+		self.assertIs(decoded["b"][1], NoAction())
+
+
+	def test_default_profiles(self):
+		for name in os.listdir(DEFAULT_PROFILES):
+			filename = os.path.join(DEFAULT_PROFILES, name)
+			p = Profile(TalkingActionParser()).load(filename)
+			p.compress()
+			encoder, decoder = Encoder(), Decoder()
+			cached = Profile(TalkingActionParser())
+			for name in FIELDS:
+				setattr(cached, name, decoder.decode(encoder.encode(getattr(p, name))))
+			cached.compile()
+			self.assertEqual(self.events(cached), self.events(p), filename)
+
+
+	def test_load(self):
+		p = load_profile(self.filename, TalkingActionParser())
+		self.assertTrue(os.path.exists(get_cache_filename(self.filename)))
+		cached = load_profile(self.filename, TalkingActionParser())
+		self.assertEqual(self.parsed, 1)
+		self.assertIsNot(cached.buttons[SCButtons.A], p.buttons[SCButtons.A])
+		self.assertEqual(self.events(cached), self.events(p))
+
+
+	def test_changed_file(self):
+		load_profile(self.filename, TalkingActionParser())
+		data = json.loads(open(self.filename, "r").read())
+		data["buttons"]["A"] = { "action" : "button(Keys.KEY_Z)" }
+		open(self.filename, "w").write(json.dumps(data))
+		p = load_profile(self.filename, TalkingActionParser())
+		self.assertEqual(self.parsed, 2)
+		self.assertEqual(p.buttons[SCButtons.A].button, Keys.KEY_Z)
+		load_profile(self.filename, TalkingActionParser())
+		self.assertEqual(self.parsed, 2)
+
+
+	def test_format_version(self):
+		load_profile(self.filename, TalkingActionParser())
+		scc.profile_cache.FORMAT_VERSION += 1
+		try:
+			load_profile(self.filename, TalkingActionParser())
+			load_profile(self.filename, TalkingActionParser())
+		finally:
+			scc.profile_cache.FORMAT_VERSION -= 1
+		self.assertEqual(self.parsed, 2)
+
+
+	def test_invalid_cache(self):
+		load_profile(self.filename, TalkingActionParser())
+		open(get_cache_filename(self.filename), "wb").write(b"garbage")
+		p = load_profile(self.filename, TalkingActionParser())
+		self.assertEqual(self.parsed, 2)
+		self.assertEqual(p.buttons[SCButtons.A].button, Keys.BTN_GAMEPAD)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python2
+from __future__ import unicode_literals
+
+from scc.uinput import Keys, Axes, set_backend
+from scc.uinput import EV_SYN, EV_KEY, EV_ABS, SYN_REPORT
+from scc.constants import SCButtons
+from scc.replay import create_mapper, replay
+from tests import DEFAULT_PROFILES, DATA, packet
+
+import os, unittest
+
+SYN = (EV_SYN, SYN_REPORT, 0)
+
+
+class TestReplay(unittest.TestCase):
+
+	def tearDown(self):
+		set_backend(None)
+
+
+	def test_event_stream(self):
+		mapper, controller = create_mapper(os.path.join(DEFAULT_PROFILES, "XBox Controller.sccprofile"))
+		controller.feed(packet(1, SCButtons.A), 1.00)
+		controller.feed(packet(2, SCButtons.A, lpad=(16000, -16000)), 1.01)
+		controller.feed(packet(3, ltrig=255), 1.02)
+		controller.feed(packet(4), 1.03)
+		self.assertEqual([ e[1:] for e in mapper.gamepad.backend.events ], [
+			(EV_KEY, Keys.BTN_GAMEPAD, 1), SYN,
+			(EV_ABS, Axes.ABS_X, 16000), (EV_ABS, Axes.ABS_Y, 16000), SYN,
+			(EV_KEY, Keys.BTN_GAMEPAD, 0), (EV_ABS, Axes.ABS_X, 0), (EV_ABS, Axes.ABS_Y, 0),
+				(EV_ABS, Axes.ABS_Z, 255), SYN,
+			(EV_ABS, Axes.ABS_Z, 0), SYN,
+		])
+		self.assertEqual(mapper.gamepad.backend.write_count, 4)
+		self.assertEqual(len(mapper.mouse.backend.events), 0)
+
+
+	def test_recording(self):
+		"""
+		Replays 'synthetic.sccrec', 300 packets of tests.synthetic_input
+		recorded 4ms apart.
+		"""
+		mapper, controller = create_mapper(os.path.join(DEFAULT_PROFILES, "XBox Controller.sccprofile"))
+		self.assertEqual(replay(controller, os.path.join(DATA, "synthetic.sccrec"), 0), 300)
+		self.assertAlmostEqual(mapper.now, 299 * 0.004)
+		events = [ e[1:] for e in mapper.gamepad.backend.events ]
+		# Left trigger changes with every packet after first one
+		self.assertEqual(mapper.gamepad.backend.write_count, 299)
+		self.assertEqual(events.count(SYN), 299)
+		self.assertEqual(
+			[ value for type, code, value in events if (type, code) == (EV_ABS, Axes.ABS_Z) ],
+			[ (i * 7) % 256 for i in xrange(1, 300) ])
+		# A is pressed and released every 37 packets
+		self.assertEqual(
+			[ value for type, code, value in events if (type, code) == (EV_KEY, Keys.BTN_GAMEPAD) ],
+			[ 1, 0, 1, 0, 1, 0, 1, 0 ])
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python2
+from __future__ import unicode_literals
+
+from scc.smoothing import RunningMean
+
+import random, unittest
+
+
+def reference_mean(values, weighted):
+	""" Returns mean computed directly from list of values """
+	if weighted:
+		weights = range(1, len(values) + 1)
+		return sum([ w * v for (w, v) in zip(weights, values) ]) / sum(weights)
+	return sum(values) / len(values)
+
+
+class TestRunningMean(unittest.TestCase):
+
+	def check(self, size, weighted, values):
+		m = RunningMean(size, weighted)
+		for i in xrange(len(values)):
+			m.add(values[i])
+			last = values[max(0, i + 1 - size):i + 1]
+			self.assertEqual(len(m), len(last))
+			self.assertAlmostEqual(m.mean(), reference_mean(last, weighted),
+				msg="size %s, weighted %s, %s values" % (size, weighted, i + 1))
+
+
+	def test_unweighted(self):
+		m = RunningMean(3)
+		for x in (3, 4, 8, 1):
+			m.add(x)
+		self.assertEqual(m.mean(), (4 + 8 + 1) / 3)
+
+
+	def test_weighted(self):
+		m = RunningMean(3, weighted=True)
+		for x in (3.0, 4.0, 8.0, 1.0):
+			m.add(x)
+		self.assertEqual(m.mean(), (1 * 4.0 + 2 * 8.0 + 3 * 1.0) / 6)
+
+
+	def test_integer_division(self):
+		# Same as sum(values) / len(values) in Python 2
+		self.check(4, False, [ 5, -7, 2, 9, -3, 1, 1 ])
+		self.check(4, True, [ 5, -7, 2, 9, -3, 1, 1 ])
+		m = RunningMean(2)
+		m.add(1); m.add(2)
+		self.assertIs(type(m.mean()), int)
+		self.assertEqual(m.mean(), 1)
+
+
+	def test_random(self):
+		r = random.Random(0)
+		ints = [ r.randint(-1000, 1000) for x in xrange(200) ]
+		floats = [ r.uniform(-1000, 1000) for x in xrange(200) ]
+		for size in (1, 2, 3, 8):
+			for weighted in (False, True):
+				self.check(size, weighted, ints)
+				self.check(size, weighted, floats)
+
+
+	def test_clear(self):
+		m = RunningMean(3, weighted=True)
+		self.assertRaises(ZeroDivisionError, m.mean)
+		m.add(10)
+		m.clear()
+		self.assertEqual(len(m), 0)
+		m.add(4)
+		self.assertEqual(m.mean(), 4)
+
+
+if __name__ == '__main__':
+	unittest.main()
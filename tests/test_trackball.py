@@ -0,0 +1,85 @@
+#!/usr/bin/env python2
+from __future__ import unicode_literals
+
+from scc.trackball import BallPhysics
+from scc.uinput import Mouse, set_backend
+
+import unittest
+
+
+def make_ball():
+	ball = BallPhysics()
+	ball.set_params(80, 0.02, 10.0, 32768.0, 40.0, 0.1, 0.1, 10)
+	return ball
+
+
+def push_and_roll(ball, rolls, interval):
+	""" Pushes ball for a while, then lets it roll. Returns total movement """
+	t, x, y = 100.0, 0, 0
+	for i in xrange(20):
+		t += 0.004
+		ball.push(3000, -1200, t)
+		x, y = x + ball.ix, y + ball.iy
+	for i in xrange(rolls):
+		t += interval
+		ball.roll(t)
+		x, y = x + ball.ix, y + ball.iy
+	return x, y
+
+
+class TestBallPhysics(unittest.TestCase):
+
+	def test_same_time_same_movement(self):
+		self.assertEqual(push_and_roll(make_ball(), 100, 0.004),
+			push_and_roll(make_ball(), 100, 0.004))
+
+
+	def test_ball_stops(self):
+		ball = make_ball()
+		push_and_roll(ball, 10, 0.5)
+		self.assertFalse(ball.is_rolling())
+
+
+	def test_slow_update_keeps_momentum(self):
+		# Ball rolls same distance whether it's updated 250 times
+		# every 4ms or just once after one second
+		x1, y1 = push_and_roll(make_ball(), 250, 0.004)
+		x2, y2 = push_and_roll(make_ball(), 1, 1.0)
+		self.assertNotEqual((x1, y1), (0, 0))
+		self.assertTrue(abs(x1 - x2) <= 1 and abs(y1 - y2) <= 1, ((x1, y1), (x2, y2)))
+
+
+	def test_clock_going_back(self):
+		ball = make_ball()
+		push_and_roll(ball, 0, 0)
+		ball.roll(50.0)
+		self.assertEqual((ball.ix, ball.iy, ball.steps), (0, 0, 0))
+
+
+class TestMouse(unittest.TestCase):
+
+	def setUp(self):
+		set_backend("recording")
+
+
+	def tearDown(self):
+		set_backend(None)
+
+
+	def test_move_event_uses_passed_time(self):
+		rv = []
+		for x in xrange(2):
+			m = Mouse()
+			for i in xrange(10):
+				m.moveEvent(500, 200, False, 1.0 + i * 0.01)
+				m.synEvent()
+			for i in xrange(20):
+				m.moveEvent(0, 0, True, 1.1 + i * 0.01)
+				m.synEvent()
+			rv.append([ e[1:] for e in m.backend.events ])
+		self.assertTrue(len(rv[0]) > 20)
+		self.assertEqual(rv[0], rv[1])
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python2
+from __future__ import unicode_literals
+
+from scc.uinput import NativeUInput, INPUT_EVENT, UINPUT_USER_DEV
+from scc.uinput import ABS_CNT, BUS_USB, UINPUT_MAX_NAME_SIZE
+from scc.uinput import EV_KEY, EV_REL, EV_SYN, SYN_REPORT, Keys, Rels
+
+import os, struct, unittest
+
+
+class TestNativeUInput(unittest.TestCase):
+	""" Checks that structures written to /dev/uinput match linux/uinput.h """
+
+	def test_input_event(self):
+		# struct timeval (two longs), __u16 type, __u16 code, __s32 value
+		size = 2 * struct.calcsize(b"@l")
+		self.assertEqual(INPUT_EVENT.size, size + 8)
+		data = INPUT_EVENT.pack(EV_REL, Rels.REL_X, -5)
+		self.assertEqual(data[0:size], b"\x00" * size)
+		self.assertEqual(struct.unpack(b"@HHi", data[size:]), (EV_REL, Rels.REL_X, -5))
+		self.assertEqual(INPUT_EVENT.unpack(data), (EV_REL, Rels.REL_X, -5))
+
+
+	def test_uinput_user_dev(self):
+		self.assertEqual(ABS_CNT, 64)
+		# name, struct input_id, __u32 ff_effects_max and four __s32[ABS_CNT]
+		self.assertEqual(UINPUT_USER_DEV.size, UINPUT_MAX_NAME_SIZE + 8 + 4 + 16 * ABS_CNT)
+		absinfo = range(4 * ABS_CNT)
+		data = UINPUT_USER_DEV.pack(b"Test", BUS_USB, 0x28de, 0x1142, 1, 0, *absinfo)
+		self.assertEqual(data[0:UINPUT_MAX_NAME_SIZE], b"Test".ljust(UINPUT_MAX_NAME_SIZE, b"\x00"))
+		self.assertEqual(struct.unpack_from(b"=4HI", data, UINPUT_MAX_NAME_SIZE),
+			(BUS_USB, 0x28de, 0x1142, 1, 0))
+		self.assertEqual(list(struct.unpack_from(b"=%si" % (4 * ABS_CNT,), data,
+			UINPUT_MAX_NAME_SIZE + 12)), absinfo)
+
+
+	def test_write(self):
+		# Device is not created, events are written into pipe instead
+		r, w = os.pipe()
+		try:
+			dev = NativeUInput.__new__(NativeUInput)
+			dev._fd = w
+			dev._allocate(2)
+			events = [ (EV_KEY, Keys.KEY_A, 1), (EV_REL, Rels.REL_WHEEL, -1),
+				(EV_SYN, SYN_REPORT, 0) ]
+			dev.write(events)
+			data = os.read(r, 4096)
+			self.assertEqual(len(data), 3 * INPUT_EVENT.size)
+			self.assertEqual([ INPUT_EVENT.unpack_from(data, i * INPUT_EVENT.size)
+				for i in xrange(3) ], events)
+			dev.write(events[0:1])
+			self.assertEqual(INPUT_EVENT.unpack(os.read(r, 4096)), events[0])
+		finally:
+			os.close(r)
+			os.close(w)
+
+
+if __name__ == '__main__':
+	unittest.main()